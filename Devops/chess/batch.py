@@ -0,0 +1,343 @@
+"""
+Batch rendering for chess theory videos
+Renders a directory or manifest of theory files over a pool of warm workers
+"""
+
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Dict, Optional
+from parser import ChessTheoryParser
+from pipeline import DEFAULT_QUEUE_SIZE
+from transpositions import TranspositionCache
+from video_generator import ChessVideoGenerator
+
+# Render options accepted per job (same names as the main.py flags)
+RENDER_DEFAULTS = {
+    'fps': 30,
+    'duration': 2.0,
+    'size': 800,
+    'style': 'default',
+    'renderer': 'svg',
+    'encoder': 'auto',
+    'codec': 'libx264',
+    'preset': 'medium',
+    'crf': None,
+    'threads': 0,
+    'pix_fmt': 'yuv420p',
+    'intro_duration': 3.0,
+    'outro_duration': 2.0,
+    'pipeline_queue': DEFAULT_QUEUE_SIZE,
+    'draft': False,
+    'thumbnail': False
+}
+
+# Allowed values of the render options that take a fixed set (the main.py flag choices)
+RENDER_CHOICES = {
+    'fps': [24, 30, 60],
+    'size': [600, 800, 1024, 1280],
+    'style': ['default', 'wood', 'marble', 'blue', 'green'],
+    'renderer': ['svg', 'sprite'],
+    'encoder': ['auto', 'ffmpeg', 'opencv'],
+    'codec': ['libx264', 'libx265', 'libvpx-vp9']
+}
+
+INPUT_EXTENSIONS = ('.txt', '.pgn')
+
+
+def generator_options(options: dict) -> dict:
+    """Map render options to ChessVideoGenerator constructor arguments"""
+    return {
+        'size': options['size'],
+        'fps': options['fps'],
+        'style': options['style'],
+        'renderer_backend': options['renderer'],
+        'encoder': options['encoder'],
+        'encoder_options': {
+            'codec': options['codec'],
+            'preset': options['preset'],
+            'crf': options['crf'],
+            'threads': options['threads'],
+            'pix_fmt': options['pix_fmt']
+        },
+        'pipeline_queue': options['pipeline_queue'],
+        'draft': options['draft']
+    }
+
+
+def video_options(options: dict) -> dict:
+    """Map render options to ChessVideoGenerator.generate_video arguments"""
+    return {
+        'move_duration': options['duration'],
+        'intro_duration': options['intro_duration'],
+        'outro_duration': options['outro_duration']
+    }
+
+
+def load_jobs(source: str, output_dir: Optional[str] = None,
+              defaults: Optional[dict] = None) -> List[dict]:
+    """
+    Build the job list for a batch
+
+    Args:
+        source: Directory of theory files, a multi-game PGN file (one job per
+                game), or a JSON manifest: a list of
+                {"input": ..., "output": ..., "options": {...}} entries
+                (relative paths are resolved against the manifest's directory)
+        output_dir: Directory for outputs without an explicit path
+                    (default: next to each input)
+        defaults: Render options applied to every job before its own options
+
+    Returns:
+        List of job dicts with 'input', 'output' and complete 'options'
+    """
+    base_options = dict(RENDER_DEFAULTS)
+    base_options.update(defaults or {})
+
+    if source.lower().endswith('.pgn'):
+        return _load_pgn_jobs(source, output_dir, base_options)
+
+    if os.path.isdir(source):
+        entries = [
+            {'input': path}
+            for path in sorted(glob.glob(os.path.join(source, '*')))
+            if path.lower().endswith(INPUT_EXTENSIONS)
+        ]
+        base_dir = None
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        if not isinstance(entries, list):
+            raise ValueError(f"Manifest {source} must contain a JSON list of jobs")
+        base_dir = os.path.dirname(os.path.abspath(source))
+
+    jobs = []
+    for entry in entries:
+        if 'input' not in entry:
+            raise ValueError(f"Manifest entry without 'input': {entry}")
+
+        input_path = entry['input']
+        if base_dir and not os.path.isabs(input_path):
+            input_path = os.path.join(base_dir, input_path)
+
+        output_path = entry.get('output')
+        if output_path is None:
+            name = os.path.splitext(os.path.basename(input_path))[0] + '.mp4'
+            output_path = os.path.join(output_dir or os.path.dirname(input_path), name)
+        elif base_dir and not os.path.isabs(output_path):
+            output_path = os.path.join(base_dir, output_path)
+
+        unknown = set(entry.get('options', {})) - set(RENDER_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown options for {input_path}: {', '.join(sorted(unknown))}")
+
+        options = dict(base_options)
+        options.update(entry.get('options', {}))
+        jobs.append({'input': input_path, 'output': output_path, 'options': options})
+
+    return jobs
+
+
+def _load_pgn_jobs(source: str, output_dir: Optional[str], options: dict) -> List[dict]:
+    """One job per game of a PGN database, located by offset so workers never rescan the file"""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    jobs = []
+    for number, (offset, _) in enumerate(ChessTheoryParser().index_games(source), start=1):
+        name = f'{stem}_{number:04d}.mp4'
+        jobs.append({
+            'input': source,
+            'game_offset': offset,
+            'game_number': number,
+            'output': os.path.join(output_dir or os.path.dirname(source), name),
+            'options': dict(options)
+        })
+    return jobs
+
+
+# Generators kept alive across jobs in this process, keyed by constructor arguments,
+# least recently used first. Each holds its own render cache (up to 256 MB), so only
+# the few option sets a worker alternates between stay warm.
+MAX_GENERATORS = 4
+_GENERATORS = OrderedDict()
+
+# Boards and transitions shared with the other workers of the running batch
+_TRANSPOSITIONS = None
+
+
+def get_generator(options: dict) -> ChessVideoGenerator:
+    """Return a warm generator (renderer, caches, sprites) for these render options"""
+    config = generator_options(options)
+    key = json.dumps(config, sort_keys=True)
+    generator = _GENERATORS.get(key)
+    if generator is None:
+        generator = ChessVideoGenerator(**config, transpositions=_TRANSPOSITIONS)
+        _GENERATORS[key] = generator
+        while len(_GENERATORS) > MAX_GENERATORS:
+            _GENERATORS.popitem(last=False)
+    else:
+        _GENERATORS.move_to_end(key)
+    return generator
+
+
+def use_transpositions(directory: Optional[str]):
+    """
+    Share rendered boards and transitions through a TranspositionCache in directory
+
+    Also the process pool initializer of batch workers. Generators built for
+    another cache (or none) are dropped, so get_generator() rebuilds them.
+
+    Args:
+        directory: Cache directory, or None to stop sharing
+    """
+    global _TRANSPOSITIONS
+    current = _TRANSPOSITIONS.directory if _TRANSPOSITIONS is not None else None
+    if directory != current:
+        _TRANSPOSITIONS = TranspositionCache(directory) if directory else None
+        _GENERATORS.clear()
+
+
+def run_job(job: dict, progress: Optional[Callable[[int, int], None]] = None) -> dict:
+    """
+    Render a single batch job
+
+    Args:
+        job: Job dict from load_jobs(), or one with the theory itself in
+             'text' instead of an 'input' file
+        progress: Called as progress(frames_done, total_frames) while rendering
+
+    Returns:
+        Result dict with status, timing and output information
+    """
+    result = {'input': job.get('input'), 'output': job['output'], 'status': 'ok'}
+    start = time.time()
+
+    try:
+        if 'text' in job:
+            theory_data = ChessTheoryParser().parse_text(job['text'])
+        elif 'game_offset' in job:
+            theory_data = ChessTheoryParser().parse_game_at(job['input'], job['game_offset'])
+            result['game'] = job['game_number']
+        else:
+            theory_data = ChessTheoryParser().parse_file(job['input'])
+        if theory_data['move_count'] == 0:
+            raise ValueError("No valid moves found in input file")
+
+        output_dir = os.path.dirname(job['output'])
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        generator = get_generator(job['options'])
+        shared = generator.renderer.transpositions
+        before = shared.stats() if shared is not None else None
+        timeline = generator.generate_video(theory_data, job['output'], progress=progress,
+                                            **video_options(job['options']))
+
+        if job['options'].get('thumbnail'):
+            generator.create_thumbnail(theory_data, os.path.splitext(job['output'])[0] + '_thumbnail.png')
+
+        result['moves'] = theory_data['move_count']
+        result['frames'] = timeline['frames']
+        if shared is not None:
+            result['transpositions'] = {key: value - before[key] for key, value in shared.stats().items()}
+        result['bytes'] = os.path.getsize(job['output'])
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = str(e)
+
+    result['seconds'] = round(time.time() - start, 3)
+    return result
+
+
+def transposition_summary(results: List[dict]) -> dict:
+    """
+    Sum the jobs' transposition cache counters and the share of rasterizations saved
+
+    A board counts as saved whether it came from the shared cache (hits) or
+    from the worker's own render cache (reused); only misses were rasterized.
+    """
+    totals = {}
+    for result in results:
+        for key, value in result.get('transpositions', {}).items():
+            totals[key] = totals.get(key, 0) + value
+
+    for kind in TranspositionCache.KINDS:
+        totals[f'{kind}_saved'] = totals.get(f'{kind}_hits', 0) + totals.get(f'{kind}_reused', 0)
+    saved = sum(totals[f'{kind}_saved'] for kind in TranspositionCache.KINDS)
+    lookups = saved + sum(totals.get(f'{kind}_misses', 0) for kind in TranspositionCache.KINDS)
+    totals['dedup_ratio'] = round(saved / lookups, 4) if lookups else 0.0
+    return totals
+
+
+def run_batch(jobs: List[dict], workers: int = 1,
+              report_path: Optional[str] = None,
+              share_frames: bool = True,
+              transposition_dir: Optional[str] = None) -> dict:
+    """
+    Render all jobs and write a summary report
+
+    Args:
+        jobs: Jobs from load_jobs()
+        workers: Number of worker processes (1 renders in this process)
+        report_path: Optional JSON file for the summary report
+        share_frames: Share rendered boards and move transitions between all jobs
+                      through a TranspositionCache (shared openings render once)
+        transposition_dir: Keep that cache in this directory so later batches reuse it
+                           (default: a temporary directory removed after the batch)
+
+    Returns:
+        Summary dict with per-job results
+    """
+    start = time.time()
+    results = []
+
+    temp_dir = None
+    if share_frames and transposition_dir is None:
+        temp_dir = transposition_dir = tempfile.mkdtemp(prefix='chess_transpositions_')
+    if not share_frames:
+        transposition_dir = None
+
+    def record(result):
+        results.append(result)
+        mark = '✓' if result['status'] == 'ok' else '✗'
+        detail = f"{result['seconds']:.1f}s" if result['status'] == 'ok' else result['error']
+        print(f"{mark} [{len(results)}/{len(jobs)}] {result['input']} -> {result['output']} ({detail})")
+
+    try:
+        if workers > 1:
+            # Workers live for the whole batch, so each keeps its generators warm between jobs
+            with ProcessPoolExecutor(max_workers=workers, initializer=use_transpositions,
+                                     initargs=(transposition_dir,)) as pool:
+                for result in pool.map(run_job, jobs):
+                    record(result)
+        else:
+            use_transpositions(transposition_dir)
+            try:
+                for job in jobs:
+                    record(run_job(job))
+            finally:
+                use_transpositions(None)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    summary = {
+        'total': len(results),
+        'succeeded': sum(1 for r in results if r['status'] == 'ok'),
+        'failed': sum(1 for r in results if r['status'] != 'ok'),
+        'workers': workers,
+        'seconds': round(time.time() - start, 3),
+        'jobs': results
+    }
+    if transposition_dir:
+        summary['transpositions'] = transposition_summary(results)
+
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+    return summary
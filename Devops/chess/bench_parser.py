@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Parser micro-benchmarks on deterministic synthetic corpora
+Reports plies/sec and peak memory per parse path and compares against a stored baseline
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import chess
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+from lexer import tokenize, STRUCTURED, PGN, ANNOTATED, SIMPLE
+from parser import ChessTheoryParser
+
+# Corpus sizes in plies; the largest one is opt-in because generating it takes minutes
+DEFAULT_SIZES = [12, 1_000, 10_000, 100_000]
+ALL_SIZES = DEFAULT_SIZES + [1_000_000]
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser_baseline.json')
+
+# Plies played freely before the generator restricts itself to quiet piece moves
+OPENING_PLIES = 40
+
+# Fixed python-chess workload timed before every case; speeds are compared
+# relative to it, so the baseline holds on other machines and under load
+CALIBRATION_PLIES = 200
+CALIBRATION_RUNS = 20
+
+# Smaller cases vary by up to 2x between runs on a shared machine; they are only reported
+GATE_MIN_PLIES = 10_000
+
+# Allowed slowdown relative to calibration (run-to-run noise reaches ~40% on busy
+# machines) and allowed peak memory growth (tracemalloc peaks are deterministic)
+SPEED_TOLERANCE = 0.5
+MEMORY_TOLERANCE = 0.25
+
+
+def generate_plies(count: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Generate a deterministic legal game of any length
+
+    After a random opening only non-capturing piece moves are played, so the
+    material never runs out and the game can go on for millions of plies.
+    Moves that would checkmate or stalemate are avoided.
+
+    Args:
+        count: Number of plies
+        seed: Random seed
+
+    Returns:
+        List of (san, uci) pairs
+    """
+    rng = random.Random(seed)
+    board = chess.Board()
+    plies = []
+
+    while len(plies) < count:
+        moves = list(board.legal_moves)
+        if len(plies) >= OPENING_PLIES:
+            quiet = [
+                move for move in moves
+                if not board.is_capture(move) and board.piece_type_at(move.from_square) != chess.PAWN
+            ]
+            moves = quiet or moves
+
+        rng.shuffle(moves)
+        for move in moves:
+            board.push(move)
+            game_over = not any(board.generate_legal_moves())
+            board.pop()
+            if not game_over:
+                break
+        else:
+            raise RuntimeError(f"Synthetic game ran out of moves after {len(plies)} plies")
+
+        plies.append((board.san(move), move.uci()))
+        board.push(move)
+
+    return plies
+
+
+def _wrap(words: List[str], per_line: int) -> List[str]:
+    """Join words into lines of per_line words"""
+    return [' '.join(words[i:i + per_line]) for i in range(0, len(words), per_line)]
+
+
+def _numbered(plies: List[Tuple[str, str]]) -> List[List[str]]:
+    """SAN movetext words per ply, with move numbers before White's moves"""
+    return [
+        [f'{index // 2 + 1}.', san] if index % 2 == 0 else [san]
+        for index, (san, _) in enumerate(plies)
+    ]
+
+
+def structured_corpus(plies: List[Tuple[str, str]]) -> str:
+    """TITLE/DESCRIPTION/MOVES/TEXT/TIMING input, one TEXT per 20 plies"""
+    lines = [
+        'TITLE: Synthetic Benchmark Game',
+        'DESCRIPTION: Deterministic corpus for parser benchmarks',
+        'DISPLAY: Structured format',
+        ''
+    ]
+    for start in range(0, len(plies), 20):
+        chunk = [san for san, _ in plies[start:start + 20]]
+        lines.append('MOVES:')
+        lines.extend(_wrap(chunk, 2))
+        lines.append(f'TEXT: Position after ply {start + len(chunk)}')
+        lines.append(f'TIMING: {start + 1} 3')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def pgn_corpus(plies: List[Tuple[str, str]]) -> str:
+    """PGN with headers, a comment every 4th ply and a NAG every 7th"""
+    words = []
+    for index, ply_words in enumerate(_numbered(plies)):
+        words.extend(ply_words)
+        if index % 7 == 6:
+            words.append('$1')
+        if index % 4 == 3:
+            words.append(f'{{Comment on ply {index + 1}}}')
+    words.append('*')
+
+    headers = [
+        '[Event "Synthetic Benchmark Game"]',
+        '[Site "?"]',
+        '[Opening "Benchmark Opening"]',
+        ''
+    ]
+    return '\n'.join(headers + _wrap(words, 12))
+
+
+def annotated_corpus(plies: List[Tuple[str, str]]) -> str:
+    """'N. move - annotation' lines, one ply per line"""
+    lines = ['Opening: Synthetic Benchmark Game', '']
+    lines.extend(f'{index + 1}. {san} - Annotation for ply {index + 1}'
+                 for index, (san, _) in enumerate(plies))
+    return '\n'.join(lines)
+
+
+def san_corpus(plies: List[Tuple[str, str]]) -> str:
+    """Bare numbered SAN under a title line"""
+    words = [word for ply_words in _numbered(plies) for word in ply_words]
+    return '\n'.join(['Synthetic Benchmark Game'] + _wrap(words, 12))
+
+
+def uci_corpus(plies: List[Tuple[str, str]]) -> str:
+    """Bare UCI moves under a title line"""
+    return '\n'.join(['Synthetic Benchmark Game'] + _wrap([uci for _, uci in plies], 10))
+
+
+# Benchmark name -> (corpus builder, format the lexer must detect, parse path it exercises)
+CORPORA = {
+    'structured': (structured_corpus, STRUCTURED, '_parse_structured_format'),
+    'pgn': (pgn_corpus, PGN, '_parse_pgn_with_comments'),
+    'annotated': (annotated_corpus, ANNOTATED, '_parse_annotated_format'),
+    'san': (san_corpus, SIMPLE, '_parse_simple_pgn'),
+    'uci': (uci_corpus, SIMPLE, '_parse_simple_pgn')
+}
+
+
+@contextmanager
+def _timed_run():
+    """Run with the cyclic garbage collector paused, as timeit does, so its pauses are not timed"""
+    gc.collect()
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.enable()
+
+
+def calibrate(plies: List[Tuple[str, str]], runs: int = CALIBRATION_RUNS) -> float:
+    """Return the best plies/sec (CPU time) of replaying SAN moves on a board: this machine's speed"""
+    best = float('inf')
+    for _ in range(runs):
+        board = chess.Board()
+        with _timed_run():
+            start = time.process_time()
+            for san, _ in plies:
+                board.push_san(san)
+            best = min(best, time.process_time() - start)
+    return len(plies) / best
+
+
+def measure(name: str, text: str, plies: int, repeat: int = 3,
+            calibration: Optional[float] = None) -> dict:
+    """
+    Benchmark parse_text on one corpus
+
+    Throughput is the best of repeat untraced runs, timed in CPU time so
+    other processes competing for the CPU do not count against the parser;
+    peak memory comes from a separate run under tracemalloc (which slows
+    allocation down).
+
+    Args:
+        name: Corpus name from CORPORA
+        text: Corpus text
+        plies: Number of plies the corpus contains
+        repeat: Number of timed runs
+        calibration: calibrate() result measured just before, stored with
+                     the speed relative to it
+
+    Returns:
+        Result dict for the report
+    """
+    _, expected_format, path = CORPORA[name]
+    detected = tokenize(text).format
+    if detected != expected_format:
+        raise RuntimeError(f"{name} corpus detected as {detected}, expected {expected_format}")
+
+    parser = ChessTheoryParser()
+    best = float('inf')
+    for _ in range(repeat):
+        with _timed_run():
+            start = time.process_time()
+            result = parser.parse_text(text)
+            best = min(best, time.process_time() - start)
+
+        if result['move_count'] != plies or result['rejected']:
+            raise RuntimeError(f"{name} corpus parsed {result['move_count']}/{plies} plies "
+                               f"with {len(result['rejected'])} rejected tokens")
+        del result
+
+    parser = ChessTheoryParser()
+    tracemalloc.start()
+    try:
+        parser.parse_text(text)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = {
+        'corpus': name,
+        'path': path,
+        'plies': plies,
+        'input_bytes': len(text.encode('utf-8')),
+        'seconds': round(best, 6),
+        'plies_per_sec': round(plies / best, 1),
+        'peak_bytes': peak
+    }
+    if calibration:
+        result['calibration_plies_per_sec'] = round(calibration, 1)
+        result['relative_speed'] = round(plies / best / calibration, 4)
+    return result
+
+
+def _runs(size: int, repeat: int) -> int:
+    """Timed runs for a case: small corpora run more often to smooth out noise"""
+    if size > 100_000:
+        return 1
+    return max(repeat, min(1000, 10_000 // size))
+
+
+def run_benchmarks(sizes: List[int], corpora: List[str], repeat: int = 3,
+                   seed: int = 0) -> dict:
+    """
+    Run every corpus at every size
+
+    One game of the largest size is generated and its prefixes are used for
+    the smaller sizes.
+
+    Args:
+        sizes: Corpus sizes in plies
+        corpora: Corpus names from CORPORA
+        repeat: Minimum timed runs per case (cases over 100k plies run once)
+        seed: Seed for the synthetic game
+
+    Returns:
+        Report dict with environment info and per-case results
+    """
+    print(f"Generating synthetic game of {max(sizes):,} plies...")
+    game = generate_plies(max(max(sizes), CALIBRATION_PLIES), seed)
+    calibration_plies = game[:CALIBRATION_PLIES]
+    calibrate(calibration_plies)  # Warm-up: the first calibration reads low
+
+    results = []
+    for size in sorted(sizes):
+        for name in corpora:
+            text = CORPORA[name][0](game[:size])
+            result = measure(name, text, size, _runs(size, repeat), calibrate(calibration_plies))
+            results.append(result)
+            print(f"  {name:<11} {size:>9,} plies  {result['plies_per_sec']:>12,.0f} plies/s  "
+                  f"({result['relative_speed']:.3f}x calibration)  "
+                  f"peak {result['peak_bytes'] / 1024 / 1024:>8.2f} MB")
+
+    return {
+        'python': platform.python_version(),
+        'chess': chess.__version__,
+        'machine': platform.machine(),
+        'seed': seed,
+        'results': results
+    }
+
+
+def compare_results(report: dict, baseline: dict, tolerance: float = SPEED_TOLERANCE,
+                    memory_tolerance: float = MEMORY_TOLERANCE) -> List[str]:
+    """
+    Compare a report against a baseline report
+
+    Speed is compared relative to each case's calibration when both reports
+    have one (absolute plies/sec otherwise), and only for cases of at least
+    GATE_MIN_PLIES. Peak memory is deterministic and checked for every case.
+
+    Args:
+        report: Report from run_benchmarks()
+        baseline: Previously saved report
+        tolerance: Allowed relative slowdown
+        memory_tolerance: Allowed relative peak memory growth
+
+    Returns:
+        One message per regression (empty when there are none)
+    """
+    reference = {(r['corpus'], r['plies']): r for r in baseline.get('results', [])}
+    regressions = []
+
+    for result in report['results']:
+        base = reference.get((result['corpus'], result['plies']))
+        if base is None:
+            continue
+
+        case = f"{result['corpus']} @ {result['plies']:,} plies"
+        if result['plies'] < GATE_MIN_PLIES:
+            pass
+        elif 'relative_speed' in result and 'relative_speed' in base:
+            if result['relative_speed'] < base['relative_speed'] * (1 - tolerance):
+                regressions.append(
+                    f"{case}: {result['relative_speed']:.3f}x calibration "
+                    f"vs baseline {base['relative_speed']:.3f}x"
+                )
+        elif result['plies_per_sec'] < base['plies_per_sec'] * (1 - tolerance):
+            regressions.append(
+                f"{case}: {result['plies_per_sec']:,.0f} plies/s "
+                f"vs baseline {base['plies_per_sec']:,.0f}"
+            )
+        if result['peak_bytes'] > base['peak_bytes'] * (1 + memory_tolerance):
+            regressions.append(
+                f"{case}: peak {result['peak_bytes']:,} bytes "
+                f"vs baseline {base['peak_bytes']:,}"
+            )
+
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark the chess theory parser on synthetic corpora'
+    )
+    parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=DEFAULT_SIZES,
+        help=f'Corpus sizes in plies (default: {DEFAULT_SIZES}; --full adds 1,000,000)'
+    )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help=f'Run all sizes: {ALL_SIZES}'
+    )
+    parser.add_argument(
+        '--corpus',
+        nargs='+',
+        choices=list(CORPORA),
+        default=list(CORPORA),
+        help='Corpora to run (default: all)'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Timed runs per case; the best is reported (default: 3)'
+    )
+    parser.add_argument(
+        '--baseline',
+        default=BASELINE_PATH,
+        help='Baseline report to compare against (default: parser_baseline.json)'
+    )
+    parser.add_argument(
+        '--save-baseline',
+        action='store_true',
+        help='Write this run as the new baseline instead of comparing'
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=SPEED_TOLERANCE,
+        help='Allowed slowdown relative to the calibration loop, checked from '
+             f'{GATE_MIN_PLIES:,} plies up (default: {SPEED_TOLERANCE})'
+    )
+    parser.add_argument(
+        '--memory-tolerance',
+        type=float,
+        default=MEMORY_TOLERANCE,
+        help=f'Allowed peak memory growth (default: {MEMORY_TOLERANCE})'
+    )
+    parser.add_argument(
+        '--output',
+        help='Also write this run\'s report to a JSON file'
+    )
+
+    args = parser.parse_args(argv)
+    sizes = ALL_SIZES if args.full else args.sizes
+
+    report = run_benchmarks(sizes, args.corpus, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline} (run with --save-baseline to create one)")
+        return
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regressions = compare_results(report, baseline, args.tolerance, args.memory_tolerance)
+    if regressions:
+        print(f"✗ {len(regressions)} regression(s) against {args.baseline}:")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+
+    print(f"✓ No regressions against {args.baseline} (speed tolerance {args.tolerance:.0%}, "
+          f"memory tolerance {args.memory_tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,438 @@ Creates high-quality chess board images
 
 import chess
 import chess.svg
-from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+from PIL import Image, ImageDraw
 import io
+import weakref
 import cairosvg
-from typing import Optional, Tuple
+from text_layout import fonts, layout_text
+from profiling import profiler
+from transpositions import TranspositionCache
+from collections import OrderedDict
+from typing import Optional, Tuple, Hashable, Dict, List
+
+# Geometry of chess.svg.board() with coordinates enabled (viewBox units)
+SVG_SQUARE_SIZE = chess.svg.SQUARE_SIZE
+SVG_MARGIN = 15
+SVG_FULL_SIZE = 2 * SVG_MARGIN + 8 * SVG_SQUARE_SIZE
+
+HIGHLIGHT_COLOR = '#FFFF0050'
+ARROW_COLOR = '#15781B80'
+
+# Channel orders the renderer can draw in ('bgr' is what the video encoders take)
+PIXEL_FORMATS = ['rgb', 'bgr']
+
+
+def _parse_color(color: str) -> Tuple[Tuple[int, int, int], float]:
+    """Parse '#RRGGBB' or '#RRGGBBAA' into an RGB tuple and an opacity"""
+    color = color.lstrip('#')
+    rgb = tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+    opacity = int(color[6:8], 16) / 255 if len(color) == 8 else 1.0
+    return rgb, opacity
+
+
+def _svg_to_rgba(svg_data: str, width: int, height: int) -> np.ndarray:
+    """Rasterize an SVG string to an RGBA array"""
+    png_data = cairosvg.svg2png(
+        bytestring=svg_data.encode('utf-8'),
+        output_width=width,
+        output_height=height
+    )
+    return np.asarray(Image.open(io.BytesIO(png_data)).convert('RGBA'))
+
+
+class RenderCache:
+    """Bounded LRU cache of decoded board images, limited by total byte size"""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Initialize the cache
+
+        Args:
+            max_bytes: Upper bound on the memory held by cached arrays
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """Return the cached array for key (marking it recently used) or None"""
+        array = self._entries.get(key)
+        if array is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return array
+
+    def put(self, key: Hashable, array: np.ndarray):
+        """Store an array, evicting least recently used entries to stay in budget"""
+        if array.nbytes > self.max_bytes:
+            return
+
+        # Cached arrays are shared between callers, so never hand out writable views
+        array.flags.writeable = False
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= old.nbytes
+
+        self._entries[key] = array
+        self.current_bytes += array.nbytes
+
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """Drop all entries (statistics are kept)"""
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> dict:
+        """Return hit-rate and memory statistics"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes
+        }
+
+
+class SpriteBoardCompositor:
+    """
+    Composite board positions from pre-rasterized sprites
+
+    The empty board (squares, margin and coordinates) and the 12 piece glyphs
+    are rasterized once through cairosvg; positions are then built by
+    alpha-blending piece sprites into a NumPy array, matching the layout of
+    chess.svg.board().
+    """
+
+    def __init__(self, size: int, colors: Dict[str, str], pixel_format: str = 'rgb'):
+        """
+        Initialize the compositor
+
+        Args:
+            size: Size of the board in pixels
+            colors: Square colors with 'light' and 'dark' keys
+            pixel_format: Channel order of the sprites and composited boards ('rgb' or 'bgr')
+        """
+        self.size = size
+        # Sprites and colors are stored in the output channel order, so blending needs no conversion
+        self.channels = slice(2, None, -1) if pixel_format == 'bgr' else slice(0, 3)
+        scale = size / SVG_FULL_SIZE
+
+        # Pixel edges of the 8 files/ranks; squares may differ by a pixel due to rounding
+        self.edges = [round((SVG_MARGIN + i * SVG_SQUARE_SIZE) * scale) for i in range(9)]
+        self.square_px = max(b - a for a, b in zip(self.edges, self.edges[1:]))
+        self.scale = scale
+
+        background_svg = chess.svg.board(
+            chess.BaseBoard.empty(),
+            size=size,
+            colors={
+                'square light': colors['light'],
+                'square dark': colors['dark']
+            }
+        )
+        self.background = np.ascontiguousarray(_svg_to_rgba(background_svg, size, size)[:, :, self.channels])
+        self.background.flags.writeable = False
+
+        # Premultiplied color (with +0.5 so the uint8 store rounds) and inverse alpha per piece
+        self.sprites = {}
+        for color in chess.COLORS:
+            for piece_type in chess.PIECE_TYPES:
+                piece = chess.Piece(piece_type, color)
+                rgba = _svg_to_rgba(chess.svg.piece(piece, size=self.square_px),
+                                    self.square_px, self.square_px).astype(np.float32)
+                alpha = rgba[:, :, 3:4] / 255.0
+                self.sprites[piece.symbol()] = (rgba[:, :, self.channels] * alpha + 0.5, 1.0 - alpha)
+
+    def color(self, color: str) -> Tuple[np.ndarray, float]:
+        """Parse a '#RRGGBB[AA]' color into a float pixel in the output channel order and an opacity"""
+        rgb, opacity = _parse_color(color)
+        return np.array(rgb, dtype=np.float32)[self.channels], opacity
+
+    def square_box(self, square: chess.Square) -> Tuple[int, int, int, int]:
+        """Return the (x0, y0, x1, y1) pixel box of a square (white at the bottom)"""
+        file_index = chess.square_file(square)
+        row = 7 - chess.square_rank(square)
+        return self.edges[file_index], self.edges[row], self.edges[file_index + 1], self.edges[row + 1]
+
+    def blit_piece(self, out: np.ndarray, symbol: str, x: int, y: int, opacity: float = 1.0):
+        """Alpha-blend a piece sprite into out with its top-left corner at (x, y)"""
+        premultiplied, inverse_alpha = self.sprites[symbol]
+        if opacity < 1.0:
+            premultiplied = (premultiplied - 0.5) * opacity + 0.5
+            inverse_alpha = 1.0 - (1.0 - inverse_alpha) * opacity
+        h, w = premultiplied.shape[:2]
+
+        # Clip to the destination bounds
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, out.shape[1]), min(y + h, out.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        sx, sy = x0 - x, y0 - y
+        region = out[y0:y1, x0:x1]
+        blended = region * inverse_alpha[sy:sy + y1 - y0, sx:sx + x1 - x0]
+        blended += premultiplied[sy:sy + y1 - y0, sx:sx + x1 - x0]
+        region[...] = blended
+
+    def compose(self, board: chess.BaseBoard,
+                highlight_squares: Optional[list] = None,
+                last_move: Optional[chess.Move] = None) -> np.ndarray:
+        """Composite a position into a newly allocated array"""
+        out = np.empty_like(self.background)
+        self.compose_into(out, board, highlight_squares, last_move)
+        return out
+
+    def compose_into(self, out: np.ndarray, board: chess.BaseBoard,
+                     highlight_squares: Optional[list] = None,
+                     last_move: Optional[chess.Move] = None) -> np.ndarray:
+        """
+        Composite a position into a preallocated array
+
+        Args:
+            out: Destination array of shape (size, size, 3)
+            board: Position to draw
+            highlight_squares: Squares to tint with the highlight color
+            last_move: Move to draw as an arrow
+
+        Returns:
+            The destination array
+        """
+        np.copyto(out, self.background)
+
+        if highlight_squares:
+            pixel, opacity = self.color(HIGHLIGHT_COLOR)
+            tint = pixel * opacity + 0.5
+            for square in highlight_squares:
+                x0, y0, x1, y1 = self.square_box(square)
+                region = out[y0:y1, x0:x1]
+                region[...] = region * (1.0 - opacity) + tint
+
+        for square, piece in board.piece_map().items():
+            x0, y0, _, _ = self.square_box(square)
+            self.blit_piece(out, piece.symbol(), x0, y0)
+
+        if last_move and last_move.from_square != last_move.to_square:
+            self._draw_arrow(out, last_move.from_square, last_move.to_square)
+
+        return out
+
+    def _draw_arrow(self, out: np.ndarray, tail: chess.Square, head: chess.Square):
+        """Blend an arrow using the same geometry as chess.svg.board()"""
+        def center(square):
+            x = SVG_MARGIN + (chess.square_file(square) + 0.5) * SVG_SQUARE_SIZE
+            y = SVG_MARGIN + (7.5 - chess.square_rank(square)) * SVG_SQUARE_SIZE
+            return x * self.scale, y * self.scale
+
+        xtail, ytail = center(tail)
+        xhead, yhead = center(head)
+        marker_size = 0.75 * SVG_SQUARE_SIZE * self.scale
+        marker_margin = 0.1 * SVG_SQUARE_SIZE * self.scale
+
+        dx, dy = xhead - xtail, yhead - ytail
+        hypot = (dx * dx + dy * dy) ** 0.5
+        shaft_x = xhead - dx * (marker_size + marker_margin) / hypot
+        shaft_y = yhead - dy * (marker_size + marker_margin) / hypot
+        xtip = xhead - dx * marker_margin / hypot
+        ytip = yhead - dy * marker_margin / hypot
+
+        mask = Image.new('L', (self.size, self.size), 0)
+        draw = ImageDraw.Draw(mask)
+        draw.line([(xtail, ytail), (shaft_x, shaft_y)], fill=255,
+                  width=max(1, round(0.2 * SVG_SQUARE_SIZE * self.scale)))
+        draw.polygon([
+            (xtip, ytip),
+            (shaft_x + dy * 0.5 * marker_size / hypot, shaft_y - dx * 0.5 * marker_size / hypot),
+            (shaft_x - dy * 0.5 * marker_size / hypot, shaft_y + dx * 0.5 * marker_size / hypot)
+        ], fill=255)
+
+        bbox = mask.getbbox()
+        if bbox is None:
+            return
+        x0, y0, x1, y1 = bbox
+        pixel, opacity = self.color(ARROW_COLOR)
+        alpha = np.asarray(mask.crop(bbox), dtype=np.float32)[:, :, None] * (opacity / 255.0)
+        region = out[y0:y1, x0:x1]
+        region[...] = region * (1.0 - alpha) + pixel * alpha + 0.5
+
+
+# One compositor per (size, colors, pixel format) per process; building one rasterizes 13 SVGs
+_COMPOSITORS = {}
+
+
+def get_compositor(size: int, colors: Dict[str, str], pixel_format: str = 'rgb') -> SpriteBoardCompositor:
+    """Return the shared sprite compositor for a board size, color scheme and channel order"""
+    key = (size, colors['light'], colors['dark'], pixel_format)
+    compositor = _COMPOSITORS.get(key)
+    if compositor is None:
+        compositor = SpriteBoardCompositor(size, colors, pixel_format)
+        _COMPOSITORS[key] = compositor
+    return compositor
+
+
+class FrameComposer:
+    """
+    Stack a board layer and an annotation band into a preallocated frame
+
+    Frames go into the composer's own buffer or into a caller's buffer (such
+    as a free buffer of the encoder pipeline). Read-only inputs (cached layers)
+    are only copied when they differ from the array last copied into that
+    buffer, so a frame where only the board or only the band changed rewrites
+    just that part. Writable inputs, such as reused animation buffers, are
+    always copied.
+    """
+
+    def __init__(self, size: int, band_height: int):
+        """
+        Initialize the composer
+
+        Args:
+            size: Board size (frame width) in pixels
+            band_height: Height of the annotation band below the board
+        """
+        self.size = size
+        self.buffer = np.empty((size + band_height, size, 3), dtype=np.uint8)
+        # id(buffer) -> (weak reference to it, board layer, band layer last placed there)
+        self._placed = {}
+        self.layer_copies = 0
+        self.layer_reuses = 0
+
+    def _place(self, region: np.ndarray, layer: Optional[np.ndarray], last: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if layer is None:
+            return None  # Drawn in place by the caller
+        if layer is last and not layer.flags.writeable:
+            self.layer_reuses += 1
+        else:
+            np.copyto(region, layer)
+            self.layer_copies += 1
+        return layer
+
+    def compose(self, board: Optional[np.ndarray], band: np.ndarray,
+                out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Write the layers into a frame buffer
+
+        Args:
+            board: Board array of shape (size, size, 3), or None when the
+                   board region of out has already been drawn in place
+            band: Annotation band of shape (band_height, size, 3)
+            out: Frame buffer to write into (default: the composer's own buffer)
+
+        Returns:
+            The frame buffer. The composer's own buffer is overwritten by the
+            next call, so treat it as read-only and copy it if it must outlive
+            that call
+        """
+        if out is None:
+            out = self.buffer
+
+        key = id(out)
+        entry = self._placed.get(key)
+        if entry is None:
+            # The entry goes away with the buffer, so a new buffer at the same address starts clean
+            entry = (weakref.ref(out, lambda _: self._placed.pop(key, None)), None, None)
+
+        with profiler.stage('compose', frames=1):
+            board = self._place(out[:self.size], board, entry[1])
+            band = self._place(out[self.size:], band, entry[2])
+        self._placed[id(out)] = (entry[0], board, band)
+        return out
+
+
+class MoveAnimation:
+    """
+    Frames of a piece sliding from its origin to its destination
+
+    The board without the moving piece(s) is rendered once; each frame then
+    blends the piece sprite at an eased, interpolated position. Castling
+    moves king and rook together, a captured piece fades out as the mover
+    arrives, and a promoting pawn slides as a pawn (the hold frame shows
+    the promoted piece).
+    """
+
+    def __init__(self, renderer: 'ChessBoardRenderer', board: chess.Board, move: chess.Move):
+        """
+        Prepare the animation
+
+        Args:
+            renderer: Renderer whose style, size and channel order are used
+            board: Position before the move
+            move: Move to animate
+        """
+        self.compositor = get_compositor(renderer.size, renderer.colors, renderer.pixel_format)
+        background_board = board.copy(stack=False)
+
+        # (symbol, from_square, to_square) of every piece that moves
+        self.movers = []
+        destination = move.to_square
+        if board.is_castling(move):
+            # Castling is encoded as a king move (to the rook's square in Chess960)
+            rank = chess.square_rank(move.from_square)
+            if board.is_kingside_castling(move):
+                rook_from, rook_to, destination = chess.square(7, rank), chess.square(5, rank), chess.square(6, rank)
+            else:
+                rook_from, rook_to, destination = chess.square(0, rank), chess.square(3, rank), chess.square(2, rank)
+            self.movers.append((board.piece_at(rook_from).symbol(), rook_from, rook_to))
+        self.movers.insert(0, (board.piece_at(move.from_square).symbol(), move.from_square, destination))
+
+        self.captured = None
+        if board.is_capture(move) and not board.is_castling(move):
+            captured_square = move.to_square
+            if board.is_en_passant(move):
+                captured_square = chess.square(chess.square_file(move.to_square),
+                                               chess.square_rank(move.from_square))
+            self.captured = (board.piece_at(captured_square).symbol(), captured_square)
+            background_board.remove_piece_at(captured_square)
+
+        for _, from_square, _ in self.movers:
+            background_board.remove_piece_at(from_square)
+
+        self.background = renderer.render_transition_background(board, move, background_board)
+
+    def draw(self, out: np.ndarray, t: float) -> np.ndarray:
+        """
+        Draw the board at time t of the animation
+
+        Args:
+            out: Destination array of shape (size, size, 3), e.g. the board
+                 region of a frame buffer
+            t: Progress from 0 (before the move) to 1 (piece arrived)
+
+        Returns:
+            The destination array
+        """
+        compositor = self.compositor
+        eased = (1 - np.cos(np.pi * t)) / 2
+
+        with profiler.stage('animate', frames=1):
+            np.copyto(out, self.background)
+
+            if self.captured:
+                x, y, _, _ = compositor.square_box(self.captured[1])
+                compositor.blit_piece(out, self.captured[0], x, y, opacity=1.0 - eased)
+
+            for symbol, from_square, to_square in self.movers:
+                x0, y0, _, _ = compositor.square_box(from_square)
+                x1, y1, _, _ = compositor.square_box(to_square)
+                compositor.blit_piece(out, symbol,
+                                      round(x0 + (x1 - x0) * eased),
+                                      round(y0 + (y1 - y0) * eased))
+        return out
 
 
 class ChessBoardRenderer:
@@ -37,17 +465,46 @@ class ChessBoardRenderer:
         }
     }
 
-    def __init__(self, size: int = 800, style: str = 'default'):
+    BACKENDS = ['svg', 'sprite']
+
+    ANNOTATION_HEIGHT = 100
+
+    def __init__(self, size: int = 800, style: str = 'default',
+                 cache_max_bytes: int = 256 * 1024 * 1024,
+                 cache: Optional[RenderCache] = None,
+                 backend: str = 'svg', pixel_format: str = 'rgb',
+                 transpositions: Optional[TranspositionCache] = None):
         """
         Initialize the renderer
 
         Args:
             size: Size of the board in pixels
             style: Board color style
+            cache_max_bytes: Memory budget of the board image cache (0 disables it)
+            cache: Existing cache to share between renderers (overrides cache_max_bytes)
+            backend: 'svg' rasterizes every position through cairosvg,
+                     'sprite' composites pre-rasterized piece sprites with NumPy
+            pixel_format: Channel order of rendered arrays; 'bgr' produces frames the
+                          video encoders take as is (PIL images are always RGB)
+            transpositions: Cache shared with other processes (e.g. a batch's workers);
+                            boards and move transitions are looked up there by position
+                            before they are rendered
         """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown renderer backend '{backend}' (expected one of {self.BACKENDS})")
+        if pixel_format not in PIXEL_FORMATS:
+            raise ValueError(f"Unknown pixel format '{pixel_format}' (expected one of {PIXEL_FORMATS})")
+
         self.size = size
         self.style = style
+        self.backend = backend
+        self.pixel_format = pixel_format
         self.colors = self.BOARD_STYLES.get(style, self.BOARD_STYLES['default'])
+        if cache is None and cache_max_bytes > 0:
+            cache = RenderCache(max_bytes=cache_max_bytes)
+        self.cache = cache
+        self.transpositions = transpositions
+        self.composer = FrameComposer(size, self.ANNOTATION_HEIGHT)
 
     def render_board(self, board: chess.Board,
                     highlight_squares: Optional[list] = None,
@@ -63,37 +520,239 @@ class ChessBoardRenderer:
         Returns:
             PIL Image of the board
         """
+        return Image.fromarray(self.to_rgb(self.render_board_array(board, highlight_squares, last_move)))
+
+    def to_rgb(self, array: np.ndarray) -> np.ndarray:
+        """Return a rendered array in RGB channel order (a reversed view for 'bgr')"""
+        return array[:, :, ::-1] if self.pixel_format == 'bgr' else array
+
+    def _from_rgb(self, array: np.ndarray) -> np.ndarray:
+        """Bring a decoded RGB image into the renderer's channel order"""
+        if self.pixel_format == 'bgr':
+            return np.ascontiguousarray(array[:, :, ::-1])
+        return array
+
+    def render_board_array(self, board: chess.Board,
+                           highlight_squares: Optional[list] = None,
+                           last_move: Optional[chess.Move] = None) -> np.ndarray:
+        """
+        Render a chess board position as a read-only array, using the cache
+
+        Args:
+            board: Chess board object
+            highlight_squares: List of squares to highlight
+            last_move: Last move to highlight
+
+        Returns:
+            Array of shape (size, size, 3)
+        """
+        if self.cache is None:
+            return self._render_shared(board, highlight_squares, last_move)
+
+        # Only piece placement affects the image, so turn/castling rights are not part of the key
+        key = (
+            board.board_fen(),
+            frozenset(highlight_squares) if highlight_squares else frozenset(),
+            last_move.uci() if last_move else None,
+            self.style,
+            self.size,
+            self.backend,
+            self.pixel_format
+        )
+        array = self.cache.get(key)
+        if array is None:
+            array = self._render_shared(board, highlight_squares, last_move)
+            self.cache.put(key, array)
+        elif self.transpositions is not None:
+            self.transpositions.note_reuse('board')
+        return array
+
+    def _render_shared(self, board: chess.Board,
+                       highlight_squares: Optional[list] = None,
+                       last_move: Optional[chess.Move] = None) -> np.ndarray:
+        """Rasterize a position, through the transposition cache when there is one"""
+        if self.transpositions is None:
+            return self._rasterize(board, highlight_squares, last_move)
+
+        key = TranspositionCache.key(
+            'board', board,
+            sorted(highlight_squares) if highlight_squares else [],
+            last_move.uci() if last_move else None,
+            self.style, self.size, self.backend, self.pixel_format
+        )
+        array = self.transpositions.get(key)
+        if array is None:
+            array = self._rasterize(board, highlight_squares, last_move)
+            self.transpositions.put(key, array)
+        return array
+
+    def move_animation(self, board: chess.Board, move: chess.Move) -> MoveAnimation:
+        """Prepare the sliding-piece animation of move from board (see MoveAnimation)"""
+        return MoveAnimation(self, board, move)
+
+    def render_transition_background(self, board: chess.Board, move: chess.Move,
+                                     background_board: chess.Board) -> np.ndarray:
+        """
+        Render the board a move animation slides its pieces over, using the caches
+
+        This is the only rasterized image of a transition (the sliding pieces
+        are blended onto it per frame), so sharing it by position and move
+        through the transposition cache shares the transition's rendering.
+
+        Args:
+            board: Position before the move
+            move: Move being animated
+            background_board: board without the moving and captured pieces
+
+        Returns:
+            Read-only array of shape (size, size, 3)
+        """
+        key = ('transition', board.board_fen(), move.uci(), self.style, self.size,
+               self.backend, self.pixel_format)
+        array = self.cache.get(key) if self.cache is not None else None
+        if array is not None:
+            if self.transpositions is not None:
+                self.transpositions.note_reuse('transition')
+            return array
+
+        shared_key = None
+        if self.transpositions is not None:
+            shared_key = TranspositionCache.key('transition', board, move.uci(), self.style,
+                                                self.size, self.backend, self.pixel_format)
+            array = self.transpositions.get(shared_key)
+
+        if array is None:
+            array = self._rasterize(background_board)
+            if shared_key is not None:
+                self.transpositions.put(shared_key, array)
+        if self.cache is not None:
+            self.cache.put(key, array)
+        return array
+
+    def render_move_frames(self, board: chess.Board, move: chess.Move,
+                           num_frames: int):
+        """
+        Yield board frames of a piece sliding from its origin to its destination
+
+        Args:
+            board: Position before the move
+            move: Move to animate
+            num_frames: Number of frames to produce
+
+        Yields:
+            Arrays of shape (size, size, 3). The same buffer is reused for
+            every frame, so consume (or copy) each frame before the next.
+            Use move_animation() to draw straight into buffers of your own.
+        """
+        if num_frames <= 0:
+            return
+
+        animation = self.move_animation(board, move)
+        frame = np.empty_like(animation.background)
+        for index in range(num_frames):
+            yield animation.draw(frame, (index + 1) / num_frames)
+
+    def cache_stats(self) -> dict:
+        """Return render cache statistics (hit rate, entries, bytes)"""
+        if self.cache is None:
+            return {'entries': 0, 'hits': 0, 'misses': 0, 'evictions': 0,
+                    'hit_rate': 0.0, 'bytes': 0, 'max_bytes': 0}
+        return self.cache.stats()
+
+    def _rasterize(self, board: chess.Board,
+                   highlight_squares: Optional[list] = None,
+                   last_move: Optional[chess.Move] = None) -> np.ndarray:
+        """Rasterize a position to an array with the configured backend"""
+        if self.backend == 'sprite':
+            with profiler.stage('sprite_compose', frames=1):
+                compositor = get_compositor(self.size, self.colors, self.pixel_format)
+                return compositor.compose(board, highlight_squares, last_move)
+
         # Create SVG
         fill = {}
         if highlight_squares:
             for square in highlight_squares:
-                fill[square] = '#FFFF0050'
+                fill[square] = HIGHLIGHT_COLOR
 
         arrows = []
         if last_move:
             arrows = [(last_move.from_square, last_move.to_square)]
 
-        svg_data = chess.svg.board(
-            board,
-            size=self.size,
-            fill=fill,
-            arrows=arrows,
-            colors={
-                'square light': self.colors['light'],
-                'square dark': self.colors['dark']
-            }
-        )
+        with profiler.stage('svg'):
+            svg_data = chess.svg.board(
+                board,
+                size=self.size,
+                fill=fill,
+                arrows=arrows,
+                colors={
+                    'square light': self.colors['light'],
+                    'square dark': self.colors['dark']
+                }
+            )
+
+        with profiler.stage('rasterize', frames=1):
+            # Convert SVG to PNG
+            png_data = cairosvg.svg2png(
+                bytestring=svg_data.encode('utf-8'),
+                output_width=self.size,
+                output_height=self.size
+            )
+
+            # Decode to RGB (the board is opaque, so dropping alpha loses nothing)
+            image = Image.open(io.BytesIO(png_data)).convert('RGB')
+            return self._from_rgb(np.asarray(image))
+
+    def render_annotation_band(self, annotation: str) -> np.ndarray:
+        """
+        Render the annotation strip shown below the board, using the cache
 
-        # Convert SVG to PNG
-        png_data = cairosvg.svg2png(
-            bytestring=svg_data.encode('utf-8'),
-            output_width=self.size,
-            output_height=self.size
-        )
+        Args:
+            annotation: Text to display
 
-        # Load as PIL Image
-        image = Image.open(io.BytesIO(png_data))
-        return image
+        Returns:
+            Read-only array of shape (ANNOTATION_HEIGHT, size, 3)
+        """
+        key = ('band', annotation, self.size, self.pixel_format)
+        band = self.cache.get(key) if self.cache is not None else None
+        if band is not None:
+            return band
+
+        with profiler.stage('text'):
+            band_img = Image.new('RGB', (self.size, self.ANNOTATION_HEIGHT), color='white')
+
+            # Add annotation text (wrapped, max 2 lines)
+            draw = ImageDraw.Draw(band_img)
+            font = fonts.get(24)
+            for x, y, line in layout_text(annotation, 24, self.size - 40, self.size,
+                                          top=20, line_height=35, max_lines=2):
+                draw.text((x, y), line, fill='black', font=font)
+
+            band = self._from_rgb(np.asarray(band_img))
+        if self.cache is not None:
+            self.cache.put(key, band)
+        return band
+
+    def render_frame(self, board: chess.Board, annotation: str,
+                     last_move: Optional[chess.Move] = None,
+                     out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Render board and annotation band into a frame buffer
+
+        Args:
+            board: Chess board object
+            annotation: Text to display
+            last_move: Last move to highlight
+            out: Frame buffer to render into (default: the shared buffer of self.composer)
+
+        Returns:
+            Array of shape (size + ANNOTATION_HEIGHT, size, 3). Without out this
+            is the shared buffer of self.composer, valid until the next render_frame call
+        """
+        return self.composer.compose(
+            self.render_board_array(board, last_move=last_move),
+            self.render_annotation_band(annotation),
+            out
+        )
 
     def render_with_annotation(self, board: chess.Board,
                                annotation: str,
@@ -109,68 +768,7 @@ class ChessBoardRenderer:
         Returns:
             PIL Image with board and annotation
         """
-        # Render the board
-        board_img = self.render_board(board, last_move=last_move)
-
-        # Calculate total height with annotation space
-        annotation_height = 100
-        total_height = self.size + annotation_height
-
-        # Create new image with extra space
-        full_img = Image.new('RGB', (self.size, total_height), color='white')
-        full_img.paste(board_img, (0, 0))
-
-        # Add annotation text
-        draw = ImageDraw.Draw(full_img)
-
-        # Try to load a nice font, fallback to default
-        try:
-            font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 24)
-            title_font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 32)
-        except:
-            try:
-                font = ImageFont.truetype("arial.ttf", 24)
-                title_font = ImageFont.truetype("arial.ttf", 32)
-            except:
-                font = ImageFont.load_default()
-                title_font = ImageFont.load_default()
-
-        # Draw annotation text (wrapped)
-        y_offset = self.size + 20
-        max_width = self.size - 40
-
-        # Wrap text
-        words = annotation.split()
-        lines = []
-        current_line = []
-
-        for word in words:
-            current_line.append(word)
-            line_text = ' '.join(current_line)
-            bbox = draw.textbbox((0, 0), line_text, font=font)
-            line_width = bbox[2] - bbox[0]
-
-            if line_width > max_width:
-                if len(current_line) > 1:
-                    current_line.pop()
-                    lines.append(' '.join(current_line))
-                    current_line = [word]
-                else:
-                    lines.append(word)
-                    current_line = []
-
-        if current_line:
-            lines.append(' '.join(current_line))
-
-        # Draw lines
-        for line in lines[:2]:  # Max 2 lines
-            bbox = draw.textbbox((0, 0), line, font=font)
-            text_width = bbox[2] - bbox[0]
-            x = (self.size - text_width) // 2
-            draw.text((x, y_offset), line, fill='black', font=font)
-            y_offset += 35
-
-        return full_img
+        return Image.fromarray(self.to_rgb(self.render_frame(board, annotation, last_move)).copy())
 
     def render_move_comparison(self, before: chess.Board,
                                after: chess.Board,
@@ -199,10 +797,7 @@ class ChessBoardRenderer:
 
         # Add labels
         draw = ImageDraw.Draw(comparison)
-        try:
-            font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 20)
-        except:
-            font = ImageFont.load_default()
+        font = fonts.get(20)
 
         draw.text((self.size // 2 - 30, 5), "Before", fill='black', font=font)
         draw.text((self.size + self.size // 2 + 10, 5), "After", fill='black', font=font)
@@ -0,0 +1,469 @@
+"""
+Video encoder backends for chess theory videos
+Frames are emitted as runs of (frame, count) so static holds can be encoded cheaply
+"""
+
+import cv2
+import numpy as np
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from typing import Tuple, Optional, List
+from profiling import profiler
+
+ENCODER_BACKENDS = ['auto', 'ffmpeg', 'opencv']
+
+CODECS = ['libx264', 'libx265', 'libvpx-vp9']
+
+# Codec of the OpenCV backend (cv2.VideoWriter fourcc)
+OPENCV_FOURCC = 'mp4v'
+
+# Constant rate factor used when none is given (each codec has its own scale)
+DEFAULT_CRF = {
+    'libx264': 23,
+    'libx265': 28,
+    'libvpx-vp9': 31
+}
+
+# Audio codec muxed alongside each video codec (WebM cannot carry AAC)
+AUDIO_CODECS = {
+    'libx264': 'aac',
+    'libx265': 'aac',
+    'libvpx-vp9': 'libopus'
+}
+
+# libvpx has no presets; map the x264-style names onto its -cpu-used speed levels
+VP9_CPU_USED = {
+    'ultrafast': 8,
+    'superfast': 7,
+    'veryfast': 6,
+    'faster': 5,
+    'fast': 4,
+    'medium': 2,
+    'slow': 1,
+    'slower': 0,
+    'veryslow': 0
+}
+
+
+# Timestamps of the Matroska stream fed to ffmpeg are in microseconds
+MKV_TIMESTAMP_SCALE = 1000
+
+# Matroska element IDs used by the stream fed to ffmpeg
+_EBML = b'\x1a\x45\xdf\xa3'
+_SEGMENT = b'\x18\x53\x80\x67'
+_INFO = b'\x15\x49\xa9\x66'
+_TIMESTAMP_SCALE = b'\x2a\xd7\xb1'
+_TRACKS = b'\x16\x54\xae\x6b'
+_TRACK_ENTRY = b'\xae'
+_VIDEO = b'\xe0'
+_CLUSTER = b'\x1f\x43\xb6\x75'
+_CLUSTER_TIMESTAMP = b'\xe7'
+_BLOCK_GROUP = b'\xa0'
+_BLOCK = b'\xa1'
+_BLOCK_DURATION = b'\x9b'
+
+# Size of an element whose end is only known when the stream ends
+_UNKNOWN_SIZE = b'\x01\xff\xff\xff\xff\xff\xff\xff'
+
+
+def _ebml_size(size: int) -> bytes:
+    """Encode an element size as an EBML variable-length integer"""
+    for length in range(1, 9):
+        if size < (1 << (7 * length)) - 1:
+            return (size | (1 << (7 * length))).to_bytes(length, 'big')
+    raise ValueError(f"Element of {size} bytes is too large")
+
+
+def _ebml(element_id: bytes, *payload: bytes) -> bytes:
+    data = b''.join(payload)
+    return element_id + _ebml_size(len(data)) + data
+
+
+def _ebml_uint(element_id: bytes, value: int) -> bytes:
+    return _ebml(element_id, value.to_bytes(max(1, (value.bit_length() + 7) // 8), 'big'))
+
+
+def mkv_header(frame_size: Tuple[int, int]) -> bytes:
+    """
+    Start a streamed Matroska file with one raw BGR video track
+
+    ffmpeg reads raw frames in this container with a timestamp and duration
+    each, so a run of identical frames crosses the pipe (and is converted
+    to the output pixel format) once.
+    """
+    width, height = frame_size
+    ebml_header = _ebml(
+        _EBML,
+        _ebml_uint(b'\x42\x86', 1),          # EBMLVersion
+        _ebml_uint(b'\x42\xf7', 1),          # EBMLReadVersion
+        _ebml_uint(b'\x42\xf2', 4),          # EBMLMaxIDLength
+        _ebml_uint(b'\x42\xf3', 8),          # EBMLMaxSizeLength
+        _ebml(b'\x42\x82', b'matroska'),     # DocType
+        _ebml_uint(b'\x42\x87', 4),          # DocTypeVersion
+        _ebml_uint(b'\x42\x85', 2)           # DocTypeReadVersion
+    )
+    info = _ebml(
+        _INFO,
+        _ebml_uint(_TIMESTAMP_SCALE, MKV_TIMESTAMP_SCALE),
+        _ebml(b'\x4d\x80', b'chess-video'),  # MuxingApp
+        _ebml(b'\x57\x41', b'chess-video')   # WritingApp
+    )
+    track = _ebml(
+        _TRACK_ENTRY,
+        _ebml_uint(b'\xd7', 1),               # TrackNumber
+        _ebml_uint(b'\x73\xc5', 1),          # TrackUID
+        _ebml_uint(b'\x83', 1),               # TrackType: video
+        _ebml(b'\x86', b'V_UNCOMPRESSED'),    # CodecID
+        _ebml(
+            _VIDEO,
+            _ebml_uint(b'\xb0', width),       # PixelWidth
+            _ebml_uint(b'\xba', height),      # PixelHeight
+            _ebml(b'\x2e\xb5\x24', b'BGR\x18')  # ColourSpace: packed 24-bit BGR
+        )
+    )
+    return ebml_header + _SEGMENT + _UNKNOWN_SIZE + info + _ebml(_TRACKS, track)
+
+
+def mkv_frame(timestamp: int, duration: int, frame_bytes: int) -> Tuple[bytes, bytes]:
+    """
+    Wrap one frame shown for duration in its own cluster
+
+    The frame data itself is not copied: it is written between the two
+    returned parts.
+
+    Args:
+        timestamp: Start time in MKV_TIMESTAMP_SCALE units
+        duration: Display time in the same units
+        frame_bytes: Size of the raw BGR frame
+
+    Returns:
+        (bytes before the frame data, bytes after it)
+    """
+    # Block header: track 1, timestamp 0 relative to the cluster, no flags
+    block_header = b'\x81' + struct.pack('>hB', 0, 0)
+    block_size = len(block_header) + frame_bytes
+    block_head = _BLOCK + _ebml_size(block_size) + block_header
+    tail = _ebml_uint(_BLOCK_DURATION, duration)
+
+    group_size = len(block_head) + frame_bytes + len(tail)
+    cluster_timestamp = _ebml_uint(_CLUSTER_TIMESTAMP, timestamp)
+    group_head = _BLOCK_GROUP + _ebml_size(group_size)
+    cluster_size = len(cluster_timestamp) + len(group_head) + group_size
+    head = _CLUSTER + _ebml_size(cluster_size) + cluster_timestamp + group_head + block_head
+    return head, tail
+
+
+class VideoEncoder:
+    """
+    Base class for video encoder backends
+
+    Frames are BGR uint8 arrays. Callers emit runs of identical frames with
+    write(frame, count); backends decide how to encode a run (repeat the
+    frame, emit one variable-duration frame, ...).
+    """
+
+    def __init__(self, output_path: str, fps: int, frame_size: Tuple[int, int]):
+        """
+        Initialize encoder
+
+        Args:
+            output_path: Path to save the video
+            fps: Frames per second
+            frame_size: (width, height) of each frame
+        """
+        self.output_path = output_path
+        self.fps = fps
+        self.frame_size = frame_size
+        self.frames_written = 0
+        self.runs_written = 0
+
+    def write(self, frame: np.ndarray, count: int = 1):
+        """
+        Emit a run of identical frames
+
+        Args:
+            frame: BGR frame of shape (height, width, 3)
+            count: Number of times the frame is shown
+        """
+        if count <= 0:
+            return
+        with profiler.stage('encode', frames=count):
+            self._encode_run(frame, count)
+        self.frames_written += count
+        self.runs_written += 1
+
+    def write_duration(self, frame: np.ndarray, duration: float):
+        """Emit a frame held for duration seconds"""
+        self.write(frame, int(duration * self.fps))
+
+    def _encode_run(self, frame: np.ndarray, count: int):
+        """Encode count copies of frame (implemented by backends)"""
+        raise NotImplementedError
+
+    def release(self):
+        """Finish encoding and close the output"""
+        pass
+
+    def stats(self) -> dict:
+        """Return frame/run counters"""
+        return {
+            'frames': self.frames_written,
+            'runs': self.runs_written,
+            'duplicate_frames': self.frames_written - self.runs_written
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class OpenCVEncoder(VideoEncoder):
+    """Encoder backed by cv2.VideoWriter (mp4v)"""
+
+    def __init__(self, output_path: str, fps: int, frame_size: Tuple[int, int],
+                 fourcc: str = OPENCV_FOURCC):
+        super().__init__(output_path, fps, frame_size)
+        self.video = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, frame_size)
+
+        if not self.video.isOpened():
+            raise RuntimeError(f"Could not open video writer for {output_path}")
+
+    def _encode_run(self, frame: np.ndarray, count: int):
+        # VideoWriter has no notion of frame duration, so the converted frame is repeated
+        for _ in range(count):
+            self.video.write(frame)
+
+    def release(self):
+        with profiler.stage('encode_finish'):
+            self.video.release()
+
+
+class FFmpegEncoder(VideoEncoder):
+    """
+    Encoder that pipes raw BGR frames into an ffmpeg subprocess
+
+    Frames travel in a streamed Matroska container, one block per run with
+    the run's duration; ffmpeg repeats the converted frame to keep the
+    output at a constant frame rate.
+    """
+
+    def __init__(self, output_path: str, fps: int, frame_size: Tuple[int, int],
+                 codec: str = 'libx264', preset: str = 'medium',
+                 crf: Optional[int] = None, threads: int = 0,
+                 pix_fmt: str = 'yuv420p', ffmpeg_binary: str = 'ffmpeg',
+                 audio_path: Optional[str] = None):
+        """
+        Initialize encoder
+
+        Args:
+            output_path: Path to save the video
+            fps: Frames per second
+            frame_size: (width, height) of each frame
+            codec: ffmpeg video codec (libx264, libx265 or libvpx-vp9)
+            preset: Speed/size preset (mapped to -cpu-used for VP9)
+            crf: Constant rate factor; lower is better quality (codec default if None)
+            threads: Encoder thread count (0 lets ffmpeg decide)
+            pix_fmt: Output pixel format
+            ffmpeg_binary: Name or path of the ffmpeg executable
+            audio_path: Audio track (e.g. a narration WAV) muxed in the same pass
+        """
+        super().__init__(output_path, fps, frame_size)
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported codec '{codec}' (expected one of {CODECS})")
+
+        self.frame_bytes = frame_size[0] * frame_size[1] * 3
+        self.command = self.build_command(
+            output_path, fps, codec, preset,
+            DEFAULT_CRF[codec] if crf is None else crf,
+            threads, pix_fmt, ffmpeg_binary, audio_path
+        )
+
+        # stderr goes to a file so a chatty ffmpeg can never block on a full pipe
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stderr=self._stderr)
+        self._send(mkv_header(frame_size))
+
+    @staticmethod
+    def build_command(output_path: str, fps: int, codec: str, preset: str,
+                      crf: int, threads: int, pix_fmt: str, ffmpeg_binary: str = 'ffmpeg',
+                      audio_path: Optional[str] = None) -> list:
+        """Build the ffmpeg command line for timed raw frames on stdin (plus an optional audio file)"""
+        command = [
+            ffmpeg_binary, '-y', '-loglevel', 'error', '-nostats',
+            '-f', 'matroska', '-i', '-'
+        ]
+        if audio_path:
+            command += ['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0',
+                        '-c:a', AUDIO_CODECS[codec], '-b:a', '128k']
+        # Held frames arrive once with their duration; repeat them at the output rate
+        command += ['-fps_mode', 'cfr', '-r', str(fps)]
+        command += ['-c:v', codec, '-crf', str(crf)]
+
+        if codec == 'libvpx-vp9':
+            # Constant quality mode for VP9 requires a zero target bitrate
+            command += ['-b:v', '0', '-row-mt', '1',
+                        '-deadline', 'good', '-cpu-used', str(VP9_CPU_USED.get(preset, 2))]
+        else:
+            command += ['-preset', preset]
+
+        if threads:
+            command += ['-threads', str(threads)]
+
+        command += ['-pix_fmt', pix_fmt, output_path]
+        return command
+
+    def _encode_run(self, frame: np.ndarray, count: int):
+        data = np.ascontiguousarray(frame).data
+        if data.nbytes != self.frame_bytes:
+            raise ValueError(f"Frame has {data.nbytes} bytes, expected {self.frame_bytes}")
+
+        # Timestamps come from frame numbers, so rounding never accumulates
+        start = self._timestamp(self.frames_written)
+        head, tail = mkv_frame(start, self._timestamp(self.frames_written + count) - start,
+                               data.nbytes)
+        self._send(head)
+        self._send(data)
+        self._send(tail)
+
+    def _timestamp(self, frame: int) -> int:
+        return round(frame * 1_000_000_000 / (self.fps * MKV_TIMESTAMP_SCALE))
+
+    def _send(self, data):
+        try:
+            self.process.stdin.write(data)
+        except BrokenPipeError:
+            self.process.wait()
+            raise RuntimeError(f"ffmpeg exited early: {self._read_stderr()}")
+
+    def _read_stderr(self) -> str:
+        self._stderr.seek(0)
+        return self._stderr.read().decode('utf-8', errors='replace').strip()
+
+    def release(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        # Time spent waiting for ffmpeg to drain its buffers and write the file
+        with profiler.stage('encode_finish'):
+            returncode = self.process.wait()
+        error = self._read_stderr()
+        self._stderr.close()
+
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed with exit code {returncode}: {error}")
+
+
+def ffmpeg_available(ffmpeg_binary: str = 'ffmpeg') -> bool:
+    """Check whether the ffmpeg executable can be found"""
+    return shutil.which(ffmpeg_binary) is not None
+
+
+def resolve_backend(backend: str, ffmpeg_binary: str = 'ffmpeg') -> str:
+    """Return the backend create_encoder() uses for backend ('auto' picks ffmpeg when installed)"""
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}' (expected one of {ENCODER_BACKENDS})")
+    if backend == 'auto':
+        return 'ffmpeg' if ffmpeg_available(ffmpeg_binary) else 'opencv'
+    return backend
+
+
+def create_encoder(output_path: str, fps: int, frame_size: Tuple[int, int],
+                   backend: str = 'auto', **options) -> VideoEncoder:
+    """
+    Create a video encoder
+
+    Args:
+        output_path: Path to save the video
+        fps: Frames per second
+        frame_size: (width, height) of each frame
+        backend: 'ffmpeg', 'opencv' or 'auto' (ffmpeg when installed, else OpenCV)
+        **options: FFmpegEncoder options (codec, preset, crf, threads, pix_fmt,
+                   ffmpeg_binary, audio_path)
+
+    Returns:
+        Opened encoder
+    """
+    ffmpeg_binary = options.get('ffmpeg_binary', 'ffmpeg')
+    backend = resolve_backend(backend, ffmpeg_binary)
+
+    if backend == 'ffmpeg':
+        if not ffmpeg_available(ffmpeg_binary):
+            raise RuntimeError(f"ffmpeg encoder requested but '{ffmpeg_binary}' was not found on PATH")
+        return FFmpegEncoder(output_path, fps, frame_size, **options)
+
+    if options.get('audio_path'):
+        print("⚠ The OpenCV encoder cannot write audio; install ffmpeg to include narration")
+    return OpenCVEncoder(output_path, fps, frame_size)
+
+
+def concat_videos(paths: List[str], output_path: str, fps: int,
+                  frame_size: Tuple[int, int], ffmpeg_binary: str = 'ffmpeg',
+                  audio_path: Optional[str] = None):
+    """
+    Concatenate video files encoded with identical settings, in order
+
+    With ffmpeg the streams are copied without re-encoding (an audio track
+    is encoded and muxed in the same pass); otherwise the segments are
+    decoded and re-encoded through the OpenCV writer, without audio.
+
+    Args:
+        paths: Segment files in playback order
+        output_path: Path of the combined video
+        fps: Frames per second (OpenCV fallback only)
+        frame_size: (width, height) of each frame (OpenCV fallback only)
+        ffmpeg_binary: Name or path of the ffmpeg executable
+        audio_path: Audio track muxed alongside the copied video
+    """
+    with profiler.stage('concat'):
+        _concat(paths, output_path, fps, frame_size, ffmpeg_binary, audio_path)
+
+
+def _concat(paths: List[str], output_path: str, fps: int,
+            frame_size: Tuple[int, int], ffmpeg_binary: str,
+            audio_path: Optional[str] = None):
+    """Implementation of concat_videos()"""
+    if ffmpeg_available(ffmpeg_binary):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as list_file:
+            for path in paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                list_file.write(f"file '{escaped}'\n")
+
+        command = [ffmpeg_binary, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                   '-i', list_file.name]
+        if audio_path:
+            audio_codec = 'libopus' if output_path.lower().endswith('.webm') else 'aac'
+            command += ['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0',
+                        '-c:v', 'copy', '-c:a', audio_codec, '-b:a', '128k', output_path]
+        else:
+            command += ['-c', 'copy', output_path]
+
+        try:
+            result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        finally:
+            os.remove(list_file.name)
+
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg concat failed: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        return
+
+    if audio_path:
+        print("⚠ The OpenCV encoder cannot write audio; install ffmpeg to include narration")
+    with OpenCVEncoder(output_path, fps, frame_size) as video:
+        for path in paths:
+            capture = cv2.VideoCapture(path)
+            try:
+                while True:
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    video.write(frame)
+            finally:
+                capture.release()
@@ -0,0 +1,216 @@
+"""
+Single-pass tokenizer for chess theory input
+Classifies the input format and emits positioned tokens in one scan shared by all parsers
+"""
+
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+# Input formats, in detection priority order
+STRUCTURED = 'structured'
+PGN = 'pgn'
+ANNOTATED = 'annotated'
+SIMPLE = 'simple'
+
+# Token kinds
+HEADER = 'HEADER'                    # [Tag "value"]: value=tag, data=tag value
+DIRECTIVE = 'DIRECTIVE'              # TITLE:/MOVES:/TEXT:/...: value=name, data=rest of line
+MOVE_NUMBER = 'MOVE_NUMBER'          # 1. / 12...
+MOVE = 'MOVE'                        # SAN or UCI move text
+ANNOTATION = 'ANNOTATION'            # text after the dash in "1. e4 - text"
+COMMENT = 'COMMENT'                  # {comment} or ; comment
+NAG = 'NAG'                          # $n or a !/? suffix (value is always $n)
+VARIATION_START = 'VARIATION_START'  # (
+VARIATION_END = 'VARIATION_END'      # )
+RESULT = 'RESULT'                    # 1-0, 0-1, 1/2-1/2, *
+UNKNOWN = 'UNKNOWN'                  # anything else; parsers report these as rejected
+
+DIRECTIVES = ('TITLE', 'DESCRIPTION', 'MOVES', 'TEXT', 'TIMING', 'DISPLAY', 'OPENING')
+
+# Suffix annotations and their standard NAG numbers
+GLYPH_NAGS = {'!': 1, '?': 2, '!!': 3, '??': 4, '!?': 5, '?!': 6}
+
+# SAN (including long algebraic like Ng1-f3) and UCI moves share one pattern
+MOVE_PATTERN = (
+    r'(?:[NBRQK]?[a-h]?[1-8]?[-x]?[a-h][1-8](?:=?[NBRQnbrq])?'
+    r'|O-O(?:-O)?|0-0(?:-0)?)[+#]?'
+)
+
+_HEADER_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]\s*$')
+_DIRECTIVE_RE = re.compile(r'(' + '|'.join(DIRECTIVES) + r'):(.*)$', re.IGNORECASE)
+_ANNOTATED_RE = re.compile(r'(\d+)(\.+)\s*(' + MOVE_PATTERN + r')\s*-\s*(.+)$')
+_STRUCTURED_RE = re.compile(r'MOVES:|TITLE:', re.IGNORECASE)
+_BRACE_COMMENT_RE = re.compile(r'\{[^}]+\}')
+
+_WORD_RE = re.compile(
+    r'(?P<space>\s+)'
+    r'|(?P<comment>\{)'
+    r'|(?P<line_comment>;.*)'
+    r'|(?P<var_start>\()'
+    r'|(?P<var_end>\))'
+    r'|(?P<nag>\$\d+)'
+    r'|(?P<result>(?:1-0|0-1|1/2-1/2|\*)(?=[\s(){};]|$))'
+    r'|(?P<move>' + MOVE_PATTERN + r')(?P<glyph>[!?]{1,2})?[.,]*(?=[\s(){};]|$)'
+    r'|(?P<number>\d+\.*)'
+    r'|(?P<word>[^\s(){};]+)'
+)
+
+
+class Token(NamedTuple):
+    """A lexed token with its 1-based source position"""
+    kind: str
+    value: str
+    line: int
+    column: int
+    data: Optional[str] = None
+
+
+class LexResult(NamedTuple):
+    """Tokens of an input plus the format they were classified as"""
+    format: str
+    tokens: List[Token]
+    title_line: Optional[Tuple[int, str]]  # (line number, text) of the first non-blank line
+
+
+def tokenize(text: str) -> LexResult:
+    """
+    Tokenize chess theory text in a single pass
+
+    The format is decided with the same precedence the parser has always
+    used: TITLE:/MOVES: markers, then PGN ({brace} comments, [Tag] headers
+    or a parenthesized variation after a move), then "1. e4 - text" annotation lines,
+    otherwise plain move text. A dash elsewhere (O-O, Ng1-f3) is not
+    annotation evidence.
+
+    Args:
+        text: Raw input text
+
+    Returns:
+        LexResult with the detected format and the token list
+    """
+    tokens = []
+    title_line = None
+    structured = pgn = annotated = False
+
+    comment_parts = None  # Pieces of a {comment} that spans lines
+    comment_start = None
+
+    for line_no, raw in enumerate(text.splitlines(), start=1):
+        # Format evidence, gathered on the same pass as the tokens; once a
+        # higher-priority format is certain the weaker probes are skipped
+        if not structured:
+            if _STRUCTURED_RE.search(raw):
+                structured = True
+            elif not pgn and _BRACE_COMMENT_RE.search(raw):
+                pgn = True
+
+        pos = 0
+        in_title = False  # A title line (e.g. "Italian Game (Giuoco Piano)") is not movetext
+        if comment_parts is not None:
+            end = raw.find('}')
+            if end < 0:
+                comment_parts.append(raw)
+                continue
+            comment_parts.append(raw[:end])
+            comment = '\n'.join(comment_parts).strip()
+            tokens.append(Token(COMMENT, comment, comment_start[0], comment_start[1]))
+            pgn = True
+            comment_parts = None
+            pos = end + 1
+        else:
+            stripped = raw.strip()
+            if not stripped:
+                continue
+            if title_line is None:
+                title_line = (line_no, stripped)
+                in_title = not any(char.isdigit() for char in stripped[:10])
+
+            indent = len(raw) - len(raw.lstrip())
+            column = indent + 1
+
+            if stripped.startswith('%'):
+                continue  # PGN escape line
+
+            match = _HEADER_RE.match(stripped)
+            if match:
+                tokens.append(Token(HEADER, match.group(1), line_no, column, match.group(2)))
+                pgn = True  # PGN even without comments
+                continue
+
+            match = _DIRECTIVE_RE.match(stripped)
+            if match:
+                tokens.append(Token(DIRECTIVE, match.group(1).upper(), line_no, column,
+                                    match.group(2).strip()))
+                continue
+
+            match = _ANNOTATED_RE.match(stripped)
+            if match:
+                tokens.append(Token(MOVE_NUMBER, match.group(1) + match.group(2), line_no, column))
+                tokens.append(Token(MOVE, match.group(3), line_no, indent + match.start(3) + 1))
+                tokens.append(Token(ANNOTATION, match.group(4).strip(), line_no,
+                                    indent + match.start(4) + 1))
+                annotated = True
+                continue
+
+        # Free-form movetext
+        while pos < len(raw):
+            match = _WORD_RE.match(raw, pos)
+            kind = match.lastgroup
+            if kind == 'glyph':
+                kind = 'move'  # lastgroup names the optional suffix group when it matched
+            column = pos + 1
+            pos = match.end()
+
+            if kind == 'space':
+                continue
+            if kind == 'comment':
+                end = raw.find('}', pos)
+                if end < 0:
+                    comment_parts = [raw[pos:]]
+                    comment_start = (line_no, column)
+                    break
+                tokens.append(Token(COMMENT, raw[pos:end].strip(), line_no, column))
+                pos = end + 1
+            elif kind == 'line_comment':
+                tokens.append(Token(COMMENT, match.group(kind)[1:].strip(), line_no, column))
+            elif kind == 'var_start':
+                # Only the PGN parser follows variations, but a parenthesis in a
+                # title or prose is not one: it must follow a move in movetext
+                if not in_title and tokens and tokens[-1].kind in (MOVE, MOVE_NUMBER, NAG):
+                    pgn = True
+                tokens.append(Token(VARIATION_START, '(', line_no, column))
+            elif kind == 'var_end':
+                tokens.append(Token(VARIATION_END, ')', line_no, column))
+            elif kind == 'nag':
+                tokens.append(Token(NAG, match.group(kind), line_no, column))
+            elif kind == 'result':
+                tokens.append(Token(RESULT, match.group(kind), line_no, column))
+            elif kind == 'move':
+                tokens.append(Token(MOVE, match.group('move'), line_no, column))
+                glyph = match.group('glyph')
+                if glyph:
+                    glyph_column = match.start('glyph') + 1
+                    if glyph in GLYPH_NAGS:
+                        tokens.append(Token(NAG, f'${GLYPH_NAGS[glyph]}', line_no, glyph_column))
+                    else:
+                        tokens.append(Token(UNKNOWN, glyph, line_no, glyph_column))
+            elif kind == 'number':
+                tokens.append(Token(MOVE_NUMBER, match.group(kind), line_no, column))
+            else:
+                tokens.append(Token(UNKNOWN, match.group(kind), line_no, column))
+
+    if comment_parts is not None:
+        # Unterminated comment: keep what was read rather than dropping it
+        comment = '\n'.join(comment_parts).strip()
+        tokens.append(Token(COMMENT, comment, comment_start[0], comment_start[1]))
+
+    if structured:
+        input_format = STRUCTURED
+    elif pgn:
+        input_format = PGN
+    elif annotated:
+        input_format = ANNOTATED
+    else:
+        input_format = SIMPLE
+
+    return LexResult(input_format, tokens, title_line)
@@ -5,10 +5,14 @@ Generate realistic videos from chess theory notation
 """
 
 import argparse
+import cProfile
 import sys
 import os
 from parser import ChessTheoryParser
-from video_generator import ChessVideoGenerator
+from pipeline import DEFAULT_QUEUE_SIZE
+from profiling import profiler
+from video_generator import DRAFT_SIZE, ChessVideoGenerator, SegmentCache, draft_fps
+from batch import RENDER_CHOICES, RENDER_DEFAULTS, generator_options, load_jobs, run_batch
 
 
 def validate_file(filepath: str) -> bool:
@@ -19,8 +23,349 @@ def validate_file(filepath: str) -> bool:
     return True
 
 
+def write_profile_report(path: str, args: argparse.Namespace,
+                         video_gen: 'ChessVideoGenerator' = None):
+    """Write the per-stage profiling report for a single-file run"""
+    stages = profiler.stats()
+    extra = {
+        'input': args.input,
+        'output': args.output,
+        'settings': {key: getattr(args, key) for key in RENDER_DEFAULTS},
+        'workers': args.workers,
+        'frames': stages.get('encode', {}).get('frames', 0)
+    }
+    if video_gen is not None:
+        extra['render_cache'] = video_gen.renderer.cache_stats()
+        if video_gen.segment_cache is not None:
+            extra['segment_cache'] = video_gen.segment_cache.stats()
+
+    report = profiler.write_report(path, extra)
+    print(f"Profile written: {path}")
+    for name, stage in list(report['stages'].items())[:5]:
+        print(f"  {name:<16} {stage['wall_seconds']:>8.2f}s wall  {stage['calls']:>7} calls")
+
+
+def add_render_arguments(parser: argparse.ArgumentParser):
+    """Add the rendering and encoding options shared by single and batch mode"""
+    parser.add_argument(
+        '--fps',
+        type=int,
+        default=30,
+        choices=RENDER_CHOICES['fps'],
+        help='Frames per second (default: 30)'
+    )
+
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=2.0,
+        help='Duration per move in seconds (default: 2.0)'
+    )
+
+    parser.add_argument(
+        '--size',
+        type=int,
+        default=800,
+        choices=RENDER_CHOICES['size'],
+        help='Board size in pixels (default: 800)'
+    )
+
+    parser.add_argument(
+        '--style',
+        default='default',
+        choices=RENDER_CHOICES['style'],
+        help='Board color style (default: default)'
+    )
+
+    parser.add_argument(
+        '--renderer',
+        default='svg',
+        choices=RENDER_CHOICES['renderer'],
+        help='Board renderer: svg rasterizes every position, sprite composites '
+             'pre-rendered pieces and is much faster (default: svg)'
+    )
+
+    parser.add_argument(
+        '--encoder',
+        default='auto',
+        choices=RENDER_CHOICES['encoder'],
+        help='Video encoder: ffmpeg pipe or OpenCV writer; auto uses ffmpeg '
+             'when installed (default: auto)'
+    )
+
+    parser.add_argument(
+        '--codec',
+        default='libx264',
+        choices=RENDER_CHOICES['codec'],
+        help='ffmpeg video codec (default: libx264)'
+    )
+
+    parser.add_argument(
+        '--preset',
+        default='medium',
+        help='ffmpeg encoder preset, e.g. ultrafast, fast, medium, slow (default: medium)'
+    )
+
+    parser.add_argument(
+        '--crf',
+        type=int,
+        default=None,
+        help='Constant rate factor, lower is higher quality (default: 23 x264, 28 x265, 31 VP9)'
+    )
+
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=0,
+        help='Encoder thread count, 0 for automatic (default: 0)'
+    )
+
+    parser.add_argument(
+        '--pix-fmt',
+        default='yuv420p',
+        help='Output pixel format for ffmpeg (default: yuv420p)'
+    )
+
+    parser.add_argument(
+        '--intro-duration',
+        type=float,
+        default=3.0,
+        help='Intro screen duration in seconds (default: 3.0)'
+    )
+
+    parser.add_argument(
+        '--outro-duration',
+        type=float,
+        default=2.0,
+        help='Outro screen duration in seconds (default: 2.0)'
+    )
+
+    parser.add_argument(
+        '--draft',
+        action='store_true',
+        help='Quick preview: small, low frame rate, no move transitions, fast encoder; '
+             'segments keep the same timing as the full render'
+    )
+
+    parser.add_argument(
+        '--pipeline-queue',
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        metavar='FRAMES',
+        help='Frames queued between rendering and the encoder thread; 0 encodes on the '
+             f'rendering thread (default: {DEFAULT_QUEUE_SIZE})'
+    )
+
+
+def batch_main(argv: list):
+    """Render every theory file in a directory or manifest"""
+    parser = argparse.ArgumentParser(
+        prog='main.py batch',
+        description='Render a directory or JSON manifest of chess theory files',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s examples/ --output-dir videos/ --workers 8
+  %(prog)s manifest.json --report report.json --renderer sprite
+  %(prog)s repertoire.pgn --output-dir videos/   (one video per game)
+
+Manifest format (JSON list; per-job options use the flag names below):
+  [{"input": "ruy_lopez.txt", "output": "ruy.mp4", "options": {"style": "wood"}}]
+        """
+    )
+
+    parser.add_argument(
+        'source',
+        help='Directory of theory files (*.txt, *.pgn), multi-game PGN file or JSON manifest'
+    )
+
+    parser.add_argument(
+        '--output-dir',
+        default=None,
+        help='Directory for videos without an explicit output (default: next to each input)'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Worker processes rendering jobs in parallel (default: CPU count)'
+    )
+
+    parser.add_argument(
+        '--report',
+        default=None,
+        help='Write a JSON summary report to this path'
+    )
+
+    parser.add_argument(
+        '--transposition-cache',
+        metavar='DIR',
+        default=None,
+        help='Keep the boards and move transitions shared between jobs in DIR, so later '
+             'batches reuse them (default: a temporary directory for this batch). Positions '
+             'rendered twice are stored uncompressed, size x size x 3 bytes each (1.1 MB at '
+             '600px, 4.9 MB at 1280px), up to 1 GB per worker'
+    )
+
+    parser.add_argument(
+        '--no-shared-frames',
+        action='store_true',
+        help='Render every job from scratch instead of sharing boards and transitions of '
+             'positions that several jobs reach (no cache files are written)'
+    )
+
+    add_render_arguments(parser)
+
+    parser.add_argument(
+        '--thumbnail',
+        action='store_true',
+        help='Generate thumbnail images alongside videos'
+    )
+
+    args = parser.parse_args(argv)
+
+    if not validate_file(args.source):
+        sys.exit(1)
+
+    defaults = {key: getattr(args, key) for key in RENDER_DEFAULTS}
+    try:
+        jobs = load_jobs(args.source, output_dir=args.output_dir, defaults=defaults)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if not jobs:
+        print(f"Error: No theory files found in '{args.source}'")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("Chess Theory Video Generator - Batch")
+    print("=" * 60)
+    print(f"Jobs:           {len(jobs)}")
+    print(f"Workers:        {args.workers}")
+    print("=" * 60)
+    print()
+
+    summary = run_batch(jobs, workers=args.workers, report_path=args.report,
+                        share_frames=not args.no_shared_frames,
+                        transposition_dir=args.transposition_cache)
+
+    print()
+    print("=" * 60)
+    print(f"Batch complete: {summary['succeeded']}/{summary['total']} succeeded "
+          f"in {summary['seconds']:.1f}s")
+    if 'transpositions' in summary:
+        shared = summary['transpositions']
+        print(f"Shared boards:  {shared['board_saved']} boards and "
+              f"{shared['transition_saved']} transitions reused "
+              f"({shared['dedup_ratio']:.1%} of rasterizations, "
+              f"{shared.get('bytes_written', 0) / 1e6:.0f} MB written)")
+        if shared.get('write_errors'):
+            print(f"⚠ {shared['write_errors']} shared entries could not be written (rendered without sharing)")
+    if args.report:
+        print(f"Report:         {args.report}")
+    print("=" * 60)
+
+    if summary['failed']:
+        sys.exit(1)
+
+
+def serve_main(argv: list):
+    """Run the local HTTP render service"""
+    from server import serve, DEFAULT_HOST, DEFAULT_PORT
+
+    parser = argparse.ArgumentParser(
+        prog='main.py serve',
+        description='Serve render jobs over HTTP from a pool of warm worker processes',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s --workers 4 --max-queue 32
+  curl --data-binary @examples/ruy_lopez.txt http://127.0.0.1:8765/jobs
+  curl -H 'Content-Type: application/json' \\
+       -d '{"theory": "1. e4 e5 2. Nf3", "options": {"style": "wood"}}' http://127.0.0.1:8765/jobs
+  curl http://127.0.0.1:8765/jobs/<id>
+  curl -o video.mp4 http://127.0.0.1:8765/jobs/<id>/result
+
+Render flags below set the defaults for requests that do not override them.
+        """
+    )
+
+    parser.add_argument(
+        '--host',
+        default=DEFAULT_HOST,
+        help=f'Interface to listen on (default: {DEFAULT_HOST}, local connections only)'
+    )
+
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=DEFAULT_PORT,
+        help=f'TCP port (default: {DEFAULT_PORT})'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Worker processes kept warm for rendering (default: CPU count)'
+    )
+
+    parser.add_argument(
+        '--max-concurrency',
+        type=int,
+        default=None,
+        help='Jobs rendering at the same time (default: number of workers)'
+    )
+
+    parser.add_argument(
+        '--max-queue',
+        type=int,
+        default=16,
+        help='Jobs allowed to wait (at least 1); further submissions are refused with 503 (default: 16)'
+    )
+
+    parser.add_argument(
+        '--output-dir',
+        default=None,
+        help='Directory videos are kept in (default: a temporary directory removed on exit)'
+    )
+
+    parser.add_argument(
+        '--keep-results',
+        type=int,
+        default=100,
+        help='Finished jobs kept before the oldest videos are deleted (default: 100)'
+    )
+
+    add_render_arguments(parser)
+
+    args = parser.parse_args(argv)
+    if args.max_queue < 1:
+        parser.error('--max-queue must be at least 1')
+
+    defaults = {key: getattr(args, key) for key in RENDER_DEFAULTS if key != 'thumbnail'}
+    serve(
+        args.host, args.port,
+        workers=args.workers,
+        max_concurrency=args.max_concurrency,
+        max_queue=args.max_queue,
+        output_dir=args.output_dir,
+        keep_results=args.keep_results,
+        defaults=defaults
+    )
+
+
 def main():
     """Main application entry point"""
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        batch_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve_main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
         description='Generate realistic chess theory videos from notation',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -29,6 +374,9 @@ Examples:
   %(prog)s --input theory.txt --output video.mp4
   %(prog)s -i opening.pgn -o opening.mp4 --style wood --fps 60
   %(prog)s -i theory.txt -o video.mp4 --duration 3 --size 1024
+  %(prog)s -i repertoire.pgn -o videos/repertoire.mp4 --branches
+  %(prog)s batch examples/ --output-dir videos/ --workers 8
+  %(prog)s serve --workers 4
 
 Supported input formats:
   - PGN notation with comments
@@ -52,48 +400,29 @@ Supported input formats:
     )
 
     # Optional arguments
-    parser.add_argument(
-        '--fps',
-        type=int,
-        default=30,
-        choices=[24, 30, 60],
-        help='Frames per second (default: 30)'
-    )
+    add_render_arguments(parser)
 
     parser.add_argument(
-        '--duration',
-        type=float,
-        default=2.0,
-        help='Duration per move in seconds (default: 2.0)'
-    )
-
-    parser.add_argument(
-        '--size',
+        '--workers',
         type=int,
-        default=800,
-        choices=[600, 800, 1024, 1280],
-        help='Board size in pixels (default: 800)'
+        default=1,
+        help='Processes rendering move segments in parallel (default: 1)'
     )
 
     parser.add_argument(
-        '--style',
-        default='default',
-        choices=['default', 'wood', 'marble', 'blue', 'green'],
-        help='Board color style (default: default)'
+        '--segment-cache',
+        nargs='?',
+        const='',
+        metavar='DIR',
+        help='Reuse encoded intro/move/outro segments whose inputs did not change, so an edit '
+             'only re-renders the segments it touches (default dir: ~/.cache/chess-video/segments)'
     )
 
     parser.add_argument(
-        '--intro-duration',
-        type=float,
-        default=3.0,
-        help='Intro screen duration in seconds (default: 3.0)'
-    )
-
-    parser.add_argument(
-        '--outro-duration',
-        type=float,
-        default=2.0,
-        help='Outro screen duration in seconds (default: 2.0)'
+        '--branches',
+        action='store_true',
+        help='Render every variation of a PGN as its own video (<output>_01.mp4, ...); moves '
+             'shared by several lines are rendered once'
     )
 
     parser.add_argument(
@@ -122,6 +451,21 @@ Supported input formats:
         help='Narrator speech rate in words per minute (default: 150)'
     )
 
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const='',
+        metavar='PATH',
+        help='Write a per-stage timing/memory report as JSON '
+             '(default path: <output>.profile.json)'
+    )
+
+    parser.add_argument(
+        '--cprofile',
+        metavar='PATH',
+        help='Also dump cProfile stats for the run (pstats format, e.g. for snakeviz or flameprof)'
+    )
+
     args = parser.parse_args()
 
     # Validate input
@@ -136,13 +480,35 @@ Supported input formats:
     print(f"Output video:   {args.output}")
     print(f"Board size:     {args.size}x{args.size}")
     print(f"Style:          {args.style}")
+    print(f"Renderer:       {args.renderer}")
+    print(f"Encoder:        {args.encoder} ({args.codec}, preset {args.preset})")
     print(f"FPS:            {args.fps}")
     print(f"Move duration:  {args.duration}s")
+    if args.draft:
+        print(f"Draft:          {min(args.size, DRAFT_SIZE)}px, {draft_fps(args.fps)} fps, "
+              f"no transitions")
+    if args.workers > 1:
+        print(f"Workers:        {args.workers}")
+    if args.segment_cache is not None:
+        print(f"Segment cache:  {args.segment_cache or 'default directory'}")
+    if args.branches:
+        print("Branches:       One video per variation")
     if args.narrator:
         print(f"Narrator:       Enabled (rate: {args.narrator_rate} wpm)")
     print("=" * 60)
     print()
 
+    profile_path = None
+    if args.profile is not None:
+        profile_path = args.profile or os.path.splitext(args.output)[0] + '.profile.json'
+        profiler.enable()
+
+    call_profile = None
+    if args.cprofile:
+        call_profile = cProfile.Profile()
+        call_profile.enable()
+
+    video_gen = None
     try:
         # Parse chess theory
         print("Step 1: Parsing chess theory...")
@@ -158,24 +524,59 @@ Supported input formats:
             print(f"  Title: {theory_data['title']}")
         if theory_data['description']:
             print(f"  Description: {theory_data['description']}")
+        if theory_data['rejected']:
+            print(f"⚠ Skipped {len(theory_data['rejected'])} unrecognized or illegal token(s)")
+            for rejected in theory_data['rejected'][:None if args.verbose else 5]:
+                print(f"  line {rejected['line']}, column {rejected['column']}: "
+                      f"'{rejected['token']}' ({rejected['reason']})")
+        if args.branches:
+            if theory_data['variations'] is None:
+                print("Error: --branches needs PGN input (other formats have no variations)")
+                sys.exit(1)
+            variations = theory_data['variations']
+            print(f"  Variations: {len(variations.leaves())} lines, {len(variations)} distinct moves")
         print()
 
         # Generate video
         print("Step 2: Generating video...")
+        options = {key: getattr(args, key) for key in RENDER_DEFAULTS}
         video_gen = ChessVideoGenerator(
-            size=args.size,
-            fps=args.fps,
-            style=args.style,
+            **generator_options(options),
             enable_narrator=args.narrator,
-            narrator_rate=args.narrator_rate
+            narrator_rate=args.narrator_rate,
+            segment_cache=SegmentCache(args.segment_cache or None) if args.segment_cache is not None else None
         )
 
-        video_gen.generate_video(
+        if args.branches:
+            branches = video_gen.generate_branches(
+                theory_data=theory_data,
+                output_path=args.output,
+                move_duration=args.duration,
+                intro_duration=args.intro_duration,
+                outro_duration=args.outro_duration,
+                workers=args.workers
+            )
+
+            print()
+            print("=" * 60)
+            print(f"Generated {len(branches)} branch videos")
+            print("=" * 60)
+            for branch in branches:
+                print(f"{branch['output']}  ({branch['duration']:.1f}s)  {branch['line']}")
+            if args.thumbnail:
+                thumbnail_path = os.path.splitext(args.output)[0] + '_thumbnail.png'
+                video_gen.create_thumbnail(theory_data, thumbnail_path)
+                print(f"Thumbnail:  {thumbnail_path}")
+            print("=" * 60)
+            return
+
+        timeline = video_gen.generate_video(
             theory_data=theory_data,
             output_path=args.output,
             move_duration=args.duration,
             intro_duration=args.intro_duration,
-            outro_duration=args.outro_duration
+            outro_duration=args.outro_duration,
+            workers=args.workers
         )
 
         print(f"✓ Video generated successfully: {args.output}")
@@ -185,23 +586,21 @@ Supported input formats:
         if args.thumbnail:
             thumbnail_path = os.path.splitext(args.output)[0] + '_thumbnail.png'
             print("Step 3: Generating thumbnail...")
-            video_gen.create_thumbnail(theory_data, thumbnail_path)
+            with profiler.stage('thumbnail'):
+                video_gen.create_thumbnail(theory_data, thumbnail_path)
             print(f"✓ Thumbnail generated: {thumbnail_path}")
             print()
 
-        # Calculate video stats
-        total_duration = (
-            args.intro_duration +
-            (theory_data['move_count'] * args.duration) +
-            args.outro_duration
-        )
-
         print("=" * 60)
         print("Generation Complete!")
         print("=" * 60)
         print(f"Total moves:      {theory_data['move_count']}")
-        print(f"Video duration:   {total_duration:.1f}s")
+        print(f"Video duration:   {timeline['duration']:.1f}s ({timeline['frames']} frames)")
         print(f"File size:        {os.path.getsize(args.output) / (1024*1024):.2f} MB")
+        if args.verbose:
+            stats = video_gen.renderer.cache_stats()
+            print(f"Render cache:     {stats['hit_rate']:.1%} hit rate, "
+                  f"{stats['entries']} entries, {stats['bytes'] / (1024*1024):.1f} MB")
         print("=" * 60)
 
     except Exception as e:
@@ -211,6 +610,16 @@ Supported input formats:
             traceback.print_exc()
         sys.exit(1)
 
+    finally:
+        # Reports are written for failed runs too; they show where the time went before the failure
+        if call_profile is not None:
+            call_profile.disable()
+            call_profile.dump_stats(args.cprofile)
+            print(f"cProfile stats written: {args.cprofile}")
+
+        if profile_path:
+            write_profile_report(profile_path, args, video_gen)
+
 
 if __name__ == '__main__':
     main()
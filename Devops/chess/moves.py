@@ -0,0 +1,288 @@
+"""
+Compact move storage for parsed chess theory
+Moves are packed into 16-bit integers; SAN and FEN are only computed when read
+"""
+
+import chess
+from array import array
+from collections.abc import Mapping
+from typing import Iterator, List, Optional, Union
+
+
+def pack_move(move: chess.Move) -> int:
+    """Pack a move into 15 bits: from (6) | to (6) | promotion piece type (3)"""
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def unpack_move(packed: int) -> chess.Move:
+    """Inverse of pack_move()"""
+    return chess.Move(packed & 0x3F, (packed >> 6) & 0x3F, (packed >> 12) or None)
+
+
+class MoveRecord(Mapping):
+    """Read-only view of one move with the legacy dict keys (san, uci, from, to, fen)"""
+
+    __slots__ = ('_sequence', '_index')
+
+    KEYS = ('san', 'uci', 'from', 'to', 'fen')
+
+    def __init__(self, sequence: 'MoveSequence', index: int):
+        self._sequence = sequence
+        self._index = index
+
+    def __getitem__(self, key: str):
+        if key == 'uci':
+            return self._sequence.uci(self._index)
+        if key == 'san':
+            return self._sequence.san(self._index)
+        if key == 'fen':
+            return self._sequence.fen(self._index)
+        if key == 'from':
+            return chess.square_name(self._sequence.move(self._index).from_square)
+        if key == 'to':
+            return chess.square_name(self._sequence.move(self._index).to_square)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def __repr__(self) -> str:
+        return f"MoveRecord({dict(self)!r})"
+
+
+class MoveSequence:
+    """
+    Sequence of moves played from a starting position
+
+    Behaves like the list of move dicts the parser used to build: indexing
+    returns a MoveRecord with the same keys, slicing returns a list of them.
+    SAN strings and FENs (position before each move) are computed for the
+    whole sequence in one replay the first time they are requested.
+    """
+
+    __slots__ = ('starting_fen', '_packed', '_san', '_fen')
+
+    def __init__(self, starting_fen: str = chess.STARTING_FEN):
+        """
+        Initialize an empty sequence
+
+        Args:
+            starting_fen: Position the first move is played from
+        """
+        self.starting_fen = starting_fen
+        self._packed = array('H')
+        self._san = None
+        self._fen = None
+
+    def append(self, move: chess.Move):
+        """Add a move (legality is the caller's responsibility)"""
+        self._packed.append(pack_move(move))
+        self._san = None
+        self._fen = None
+
+    def move(self, index: int) -> chess.Move:
+        """Return the chess.Move at index"""
+        return unpack_move(self._packed[index])
+
+    def uci(self, index: int) -> str:
+        """Return the UCI string of the move at index"""
+        return self.move(index).uci()
+
+    def san(self, index: int) -> str:
+        """Return the SAN string of the move at index"""
+        if self._san is None:
+            self._replay(san=True)
+        return self._san[index]
+
+    def fen(self, index: int) -> str:
+        """Return the FEN of the position before the move at index"""
+        if self._fen is None:
+            self._replay(fen=True)
+        return self._fen[index]
+
+    def _replay(self, san: bool = False, fen: bool = False):
+        """Replay the moves once, materializing the requested strings"""
+        board = chess.Board(self.starting_fen)
+        san_list = [] if san else None
+        fen_list = [] if fen else None
+
+        for packed in self._packed:
+            move = unpack_move(packed)
+            if fen:
+                fen_list.append(board.fen())
+            if san:
+                san_list.append(board.san(move))
+            board.push(move)
+
+        if san:
+            self._san = san_list
+        if fen:
+            self._fen = fen_list
+
+    def to_list(self) -> List[dict]:
+        """Return the moves as plain dicts"""
+        return [dict(record) for record in self]
+
+    def __len__(self) -> int:
+        return len(self._packed)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[MoveRecord, List[MoveRecord]]:
+        if isinstance(index, slice):
+            return [MoveRecord(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('move index out of range')
+        return MoveRecord(self, index)
+
+    def __iter__(self) -> Iterator[MoveRecord]:
+        for index in range(len(self)):
+            yield MoveRecord(self, index)
+
+    def __repr__(self) -> str:
+        return f"MoveSequence({len(self)} moves from {self.starting_fen!r})"
+
+
+class VariationTree:
+    """
+    Move tree of a game with all its variations
+
+    Nodes are integers indexing flat arrays (parent, packed move, first
+    child, next sibling), so a large repertoire costs a few bytes per move
+    rather than a python-chess GameNode with its own board. Node 0 (ROOT)
+    is the starting position; every other node is the position after its
+    move. Children keep their PGN order: the first child continues the main
+    line, later ones are its alternatives.
+
+    Comments and NAGs are kept in dicts keyed by node, since most moves
+    have neither.
+    """
+
+    __slots__ = ('starting_fen', '_parent', '_packed', '_first_child', '_next_sibling',
+                 'comments', 'nags')
+
+    ROOT = 0
+
+    def __init__(self, starting_fen: str = chess.STARTING_FEN):
+        """
+        Initialize a tree holding only the starting position
+
+        Args:
+            starting_fen: Position the game starts from
+        """
+        self.starting_fen = starting_fen
+        self._parent = array('i', [-1])
+        self._packed = array('H', [0])
+        self._first_child = array('i', [-1])
+        self._next_sibling = array('i', [-1])
+        self.comments = {}  # Node -> comment on the move leading to it (ROOT: on the game)
+        self.nags = {}  # Node -> tuple of NAG numbers
+
+    def add(self, parent: int, move: chess.Move) -> int:
+        """
+        Add a move played from the position at parent and return its node
+
+        A move that is already a child of parent (a variation repeating the
+        main line) returns the existing node. Legality is the caller's
+        responsibility.
+        """
+        packed = pack_move(move)
+        child = self._first_child[parent]
+        last = -1
+        while child >= 0:
+            if self._packed[child] == packed:
+                return child
+            last = child
+            child = self._next_sibling[child]
+
+        node = len(self._parent)
+        self._parent.append(parent)
+        self._packed.append(packed)
+        self._first_child.append(-1)
+        self._next_sibling.append(-1)
+        if last < 0:
+            self._first_child[parent] = node
+        else:
+            self._next_sibling[last] = node
+        return node
+
+    def comment(self, node: int, text: str):
+        """Attach a comment to node, joining it with an earlier one"""
+        if node in self.comments:
+            text = f"{self.comments[node]} {text}"
+        self.comments[node] = text
+
+    def add_nag(self, node: int, nag: int):
+        """Attach a numeric annotation glyph ($1 = !, $2 = ?, ...) to node"""
+        self.nags[node] = self.nags.get(node, ()) + (nag,)
+
+    def parent(self, node: int) -> int:
+        """Return the parent of node (-1 for ROOT)"""
+        return self._parent[node]
+
+    def move(self, node: int) -> chess.Move:
+        """Return the move leading to node"""
+        if node == self.ROOT:
+            raise ValueError('the root node has no move')
+        return unpack_move(self._packed[node])
+
+    def children(self, node: int) -> List[int]:
+        """Return the children of node, main line first"""
+        children = []
+        child = self._first_child[node]
+        while child >= 0:
+            children.append(child)
+            child = self._next_sibling[child]
+        return children
+
+    def path(self, node: int) -> List[int]:
+        """Return the nodes from the first move down to node"""
+        path = []
+        while node != self.ROOT:
+            path.append(node)
+            node = self._parent[node]
+        path.reverse()
+        return path
+
+    def leaves(self) -> List[int]:
+        """Return the last node of every line, the main line first and the rest in PGN order"""
+        leaves = []
+        stack = [self.ROOT]
+        while stack:
+            node = stack.pop()
+            child = self._first_child[node]
+            if child < 0:
+                if node != self.ROOT:
+                    leaves.append(node)
+                continue
+            stack.extend(reversed(self.children(node)))
+        return leaves
+
+    def line(self, node: int) -> MoveSequence:
+        """Return the moves from the starting position to node"""
+        sequence = MoveSequence(self.starting_fen)
+        for step in self.path(node):
+            sequence.append(self.move(step))
+        return sequence
+
+    def line_annotations(self, node: int) -> List[tuple]:
+        """Return (move index, comment) pairs along the line to node, like the parser's annotations"""
+        return [(index, self.comments[step]) for index, step in enumerate(self.path(node))
+                if step in self.comments]
+
+    def mainline(self) -> int:
+        """Return the last node of the main line (ROOT if there are no moves)"""
+        node = self.ROOT
+        while self._first_child[node] >= 0:
+            node = self._first_child[node]
+        return node
+
+    def __len__(self) -> int:
+        """Number of moves in the tree (every node but the root)"""
+        return len(self._parent) - 1
+
+    def __repr__(self) -> str:
+        return f"VariationTree({len(self)} moves, {len(self.leaves())} lines)"
@@ -3,9 +3,15 @@ Text-to-speech narrator for chess theory videos
 Converts text annotations and display text to audio narration
 """
 
+import hashlib
+import json
 import os
+import struct
 import tempfile
-from typing import Optional, List, Tuple
+import wave
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, List, Tuple, Dict, Iterable
 try:
     import pyttsx3
     PYTTSX3_AVAILABLE = True
@@ -19,18 +25,301 @@ except ImportError:
     PYDUB_AVAILABLE = False
 
 
+# Sample rate of assembled narration tracks (mono, 16-bit)
+TRACK_SAMPLE_RATE = 22050
+
+# Narration audio shared by every run on this machine (override with CHESS_NARRATION_CACHE)
+DEFAULT_CACHE_DIR = os.environ.get(
+    'CHESS_NARRATION_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'chess-video', 'narration')
+)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so the same phrase always maps to the same audio"""
+    return ' '.join(text.split())
+
+
+def narration_key(text: str, rate: int, voice_id: int) -> str:
+    """Content hash identifying the audio for text spoken at a rate and voice"""
+    payload = json.dumps([normalize_text(text), rate, voice_id], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class NarrationCache:
+    """On-disk narration audio, addressed by hash(text, rate, voice)"""
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Initialize the cache
+
+        Args:
+            directory: Cache directory (default: DEFAULT_CACHE_DIR)
+        """
+        self.directory = directory or DEFAULT_CACHE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def info_path(path: str) -> str:
+        """Return the sidecar file holding an entry's audio header info"""
+        return os.path.splitext(path)[0] + '.json'
+
+    def path(self, text: str, rate: int, voice_id: int) -> str:
+        """Return where the audio for these inputs lives (whether or not it exists yet)"""
+        key = narration_key(text, rate, voice_id)
+        # Two-level layout keeps directories small for large catalogues
+        return os.path.join(self.directory, key[:2], f'{key}.wav')
+
+    def get(self, text: str, rate: int, voice_id: int) -> Optional[str]:
+        """Return the cached audio path, or None if it has not been synthesized"""
+        path = self.path(text, rate, voice_id)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def reserve(self, text: str, rate: int, voice_id: int) -> Tuple[str, str]:
+        """
+        Return (temporary path, final path) for synthesizing an entry
+
+        Write to the temporary path and pass both to commit(), so readers
+        never see a partially written file.
+        """
+        path = self.path(text, rate, voice_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(suffix='.wav', dir=os.path.dirname(path))
+        os.close(handle)
+        return temp_path, path
+
+    def commit(self, temp_path: str, path: str) -> bool:
+        """Move a synthesized file into place; returns False (and cleans up) if it is empty"""
+        if os.path.exists(temp_path) and os.path.getsize(temp_path) > 0:
+            os.replace(temp_path, path)
+            self._write_info(path, wav_info(path))
+            return True
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+
+    def duration(self, path: str) -> Optional[float]:
+        """
+        Return the duration of a cached entry in seconds
+
+        The duration is read once from the WAV header and kept in a sidecar
+        next to the audio, so later runs never open the audio file at all.
+
+        Returns:
+            Duration, or None if the file is not a readable WAV
+        """
+        try:
+            with open(self.info_path(path), 'r', encoding='utf-8') as f:
+                return json.load(f)['duration']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        info = wav_info(path)
+        self._write_info(path, info)
+        return info['duration'] if info else None
+
+    def _write_info(self, path: str, info: Optional[dict]):
+        """Atomically write an entry's sidecar (nothing is cached for unreadable audio)"""
+        if info is None:
+            return
+        handle, temp_path = tempfile.mkstemp(suffix='.json', dir=os.path.dirname(path))
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+        os.replace(temp_path, self.info_path(path))
+
+    def stats(self) -> dict:
+        """Return hit/miss counters"""
+        return {'hits': self.hits, 'misses': self.misses, 'directory': self.directory}
+
+
+def wav_info(path: str) -> Optional[dict]:
+    """
+    Read the format and length of a WAV file from its RIFF header
+
+    Only the chunk headers are read, never the samples. Any sample format is
+    accepted (PCM, float, WAVE_FORMAT_EXTENSIBLE), and a data chunk whose
+    size was never filled in by a streaming writer is measured from the
+    file size instead.
+
+    Args:
+        path: WAV file
+
+    Returns:
+        Dict with channels, sample_rate, sample_width, frames and duration
+        (seconds), or None if the file is not a readable WAV
+    """
+    try:
+        with open(path, 'rb') as f:
+            riff = f.read(12)
+            if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+                return None
+
+            fmt = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                chunk_id, size = struct.unpack('<4sI', header)
+
+                if chunk_id == b'fmt ':
+                    data = f.read(size + (size & 1))
+                    if len(data) < 16:
+                        return None
+                    _, channels, sample_rate, _, block_align, bits = struct.unpack('<HHIIHH', data[:16])
+                    if not sample_rate or not block_align:
+                        return None
+                    fmt = (channels, sample_rate, bits // 8, block_align)
+                elif chunk_id == b'data':
+                    if fmt is None:
+                        return None
+                    available = os.fstat(f.fileno()).st_size - f.tell()
+                    if size == 0 or size > available:
+                        size = available
+                    channels, sample_rate, sample_width, block_align = fmt
+                    frames = size // block_align
+                    return {
+                        'channels': channels,
+                        'sample_rate': sample_rate,
+                        'sample_width': sample_width,
+                        'frames': frames,
+                        'duration': frames / sample_rate
+                    }
+                else:
+                    # Chunks are word aligned
+                    f.seek(size + (size & 1), os.SEEK_CUR)
+    except OSError:
+        return None
+
+
+def audio_duration(path: str) -> Optional[float]:
+    """Return the duration of a WAV file in seconds (None if it is not a readable WAV)"""
+    info = wav_info(path)
+    return info['duration'] if info else None
+
+
+def read_pcm(path: str, sample_rate: int = TRACK_SAMPLE_RATE) -> np.ndarray:
+    """
+    Read a WAV file as mono 16-bit samples at sample_rate
+
+    Channels are averaged and other rates are resampled by linear
+    interpolation; no more than one clip is ever held in memory.
+
+    Args:
+        path: WAV file
+        sample_rate: Sample rate of the returned samples
+
+    Returns:
+        int16 array of samples
+    """
+    with wave.open(path, 'rb') as audio:
+        channels = audio.getnchannels()
+        width = audio.getsampwidth()
+        rate = audio.getframerate()
+        data = audio.readframes(audio.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128) << 8
+    elif width == 2:
+        samples = np.frombuffer(data, dtype='<i2')
+    elif width == 4:
+        samples = (np.frombuffer(data, dtype='<i4') >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width * 8} bits")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+
+    if rate != sample_rate and len(samples):
+        count = int(round(len(samples) * sample_rate / rate))
+        positions = np.arange(count) * (rate / sample_rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+
+    return samples
+
+
+def mix_track(clips: Iterable[Tuple[float, str]], duration: float,
+              sample_rate: int = TRACK_SAMPLE_RATE) -> np.ndarray:
+    """
+    Place audio clips on a silent track of a fixed length
+
+    Args:
+        clips: (start time in seconds, WAV path) pairs
+        duration: Track length in seconds; clips running past the end are cut
+        sample_rate: Track sample rate
+
+    Returns:
+        int16 array of samples
+    """
+    length = int(round(duration * sample_rate))
+    # Overlapping clips are summed in 32 bits and clipped once at the end
+    track = np.zeros(length, dtype=np.int32)
+    for start, path in clips:
+        offset = int(round(start * sample_rate))
+        if offset >= length:
+            continue
+        samples = read_pcm(path, sample_rate)[:length - offset]
+        track[offset:offset + len(samples)] += samples
+    return np.clip(track, -32768, 32767).astype(np.int16)
+
+
+def write_wav(path: str, samples: np.ndarray, sample_rate: int = TRACK_SAMPLE_RATE):
+    """Write mono 16-bit samples to a WAV file"""
+    with wave.open(path, 'wb') as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(sample_rate)
+        audio.writeframes(samples.astype('<i2').tobytes())
+
+
+def _lookup(texts: Iterable[str], cache: NarrationCache, rate: int,
+            voice_id: int) -> Tuple[Dict[str, str], Dict[str, List[str]]]:
+    """
+    Split texts into cached audio and groups still to be synthesized
+
+    Returns:
+        ({text: cached path}, {cache path: [texts that normalize to it]})
+    """
+    found = {}
+    missing = {}
+    for text in dict.fromkeys(texts):
+        if not text or not text.strip():
+            continue
+        cached = cache.get(text, rate, voice_id)
+        if cached:
+            found[text] = cached
+        else:
+            missing.setdefault(cache.path(text, rate, voice_id), []).append(text)
+    return found, missing
+
+
+def _with_durations(paths: Dict[str, str], cache: NarrationCache) -> Dict[str, dict]:
+    """Attach the exact audio duration (from the cache's header sidecars) to each text's file"""
+    return {text: {'path': path, 'duration': cache.duration(path)} for text, path in paths.items()}
+
+
 class ChessNarrator:
     """Generate narration for chess theory videos"""
 
-    def __init__(self, rate: int = 150, voice_id: int = 0):
+    def __init__(self, rate: int = 150, voice_id: int = 0,
+                 cache: Optional[NarrationCache] = None, engine=None):
         """
         Initialize narrator
 
         Args:
             rate: Speech rate in words per minute (default: 150)
             voice_id: Voice ID (0 for male, 1 for female if available)
+            cache: Narration audio cache (default: a NarrationCache in DEFAULT_CACHE_DIR)
+            engine: Object with the pyttsx3 engine interface (setProperty,
+                    getProperty, save_to_file, runAndWait); defaults to
+                    pyttsx3.init(). Pass a stub to run without a speech backend.
         """
-        if not PYTTSX3_AVAILABLE:
+        if engine is None and not PYTTSX3_AVAILABLE:
             raise ImportError(
                 "pyttsx3 is required for narrator support. "
                 "Install with: pip install pyttsx3"
@@ -38,7 +327,8 @@ class ChessNarrator:
 
         self.rate = rate
         self.voice_id = voice_id
-        self.engine = pyttsx3.init()
+        self.cache = cache
+        self.engine = engine if engine is not None else pyttsx3.init()
         self.engine.setProperty('rate', rate)
         self._set_voice(voice_id)
 
@@ -47,7 +337,7 @@ class ChessNarrator:
         try:
             voices = self.engine.getProperty('voices')
             if voice_id < len(voices):
-                self.engine.setProperty('voices', voices[voice_id].id)
+                self.engine.setProperty('voice', voices[voice_id].id)
         except:
             pass
 
@@ -72,11 +362,11 @@ class ChessNarrator:
 
     def generate_narration(self, text: str, temp_dir: str = None) -> Optional[str]:
         """
-        Generate narration from text
+        Generate narration from text, reusing cached audio for the same text, rate and voice
 
         Args:
             text: Text to narrate
-            temp_dir: Temporary directory for audio file
+            temp_dir: Cache directory for audio files (default: the narrator's cache)
 
         Returns:
             Path to generated audio file or None if failed
@@ -85,25 +375,70 @@ class ChessNarrator:
             return None
 
         try:
-            if temp_dir is None:
-                temp_dir = tempfile.gettempdir()
-
-            # Create temp audio file
-            temp_file = os.path.join(temp_dir, f'narration_{id(text)}.wav')
-
-            if self.text_to_speech(text, temp_file):
-                return temp_file
-            else:
-                return None
+            cache = NarrationCache(temp_dir) if temp_dir else None
+            entry = self.synthesize_batch([text], cache).get(text)
+            return entry['path'] if entry else None
         except Exception as e:
             print(f"Error in generate_narration: {e}")
             return None
 
+    def synthesize_batch(self, texts: Iterable[str],
+                         cache: Optional[NarrationCache] = None) -> Dict[str, dict]:
+        """
+        Narrate many texts in a single engine session
+
+        Every uncached utterance is queued with save_to_file and the engine
+        event loop runs once for the whole batch, instead of once per text.
+
+        Args:
+            texts: Texts to narrate (duplicates and blanks are ignored)
+            cache: Narration cache (default: the narrator's cache)
+
+        Returns:
+            Mapping from text to {'path': audio file, 'duration': seconds}
+            for every text that could be narrated
+        """
+        cache = cache or self._cache()
+        found, missing = _lookup(texts, cache, self.rate, self.voice_id)
+        found.update(self._render_batch(list(missing.values()), cache))
+        return _with_durations(found, cache)
+
+    def _render_batch(self, groups: List[List[str]], cache: NarrationCache) -> Dict[str, str]:
+        """Synthesize one utterance per group of equivalent texts in one runAndWait() call"""
+        queued = []
+        for group in groups:
+            temp_file, path = cache.reserve(group[0], self.rate, self.voice_id)
+            self.engine.save_to_file(normalize_text(group[0]), temp_file)
+            queued.append((group, temp_file, path))
+
+        if not queued:
+            return {}
+
+        try:
+            self.engine.runAndWait()
+        except Exception as e:
+            print(f"Error generating narration: {e}")
+
+        paths = {}
+        for group, temp_file, path in queued:
+            if cache.commit(temp_file, path):
+                for text in group:
+                    paths[text] = path
+        return paths
+
+    def _cache(self) -> NarrationCache:
+        if self.cache is None:
+            self.cache = NarrationCache()
+        return self.cache
+
     @staticmethod
     def estimate_duration(text: str, wpm: int = 150) -> float:
         """
         Estimate narration duration for text
 
+        A word-count guess for planning before any audio exists; once a text
+        is synthesized use audio_duration() or NarrationCache.duration().
+
         Args:
             text: Text to estimate
             wpm: Words per minute (default: 150)
@@ -116,6 +451,70 @@ class ChessNarrator:
         return max(minutes * 60, 2.0)  # Minimum 2 seconds
 
 
+def narration_texts(theory_data: dict) -> List[str]:
+    """Distinct non-empty annotations and display texts of a theory, in order of appearance"""
+    texts = [text for _, text in theory_data.get('annotations', [])]
+    texts += theory_data.get('display_text', [])
+    return list(dict.fromkeys(text for text in texts if text and text.strip()))
+
+
+def synthesize_all(texts: Iterable[str], rate: int = 150, voice_id: int = 0,
+                   cache: Optional[NarrationCache] = None,
+                   workers: Optional[int] = None) -> Dict[str, dict]:
+    """
+    Make sure narration audio exists for every text, synthesizing misses in parallel
+
+    Texts already in the cache (from this theory or any earlier run) are
+    never synthesized again. Each distinct uncached utterance is synthesized
+    once; they are split over a pool of processes, and each process narrates
+    its share in one engine session (see ChessNarrator.synthesize_batch).
+
+    Args:
+        texts: Texts to narrate (duplicates and blanks are ignored)
+        rate: Speech rate in words per minute
+        voice_id: Voice ID
+        cache: Narration cache (default: DEFAULT_CACHE_DIR)
+        workers: Synthesis processes (default: CPU count; 1 synthesizes in-process)
+
+    Returns:
+        Mapping from text to {'path': audio file, 'duration': seconds} for
+        every text that could be narrated
+    """
+    cache = cache or NarrationCache()
+    found, missing = _lookup(texts, cache, rate, voice_id)
+    groups = list(missing.values())
+
+    if groups:
+        workers = min(workers or os.cpu_count() or 1, len(groups))
+        if workers > 1:
+            chunks = [groups[i::workers] for i in range(workers)]
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_tts_worker,
+                                     initargs=(rate, voice_id, cache.directory)) as pool:
+                for paths in pool.map(_render_batch, chunks):
+                    found.update(paths)
+        else:
+            narrator = ChessNarrator(rate=rate, voice_id=voice_id, cache=cache)
+            found.update(narrator._render_batch(groups, cache))
+
+    return _with_durations(found, cache)
+
+
+# Narrator owned by each synthesis worker process, built once by the pool initializer
+_WORKER_NARRATOR = None
+
+
+def _init_tts_worker(rate: int, voice_id: int, cache_dir: str):
+    """Process pool initializer: start this worker's TTS engine once"""
+    global _WORKER_NARRATOR
+    _WORKER_NARRATOR = ChessNarrator(rate=rate, voice_id=voice_id, cache=NarrationCache(cache_dir))
+
+
+def _render_batch(groups: List[List[str]]) -> Dict[str, str]:
+    """Synthesize this worker's share of utterances into the shared cache"""
+    return _WORKER_NARRATOR._render_batch(groups, _WORKER_NARRATOR.cache)
+
+
 class SimpleNarrator:
     """Simple text-to-speech narrator without external dependencies"""
 
@@ -167,7 +566,8 @@ if __name__ == '__main__':
         output_file = "test_narration.wav"
         if narrator.text_to_speech(test_text, output_file):
             print(f"✓ Narration generated: {output_file}")
-            print(f"  Estimated duration: {ChessNarrator.estimate_duration(test_text):.1f} seconds")
+            duration = audio_duration(output_file)
+            print(f"  Duration: {duration:.1f} seconds" if duration else "  Duration: unknown (not a WAV file)")
         else:
             print("✗ Failed to generate narration")
 
@@ -6,8 +6,16 @@ Supports multiple input formats: PGN, UCI, and algebraic notation with annotatio
 import re
 import chess
 import chess.pgn
-from io import StringIO
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Callable, Iterator
+from lexer import (
+    tokenize, Token, STRUCTURED, PGN, ANNOTATED,
+    ANNOTATION, COMMENT, DIRECTIVE, HEADER, MOVE, NAG, RESULT, UNKNOWN,
+    VARIATION_START, VARIATION_END
+)
+from moves import MoveSequence, VariationTree
+from profiling import profiler
+
+UCI_MOVE = re.compile(r'^[a-h][1-8][a-h][1-8][qrbn]?$')
 
 
 class ChessTheoryParser:
@@ -15,12 +23,15 @@ class ChessTheoryParser:
 
     def __init__(self):
         self.board = chess.Board()
-        self.moves = []
+        self.moves = MoveSequence()
         self.annotations = []
         self.timings = {}  # Move index -> duration in seconds
         self.title = ""
         self.description = ""
         self.display_text = []  # List of text to display (independent of moves)
+        self.displays = []  # (moves played before it, text) for each DISPLAY directive
+        self.rejected = []  # Tokens that could not be used, with line/column
+        self.variations = None  # VariationTree of PGN input, including sidelines
 
     def parse_file(self, filepath: str) -> dict:
         """Parse chess theory from a file"""
@@ -28,194 +39,369 @@ class ChessTheoryParser:
             content = f.read()
         return self.parse_text(content)
 
+    def iter_games(self, filepath: str,
+                   header_filter: Optional[Callable[[chess.pgn.Headers], bool]] = None,
+                   skip: int = 0,
+                   limit: Optional[int] = None) -> Iterator[dict]:
+        """
+        Stream the games of a (multi-game) PGN file
+
+        Only one game is held in memory at a time. Games rejected by
+        header_filter or skipped are passed over by reading their headers
+        only; their moves are never parsed.
+
+        Args:
+            filepath: Path to the PGN file
+            header_filter: Called with each game's headers; games for which it
+                           returns False are skipped
+            skip: Number of matching games to skip before yielding
+            limit: Maximum number of games to yield
+
+        Yields:
+            One theory dict per game, in the same shape as parse_text()
+        """
+        yielded = 0
+        with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+            while limit is None or yielded < limit:
+                offset = f.tell()
+                headers = chess.pgn.read_headers(f)
+                if headers is None:
+                    break
+
+                if header_filter is not None and not header_filter(headers):
+                    continue
+                if skip > 0:
+                    skip -= 1
+                    continue
+
+                # Rewind to the start of the game and parse it fully
+                f.seek(offset)
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+
+                self._reset()
+                yield self._load_game(game)
+                yielded += 1
+
+    def index_games(self, filepath: str,
+                    header_filter: Optional[Callable[[chess.pgn.Headers], bool]] = None
+                    ) -> Iterator[Tuple[int, chess.pgn.Headers]]:
+        """
+        Yield the offset and headers of each game in a PGN file without parsing moves
+
+        Args:
+            filepath: Path to the PGN file
+            header_filter: Optional predicate on the headers, as in iter_games()
+
+        Yields:
+            (offset, headers) tuples; pass the offset to parse_game_at()
+        """
+        with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+            while True:
+                offset = f.tell()
+                headers = chess.pgn.read_headers(f)
+                if headers is None:
+                    break
+                if header_filter is None or header_filter(headers):
+                    yield offset, headers
+
+    def parse_game_at(self, filepath: str, offset: int) -> dict:
+        """Parse the single PGN game starting at an offset from index_games()"""
+        with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+            f.seek(offset)
+            game = chess.pgn.read_game(f)
+
+        if game is None:
+            raise ValueError(f"No PGN game at offset {offset} in {filepath}")
+
+        self._reset()
+        return self._load_game(game)
+
     def parse_text(self, text: str) -> dict:
         """Parse chess theory from text and return structured data"""
+        with profiler.stage('parse'):
+            return self._parse_text(text)
+
+    def _parse_text(self, text: str) -> dict:
+        self._reset()
+
+        # One tokenizer pass detects the format and produces the tokens every parser consumes
+        with profiler.stage('lex'):
+            lexed = tokenize(text)
+
+        if lexed.format == STRUCTURED:
+            return self._parse_structured_format(lexed.tokens)
+        elif lexed.format == PGN:
+            return self._parse_pgn_with_comments(lexed.tokens)
+        elif lexed.format == ANNOTATED:
+            return self._parse_annotated_format(lexed.tokens)
+        else:
+            return self._parse_simple_pgn(lexed.tokens, lexed.title_line)
+
+    def _reset(self):
+        """Clear state left over from a previous parse"""
         self.board = chess.Board()
-        self.moves = []
+        self.moves = MoveSequence()
         self.annotations = []
         self.timings = {}
         self.display_text = []
+        self.displays = []
         self.title = ""
         self.description = ""
-
-        # Try to detect format
-        if 'MOVES:' in text.upper() or 'TITLE:' in text.upper():
-            return self._parse_structured_format(text)
-        elif re.search(r'\{[^}]+\}', text):
-            return self._parse_pgn_with_comments(text)
-        elif '-' in text and any(move in text for move in ['e4', 'e5', 'Nf3']):
-            return self._parse_annotated_format(text)
-        else:
-            return self._parse_simple_pgn(text)
-
-    def _parse_structured_format(self, text: str) -> dict:
+        self.rejected = []
+        self.variations = None
+
+    def _reject(self, token: Token, reason: str):
+        """Record a token the parser could not use"""
+        self.rejected.append({
+            'token': token.value,
+            'line': token.line,
+            'column': token.column,
+            'reason': reason
+        })
+
+    def _parse_structured_format(self, tokens: List[Token]) -> dict:
         """Parse structured format with TITLE, DESCRIPTION, MOVES, TEXT, and TIMING markers"""
-        lines = text.strip().split('\n')
-        current_section = None
-        moves_section = []
+        in_moves = False
 
-        for line in lines:
-            line = line.strip()
-            if not line:
+        for token in tokens:
+            if token.kind != DIRECTIVE:
+                if in_moves:
+                    self._consume_movetext(token)
                 continue
 
-            if line.upper().startswith('TITLE:'):
-                self.title = line.split(':', 1)[1].strip()
-            elif line.upper().startswith('DESCRIPTION:'):
-                self.description = line.split(':', 1)[1].strip()
-            elif line.upper().startswith('MOVES:'):
-                current_section = 'moves'
-            elif line.upper().startswith('TEXT:'):
-                annotation = line.split(':', 1)[1].strip()
-                self.annotations.append((len(self.moves), annotation))
-                self.display_text.append(annotation)
-            elif line.upper().startswith('TIMING:'):
+            if token.value == 'TITLE':
+                self.title = token.data
+            elif token.value == 'DESCRIPTION':
+                self.description = token.data
+            elif token.value == 'MOVES':
+                in_moves = True
+            elif token.value == 'TEXT':
+                # Annotates the most recent move (moves are played as they are read)
+                self.annotations.append((max(len(self.moves) - 1, 0), token.data))
+                self.display_text.append(token.data)
+            elif token.value == 'TIMING':
                 # Parse TIMING: move_number duration
                 # Example: TIMING: 1 3 (show move 1 for 3 seconds)
-                timing_part = line.split(':', 1)[1].strip()
+                parts = token.data.split()
                 try:
-                    parts = timing_part.split()
-                    if len(parts) >= 2:
-                        move_num = int(parts[0]) - 1  # Convert to 0-indexed
-                        duration = float(parts[1])
-                        self.timings[move_num] = duration
+                    move_num = int(parts[0]) - 1  # Convert to 0-indexed
+                    duration = float(parts[1])
                 except (ValueError, IndexError):
-                    pass
-            elif line.upper().startswith('DISPLAY:'):
+                    self._reject(token, "TIMING expects '<move number> <seconds>'")
+                    continue
+                self.timings[move_num] = duration
+            elif token.value == 'DISPLAY':
                 # Standalone text display (not tied to a specific move)
-                text_content = line.split(':', 1)[1].strip()
-                self.display_text.append(text_content)
-            elif current_section == 'moves':
-                moves_section.append(line)
-
-        # Parse moves
-        moves_text = ' '.join(moves_section)
-        self._parse_moves_from_text(moves_text)
+                self.display_text.append(token.data)
+                self.displays.append((len(self.moves), token.data))
 
         return self._build_result()
 
-    def _parse_pgn_with_comments(self, text: str) -> dict:
-        """Parse PGN format with comments in curly braces"""
-        try:
-            # Try parsing as PGN
-            pgn = StringIO(text)
-            game = chess.pgn.read_game(pgn)
-
-            if game:
-                # Extract headers
-                self.title = game.headers.get('Event', '')
-                self.description = game.headers.get('Opening', '')
-
-                # Extract moves and comments
-                board = game.board()
-                move_count = 0
-                for node in game.mainline():
-                    move = node.move
-                    self.moves.append({
-                        'san': board.san(move),
-                        'uci': move.uci(),
-                        'from': chess.square_name(move.from_square),
-                        'to': chess.square_name(move.to_square),
-                        'fen': board.fen()
-                    })
-                    board.push(move)
-
-                    if node.comment:
-                        self.annotations.append((move_count, node.comment))
-                    move_count += 1
-
-                return self._build_result()
-        except:
-            pass
-
-        # Fallback to simple parsing
-        return self._parse_simple_pgn(text)
-
-    def _parse_annotated_format(self, text: str) -> dict:
-        """Parse format with move numbers and annotations after dashes"""
-        lines = text.strip().split('\n')
+    def _parse_pgn_with_comments(self, tokens: List[Token]) -> dict:
+        """
+        Parse the first game of PGN text with comments in curly braces
+
+        The main line becomes the moves and annotations; the whole game,
+        variations included, is kept as a VariationTree. An illegal move ends
+        the line it is in (like chess.pgn), but not the lines around it.
+        """
+        headers = {}
+        self.variations = tree = VariationTree()
+        node = tree.ROOT
+        board = self.board  # Position of the line being read
+        stack = []  # (node, board, stopped) of the lines enclosing the current variation
+        stopped = False
+        fresh = False  # In a variation whose first move has not been read yet
+        pending = []  # Comments read before that first move
 
-        for line in lines:
-            line = line.strip()
-            if not line:
+        for token in tokens:
+            kind = token.kind
+
+            if kind == HEADER:
+                if len(tree) or stopped:
+                    break  # Headers of the next game
+                headers[token.value] = token.data
+                if token.value == 'FEN':
+                    try:
+                        self.board = board = chess.Board(token.data)
+                    except ValueError:
+                        self._reject(token, 'invalid FEN header')
+                        continue
+                    self.moves = MoveSequence(board.fen())
+                    self.variations = tree = VariationTree(board.fen())
+            elif kind == VARIATION_START:
+                stack.append((node, board, stopped))
+                if node == tree.ROOT:
+                    self._reject(token, 'variation before the first move')
+                    stopped = True
+                    continue
+                # An alternative to the move just read: resume from the position before it
+                board = board.copy()
+                board.pop()
+                node = tree.parent(node)
+                fresh = True
+            elif kind == VARIATION_END:
+                if not stack:
+                    self._reject(token, 'unmatched variation end')
+                    continue
+                if pending:
+                    tree.comment(node, ' '.join(pending))
+                    pending = []
+                node, board, stopped = stack.pop()
+                fresh = False
+            elif kind == RESULT:
+                if not stack:
+                    break
+            elif stopped:
                 continue
+            elif kind in (COMMENT, ANNOTATION):
+                if not token.value:
+                    continue
+                if fresh:
+                    pending.append(token.value)
+                else:
+                    # Comments before the first move describe the game (the root), not a move
+                    tree.comment(node, token.value)
+                    if not stack and node != tree.ROOT:
+                        self._annotate(len(self.moves) - 1, token.value)
+            elif kind == NAG:
+                if node != tree.ROOT:
+                    tree.add_nag(node, int(token.value[1:]))
+            elif kind == MOVE:
+                move = self._parse_move_token(token.value, board)
+                if move is None:
+                    self._reject(token, 'illegal or ambiguous move')
+                    stopped = True
+                    continue
+                node = tree.add(node, move)
+                board.push(move)
+                fresh = False
+                if pending:
+                    tree.comment(node, ' '.join(pending))
+                    pending = []
+                if not stack:
+                    self.moves.append(move)
+            elif kind == UNKNOWN:
+                self._reject(token, 'not a move')
+
+        self.title = headers.get('Event', '')
+        self.description = headers.get('Opening', '')
+        return self._build_result()
 
-            if line.lower().startswith('opening:'):
-                self.title = line.split(':', 1)[1].strip()
-                continue
+    def _load_game(self, game: chess.pgn.Game) -> dict:
+        """Build the result for a parsed PGN game (main line, comments and variation tree)"""
+        # Extract headers
+        self.title = game.headers.get('Event', '')
+        self.description = game.headers.get('Opening', '')
+
+        # Extract moves and comments (read_game already validated the moves)
+        self.moves = MoveSequence(game.board().fen())
+        for move_count, node in enumerate(game.mainline()):
+            self.moves.append(node.move)
+
+            if node.comment:
+                self.annotations.append((move_count, node.comment))
+
+        self.variations = tree = VariationTree(self.moves.starting_fen)
+        if game.comment:
+            tree.comment(tree.ROOT, game.comment)
+        stack = [(tree.ROOT, game)]
+        while stack:
+            parent, game_node = stack.pop()
+            children = []
+            for variation in game_node.variations:
+                node = tree.add(parent, variation.move)
+                for text in (variation.starting_comment, variation.comment):
+                    if text:
+                        tree.comment(node, text)
+                for nag in sorted(variation.nags):
+                    tree.add_nag(node, nag)
+                children.append((node, variation))
+            stack.extend(reversed(children))
 
-            # Match pattern like "1. e4 - King's pawn opening"
-            match = re.match(r'^\d+\.\s*([a-hO-]+[0-9]?[+#]?)\s*-\s*(.+)$', line)
-            if match:
-                move_san = match.group(1)
-                annotation = match.group(2)
+        return self._build_result()
 
-                try:
-                    move = self.board.parse_san(move_san)
-                    self.moves.append({
-                        'san': move_san,
-                        'uci': move.uci(),
-                        'from': chess.square_name(move.from_square),
-                        'to': chess.square_name(move.to_square),
-                        'fen': self.board.fen()
-                    })
-                    self.board.push(move)
-                    self.annotations.append((len(self.moves) - 1, annotation))
-                except:
+    def _parse_annotated_format(self, tokens: List[Token]) -> dict:
+        """Parse format with move numbers and annotations after dashes"""
+        pending = None  # Move token waiting for its annotation
+
+        for token in tokens:
+            if token.kind == DIRECTIVE and token.value == 'OPENING':
+                self.title = token.data
+            elif token.kind == MOVE:
+                if pending is not None:
+                    self._reject(pending, 'move without annotation')
+                pending = token
+            elif token.kind == ANNOTATION and pending is not None and pending.line == token.line:
+                # Pattern like "1. e4 - King's pawn opening"
+                move = self._parse_move_token(pending.value)
+                if move is None:
+                    self._reject(pending, 'illegal or ambiguous move')
+                    pending = None
                     continue
+                pending = None
+
+                self.moves.append(move)
+                self.board.push(move)
+                self.annotations.append((len(self.moves) - 1, token.value))
+            elif token.kind == UNKNOWN:
+                self._reject(token, 'not a move')
+
+        if pending is not None:
+            self._reject(pending, 'move without annotation')
 
         return self._build_result()
 
-    def _parse_simple_pgn(self, text: str) -> dict:
+    def _parse_simple_pgn(self, tokens: List[Token],
+                          title_line: Optional[Tuple[int, str]] = None) -> dict:
         """Parse simple move notation (PGN or UCI)"""
         # Extract title from first line if it looks like a title
-        lines = text.strip().split('\n')
-        if lines and not any(char.isdigit() for char in lines[0][:10]):
-            self.title = lines[0].strip()
-            text = '\n'.join(lines[1:])
+        skip_line = None
+        if title_line and not any(char.isdigit() for char in title_line[1][:10]):
+            skip_line, self.title = title_line
 
-        self._parse_moves_from_text(text)
-        return self._build_result()
+        for token in tokens:
+            if token.line != skip_line:
+                self._consume_movetext(token)
 
-    def _parse_moves_from_text(self, text: str):
-        """Extract and parse moves from text"""
-        # Remove comments in curly braces
-        text = re.sub(r'\{[^}]+\}', '', text)
+        return self._build_result()
 
-        # Extract all potential moves
-        tokens = text.split()
+    def _consume_movetext(self, token: Token):
+        """Play a MOVE token, reject unrecognized ones, and skip numbers, comments and NAGs"""
+        if token.kind == MOVE:
+            move = self._parse_move_token(token.value)
+            if move is None:
+                self._reject(token, 'illegal or ambiguous move')
+                return
+            self.moves.append(move)
+            self.board.push(move)
+        elif token.kind == UNKNOWN:
+            self._reject(token, 'not a move')
+
+    def _annotate(self, index: int, text: str):
+        """Attach text to a move, joining it with an earlier comment on the same move"""
+        if self.annotations and self.annotations[-1][0] == index:
+            text = f"{self.annotations[-1][1]} {text}"
+            self.annotations[-1] = (index, text)
+        else:
+            self.annotations.append((index, text))
 
-        for token in tokens:
-            token = token.strip('.,;')
-            if not token or token.isdigit() or token.endswith('.'):
-                continue
+    def _parse_move_token(self, token: str,
+                          board: Optional[chess.Board] = None) -> Optional[chess.Move]:
+        """Parse a SAN or UCI token as a legal move in board (default: self.board), or return None"""
+        if board is None:
+            board = self.board
+        if UCI_MOVE.match(token):
+            move = chess.Move.from_uci(token)
+            return move if board.is_legal(move) else None
 
-            try:
-                # Try parsing as SAN
-                move = self.board.parse_san(token)
-                self.moves.append({
-                    'san': self.board.san(move),
-                    'uci': move.uci(),
-                    'from': chess.square_name(move.from_square),
-                    'to': chess.square_name(move.to_square),
-                    'fen': self.board.fen()
-                })
-                self.board.push(move)
-            except:
-                # Try parsing as UCI
-                try:
-                    move = chess.Move.from_uci(token)
-                    if move in self.board.legal_moves:
-                        self.moves.append({
-                            'san': self.board.san(move),
-                            'uci': move.uci(),
-                            'from': chess.square_name(move.from_square),
-                            'to': chess.square_name(move.to_square),
-                            'fen': self.board.fen()
-                        })
-                        self.board.push(move)
-                except:
-                    continue
+        try:
+            return board.parse_san(token)
+        except ValueError:
+            # python-chess raises ValueError subclasses for invalid, illegal and ambiguous SAN
+            return None
 
     def _build_result(self) -> dict:
         """Build the final result dictionary"""
@@ -226,8 +412,11 @@ class ChessTheoryParser:
             'annotations': self.annotations,
             'timings': self.timings,  # Move index -> duration mapping
             'display_text': self.display_text,  # Standalone text displays
-            'starting_fen': chess.Board().fen(),
-            'move_count': len(self.moves)
+            'displays': self.displays,  # DISPLAY texts with the number of moves before them
+            'starting_fen': self.moves.starting_fen,
+            'move_count': len(self.moves),
+            'rejected': self.rejected,  # Unusable tokens: token, line, column, reason
+            'variations': self.variations  # Full move tree of PGN input, None for other formats
         }
 
 
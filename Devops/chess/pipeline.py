@@ -0,0 +1,179 @@
+"""
+Frame pipeline between the renderer and a video encoder
+Frames are drawn in place into pooled encoder-native buffers and encoded on a separate thread
+"""
+
+import queue
+import threading
+import numpy as np
+from encoders import VideoEncoder
+from profiling import profiler
+
+# Frames the encoder queue may hold; 0 encodes on the calling thread
+DEFAULT_QUEUE_SIZE = 4
+
+# How often a blocked stage checks whether the other one has failed (seconds)
+POLL_INTERVAL = 0.1
+
+_STOP = object()
+
+
+class _Aborted(Exception):
+    """Raised inside a stage when the other stage has already failed"""
+
+
+class FramePipeline:
+    """
+    Hand frames drawn in place to an encoder running on its own thread
+
+    Frames live in a fixed pool of preallocated BGR buffers, the layout the
+    encoders take. The renderer takes a free buffer with acquire(), draws
+    straight into it and queues it with submit(); the encoder thread passes
+    the same buffer to the encoder and then returns it to the pool, so no
+    frame is copied or converted on the way. The pool bounds memory: when
+    the encoder falls behind, acquire() blocks until a buffer is free.
+
+    Time each thread spends blocked is recorded as the 'render_wait' and
+    'encode_wait' profiler stages.
+    """
+
+    def __init__(self, encoder: VideoEncoder, queue_size: int = DEFAULT_QUEUE_SIZE):
+        """
+        Initialize the pipeline and start its encoder thread
+
+        Args:
+            encoder: Open encoder the frames are written to (released by release())
+            queue_size: Frames the encoder queue may hold (0 encodes on the calling thread)
+        """
+        self.encoder = encoder
+        self.fps = encoder.fps
+        self.queue_size = max(0, queue_size)
+        width, height = encoder.frame_size
+        self.shape = (height, width, 3)
+
+        self._error = None
+        self._thread = None
+        if not self.queue_size:
+            self._frame = np.empty(self.shape, dtype=np.uint8)
+            return
+
+        # A full queue plus the buffer being drawn and the one being encoded
+        self._free = queue.Queue()
+        for _ in range(self.queue_size + 2):
+            self._free.put(np.empty(self.shape, dtype=np.uint8))
+        self._to_encode = queue.Queue(maxsize=self.queue_size)
+
+        self._thread = threading.Thread(target=self._encode_loop, name='frame-pipeline-encode',
+                                        daemon=True)
+        self._thread.start()
+
+    def acquire(self) -> np.ndarray:
+        """
+        Return a free frame buffer to draw into
+
+        The buffer keeps whatever was last drawn into it. Pass it to submit()
+        once it is complete and do not touch it after that.
+        """
+        if not self.queue_size:
+            return self._frame
+
+        try:
+            with profiler.stage('render_wait'):
+                return self._get(self._free)
+        except _Aborted:
+            raise self._error
+
+    def submit(self, frame: np.ndarray, count: int = 1):
+        """
+        Queue a buffer from acquire() as a run of identical frames
+
+        Args:
+            frame: BGR buffer of shape (height, width, 3) obtained from acquire()
+            count: Number of times the frame is shown
+        """
+        if not self.queue_size:
+            self.encoder.write(frame, count)
+            return
+
+        if count <= 0:
+            self._free.put(frame)
+            return
+
+        try:
+            with profiler.stage('render_wait'):
+                self._put(self._to_encode, (frame, count))
+        except _Aborted:
+            raise self._error
+
+    def write(self, frame: np.ndarray, count: int = 1):
+        """Queue a BGR frame drawn elsewhere (it is copied into a free buffer)"""
+        if count <= 0:
+            return
+        buffer = self.acquire()
+        np.copyto(buffer, frame)
+        self.submit(buffer, count)
+
+    def _get(self, source: queue.Queue):
+        while True:
+            if self._error is not None:
+                raise _Aborted()
+            try:
+                return source.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+
+    def _put(self, target: queue.Queue, item):
+        while True:
+            if self._error is not None:
+                raise _Aborted()
+            try:
+                target.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def _encode_loop(self):
+        try:
+            while True:
+                with profiler.stage('encode_wait'):
+                    item = self._get(self._to_encode)
+                if item is _STOP:
+                    return
+
+                frame, count = item
+                self.encoder.write(frame, count)
+                self._free.put(frame)
+        except BaseException as e:
+            # The rendering thread stops at its next acquire() or submit()
+            self._error = e
+
+    def release(self):
+        """
+        Wait for queued frames to be encoded, then release the encoder
+
+        Raises the encoder thread's error, if any.
+        """
+        try:
+            if self._thread is not None:
+                try:
+                    self._put(self._to_encode, _STOP)
+                except _Aborted:
+                    pass
+                self._thread.join()
+                self._thread = None
+        finally:
+            self.encoder.release()
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def stats(self) -> dict:
+        """Return the encoder's frame/run counters"""
+        return self.encoder.stats()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -0,0 +1,207 @@
+"""
+Per-stage profiling for render runs
+Stages record wall/CPU time, calls, frames and memory; while disabled they cost almost nothing
+"""
+
+import json
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False  # Windows: no getrusage, memory is reported as 0
+
+
+def peak_rss_bytes() -> int:
+    """Return this process's peak resident set size so far (0 if unavailable)"""
+    if not RESOURCE_AVAILABLE:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _NullStage:
+    """Context manager used while profiling is disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """One timed entry into a stage"""
+
+    __slots__ = ('profiler', 'name', 'frames', 'children', 'wall', 'cpu', 'rss')
+
+    def __init__(self, profiler: 'StageProfiler', name: str, frames: int):
+        self.profiler = profiler
+        self.name = name
+        self.frames = frames
+        self.children = 0.0
+
+    def __enter__(self):
+        self.profiler._stack().append(self)
+        self.rss = peak_rss_bytes()
+        self.cpu = time.thread_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        rss = peak_rss_bytes()
+
+        stack = self.profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1].children += wall
+
+        self.profiler._record(self.name, wall, cpu, wall - self.children,
+                              self.frames, rss, rss - self.rss)
+        return False
+
+
+class StageProfiler:
+    """
+    Accumulate per-stage timings for a render run
+
+    Code wraps each stage in ``with profiler.stage(name):``. Stages may nest;
+    wall and CPU time are inclusive, self_wall_seconds excludes time spent in
+    nested stages. CPU time is per thread, so stages running on different
+    threads are measured independently.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start_wall = 0.0
+        self._start_cpu = 0.0
+
+    def enable(self):
+        """Start profiling from a clean slate"""
+        self.reset()
+        self.enabled = True
+
+    def disable(self):
+        """Stop recording (collected stats are kept)"""
+        self.enabled = False
+
+    def reset(self):
+        """Drop all collected stats and restart the run clock"""
+        with self._lock:
+            self._stats = {}
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+    def stage(self, name: str, frames: int = 0):
+        """
+        Return a context manager that times one call of a stage
+
+        Args:
+            name: Stage name (e.g. 'rasterize', 'encode')
+            frames: Frames produced by this call
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, frames)
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, name: str, wall: float, cpu: float, self_wall: float,
+                frames: int, peak_rss: int, rss_growth: int):
+        with self._lock:
+            entry = self._stats.get(name)
+            if entry is None:
+                entry = self._stats[name] = {
+                    'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                    'self_wall_seconds': 0.0, 'frames': 0,
+                    'peak_rss_bytes': 0, 'rss_growth_bytes': 0
+                }
+            entry['calls'] += 1
+            entry['wall_seconds'] += wall
+            entry['cpu_seconds'] += cpu
+            entry['self_wall_seconds'] += self_wall
+            entry['frames'] += frames
+            entry['peak_rss_bytes'] = max(entry['peak_rss_bytes'], peak_rss)
+            entry['rss_growth_bytes'] += rss_growth
+
+    def stats(self) -> Dict[str, dict]:
+        """Return a copy of the raw per-stage stats (picklable, for merge())"""
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._stats.items()}
+
+    def merge(self, stats: Dict[str, dict]):
+        """Add stats collected elsewhere (e.g. in a worker process) into this profiler"""
+        with self._lock:
+            for name, other in stats.items():
+                entry = self._stats.get(name)
+                if entry is None:
+                    self._stats[name] = dict(other)
+                    continue
+                for key, value in other.items():
+                    if key == 'peak_rss_bytes':
+                        entry[key] = max(entry[key], value)
+                    else:
+                        entry[key] += value
+
+    def report(self, extra: Optional[dict] = None) -> dict:
+        """
+        Build the profiling report
+
+        Args:
+            extra: Additional top-level fields (run settings, cache stats, ...)
+
+        Returns:
+            Report dict with run totals and stages sorted by wall time
+        """
+        wall = time.perf_counter() - self._start_wall
+        stages = {}
+        for name, entry in sorted(self.stats().items(), key=lambda item: -item[1]['wall_seconds']):
+            stages[name] = {
+                'calls': entry['calls'],
+                'wall_seconds': round(entry['wall_seconds'], 6),
+                'cpu_seconds': round(entry['cpu_seconds'], 6),
+                'self_wall_seconds': round(entry['self_wall_seconds'], 6),
+                'share_of_run': round(entry['self_wall_seconds'] / wall, 4) if wall else 0.0,
+                'frames': entry['frames'],
+                'peak_rss_bytes': entry['peak_rss_bytes'],
+                'rss_growth_bytes': entry['rss_growth_bytes']
+            }
+
+        report = {
+            'wall_seconds': round(wall, 6),
+            'cpu_seconds': round(time.process_time() - self._start_cpu, 6),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'stages': stages
+        }
+        report.update(extra or {})
+        return report
+
+    def write_report(self, path: str, extra: Optional[dict] = None) -> dict:
+        """Write report() as JSON and return it"""
+        report = self.report(extra)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+# Process-wide profiler used by the parser, renderer, generator and encoders
+profiler = StageProfiler()
@@ -0,0 +1,570 @@
+"""
+Local HTTP render service for chess theory videos
+Queues jobs from an asyncio HTTP server onto a pool of warm worker processes
+"""
+
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+from batch import RENDER_CHOICES, RENDER_DEFAULTS, get_generator, run_job
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Render options a request may set (thumbnails are not served, so that flag is left out)
+SERVICE_OPTIONS = {key: value for key, value in RENDER_DEFAULTS.items() if key != 'thumbnail'}
+
+# Value types of options whose default is None
+OPTION_TYPES = {'crf': int}
+
+# Numeric options that must be above zero, and those that may also be zero
+POSITIVE_OPTIONS = ('duration',)
+NON_NEGATIVE_OPTIONS = ('intro_duration', 'outro_duration', 'crf', 'threads', 'pipeline_queue')
+
+# Frames a request may queue per encoder pipeline (each one is a preallocated frame buffer)
+MAX_PIPELINE_QUEUE = 64
+
+MAX_BODY_BYTES = 1024 * 1024
+MAX_LINE_BYTES = 16 * 1024
+MAX_HEADERS = 100
+REQUEST_TIMEOUT = 30.0
+RETRY_AFTER_SECONDS = 5
+CHUNK_SIZE = 256 * 1024
+
+FINISHED = ('done', 'failed')
+
+
+class HTTPError(Exception):
+    """An error answered with a JSON body and the given status"""
+
+    def __init__(self, status: int, message: str, headers: Optional[dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+def validate_options(options: dict, defaults: Optional[dict] = None) -> dict:
+    """
+    Check request render options and complete them with defaults
+
+    Args:
+        options: Options from the request (same names as the main.py flags)
+        defaults: Options used where the request sets none (default: SERVICE_OPTIONS)
+
+    Returns:
+        Complete option dict
+
+    Raises:
+        ValueError: For unknown options, values of the wrong type or values
+                    outside the choices and ranges main.py accepts
+    """
+    if not isinstance(options, dict):
+        raise ValueError("'options' must be a JSON object")
+
+    unknown = set(options) - set(SERVICE_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown options: {', '.join(sorted(unknown))}")
+
+    for key, value in options.items():
+        default = SERVICE_OPTIONS[key]
+        if value is None and default is None:
+            continue
+        expected = OPTION_TYPES.get(key, type(default))
+        if expected is float and isinstance(value, int):
+            value = float(value)
+        # bool is an int subclass: only bool options take true/false
+        if isinstance(value, bool) != (expected is bool) or not isinstance(value, expected):
+            raise ValueError(f"Option '{key}' must be of type {expected.__name__}")
+        if key in RENDER_CHOICES and value not in RENDER_CHOICES[key]:
+            choices = ', '.join(str(choice) for choice in RENDER_CHOICES[key])
+            raise ValueError(f"Option '{key}' must be one of: {choices}")
+        if key in POSITIVE_OPTIONS and not value > 0:
+            raise ValueError(f"Option '{key}' must be greater than 0")
+        if key in NON_NEGATIVE_OPTIONS and not value >= 0:
+            raise ValueError(f"Option '{key}' must not be negative")
+        if key == 'pipeline_queue' and value > MAX_PIPELINE_QUEUE:
+            raise ValueError(f"Option '{key}' must be at most {MAX_PIPELINE_QUEUE}")
+
+    complete = dict(SERVICE_OPTIONS)
+    complete.update(defaults or {})
+    complete.update(options)
+    return complete
+
+
+# Queue the worker processes report progress on, set by the pool initializer
+_PROGRESS = None
+
+
+def _init_service_worker(progress_queue, defaults: dict):
+    """Process pool initializer: keep the progress queue and warm the default generator"""
+    global _PROGRESS
+    _PROGRESS = progress_queue
+    get_generator(dict(defaults, thumbnail=False))
+
+
+def _warm() -> int:
+    """No-op task that makes the pool start its workers"""
+    return os.getpid()
+
+
+def _run_service_job(job: dict) -> dict:
+    """Render one service job in a worker, reporting progress to the server"""
+    def progress(done: int, total: int):
+        _PROGRESS.put((job['id'], done, total))
+
+    return run_job(job, progress)
+
+
+class RenderService:
+    """
+    Asyncio HTTP server that renders theories on a warm process pool
+
+    Endpoints:
+        POST /jobs              Submit a theory (JSON {"theory": ..., "options": {...}}
+                                or the theory as plain text); 202 with the job,
+                                503 when the queue is full
+        GET  /jobs              All known jobs
+        GET  /jobs/<id>         Job status and progress
+        GET  /jobs/<id>/result  The finished video
+        GET  /health            Queue and worker state
+
+    Jobs wait in a bounded queue (back-pressure) and at most max_concurrency
+    of them render at once. Worker processes live as long as the service, so
+    their generators, sprites and render caches stay warm between jobs.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 workers: Optional[int] = None, max_concurrency: Optional[int] = None,
+                 max_queue: int = 16, output_dir: Optional[str] = None,
+                 keep_results: int = 100, max_body: int = MAX_BODY_BYTES,
+                 defaults: Optional[dict] = None):
+        """
+        Initialize the service
+
+        Args:
+            host: Interface to listen on (loopback by default)
+            port: TCP port (0 picks a free one)
+            workers: Worker processes (default: CPU count)
+            max_concurrency: Jobs rendering at once (default: workers)
+            max_queue: Jobs allowed to wait; further submissions get 503
+            output_dir: Where videos are kept (default: a temporary directory
+                        removed on shutdown)
+            keep_results: Finished jobs kept before the oldest are forgotten
+                          and their videos deleted
+            max_body: Largest accepted request body in bytes
+            defaults: Render options for requests that do not set them
+
+        Raises:
+            ValueError: For a max_queue below 1 (asyncio.Queue treats 0 as
+                        unbounded) or invalid defaults
+        """
+        if max_queue < 1:
+            raise ValueError("max_queue must be at least 1")
+
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.max_concurrency = max_concurrency or self.workers
+        self.max_queue = max_queue
+        self.keep_results = keep_results
+        self.max_body = max_body
+        self.defaults = validate_options(defaults or {})
+
+        self._owns_output_dir = output_dir is None
+        self.output_dir = output_dir or tempfile.mkdtemp(prefix='chess_service_')
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self.jobs = {}  # Job id -> job state, in submission order
+        self.running = 0
+        self._queue = None
+        self._server = None
+        self._pool = None
+        self._progress = None
+        self._progress_thread = None
+        self._dispatchers = []
+
+    async def start(self):
+        """Start the workers, the dispatchers and the HTTP listener"""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.max_queue)
+
+        self._progress = multiprocessing.Queue()
+        self._pool = self._new_pool()
+        # Start every worker now so the first requests do not pay for it
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _warm) for _ in range(self.workers)))
+
+        self._progress_thread = threading.Thread(target=self._read_progress, args=(loop,), daemon=True)
+        self._progress_thread.start()
+
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.max_concurrency)]
+        self._server = await asyncio.start_server(self._handle, self.host, self.port,
+                                                  limit=MAX_LINE_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """Serve requests until cancelled"""
+        await self._server.serve_forever()
+
+    async def close(self):
+        """Stop accepting requests, drop queued jobs and shut the workers down"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+
+        if self._pool is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self._pool.shutdown(wait=True, cancel_futures=True)
+            )
+
+        if self._progress_thread is not None:
+            self._progress.put(None)
+            self._progress_thread.join()
+
+        if self._owns_output_dir:
+            shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def submit(self, text: str, options: Optional[dict] = None) -> dict:
+        """
+        Queue a render job
+
+        Args:
+            text: Theory in any supported input format
+            options: Render options (see validate_options)
+
+        Returns:
+            The job state dict
+
+        Raises:
+            ValueError: For an empty theory or invalid options
+            asyncio.QueueFull: When max_queue jobs are already waiting
+        """
+        if not text or not text.strip():
+            raise ValueError("Empty theory")
+        options = validate_options(options or {}, self.defaults)
+
+        job_id = uuid.uuid4().hex[:12]
+        extension = '.webm' if options['codec'] == 'libvpx-vp9' else '.mp4'
+        job = {
+            'id': job_id,
+            'status': 'queued',
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
+            'frames_done': 0,
+            'frames_total': None,
+            'moves': None,
+            'error': None,
+            'output': os.path.join(self.output_dir, job_id + extension),
+            'options': options
+        }
+        self._queue.put_nowait((job, text))
+        self.jobs[job_id] = job
+        return job
+
+    def describe(self, job: dict) -> dict:
+        """Public view of a job's state"""
+        info = {
+            'id': job['id'],
+            'status': job['status'],
+            'frames_done': job['frames_done'],
+            'frames_total': job['frames_total'],
+            'moves': job['moves'],
+            'error': job['error'],
+            'status_url': f"/jobs/{job['id']}"
+        }
+
+        if job['frames_total']:
+            info['progress'] = round(job['frames_done'] / job['frames_total'], 4)
+        else:
+            info['progress'] = 1.0 if job['status'] == 'done' else 0.0
+
+        if job['status'] == 'queued':
+            queued = [other for other in self.jobs.values() if other['status'] == 'queued']
+            info['queue_position'] = queued.index(job) + 1
+        if job['started']:
+            info['seconds'] = round((job['finished'] or time.time()) - job['started'], 3)
+        if job['status'] == 'done':
+            info['result_url'] = f"/jobs/{job['id']}/result"
+        return info
+
+    def health(self) -> dict:
+        """Queue and worker state"""
+        return {
+            'status': 'ok',
+            'workers': self.workers,
+            'max_concurrency': self.max_concurrency,
+            'running': self.running,
+            'queued': self._queue.qsize(),
+            'max_queue': self.max_queue
+        }
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   initializer=_init_service_worker,
+                                   initargs=(self._progress, self.defaults))
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        """Swap a pool whose worker died for a fresh one (once, however many dispatchers saw it)"""
+        if self._pool is not broken:
+            return
+        print("⚠ A render worker died, restarting the worker pool")
+        self._pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def _dispatch(self):
+        """Feed queued jobs to the pool, one at a time per dispatcher"""
+        loop = asyncio.get_running_loop()
+        while True:
+            job, text = await self._queue.get()
+            job['status'] = 'running'
+            job['started'] = time.time()
+            self.running += 1
+
+            work = {'id': job['id'], 'text': text, 'output': job['output'], 'options': job['options']}
+            pool = self._pool
+            try:
+                result = await loop.run_in_executor(pool, _run_service_job, work)
+            except asyncio.CancelledError:
+                raise
+            except BrokenProcessPool as e:
+                # A worker was killed (e.g. out of memory); later jobs get new workers
+                self._replace_pool(pool)
+                result = {'status': 'failed', 'error': f"Worker failed: {e}"}
+            except Exception as e:
+                result = {'status': 'failed', 'error': f"Worker failed: {e}"}
+            finally:
+                self.running -= 1
+
+            job['finished'] = time.time()
+            if result['status'] == 'ok':
+                job.update(status='done', moves=result['moves'],
+                           frames_done=result['frames'], frames_total=result['frames'])
+            else:
+                job.update(status='failed', error=result['error'])
+            self._prune()
+
+    def _read_progress(self, loop: asyncio.AbstractEventLoop):
+        """Thread relaying worker progress events onto the event loop"""
+        while True:
+            event = self._progress.get()
+            if event is None:
+                return
+            loop.call_soon_threadsafe(self._on_progress, *event)
+
+    def _on_progress(self, job_id: str, done: int, total: int):
+        job = self.jobs.get(job_id)
+        if job is not None and job['status'] == 'running':
+            job['frames_done'] = done
+            job['frames_total'] = total
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond keep_results, deleting their videos"""
+        finished = [job for job in self.jobs.values() if job['status'] in FINISHED]
+        for job in finished[:max(len(finished) - self.keep_results, 0)]:
+            del self.jobs[job['id']]
+            if os.path.exists(job['output']):
+                os.remove(job['output'])
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer one HTTP request per connection"""
+        try:
+            try:
+                method, path, headers, body = await asyncio.wait_for(
+                    self._read_request(reader), REQUEST_TIMEOUT
+                )
+                await self._route(writer, method, path, headers, body)
+            except HTTPError as e:
+                await self._send_json(writer, e.status, {'error': e.message}, e.headers)
+            except asyncio.TimeoutError:
+                await self._send_json(writer, HTTPStatus.REQUEST_TIMEOUT, {'error': 'Request timed out'})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+        """Read a request line, headers and a Content-Length body"""
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                raise ConnectionError("Client closed the connection")
+            parts = request_line.decode('latin-1').split()
+            if len(parts) != 3:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+            method, target, _ = parts
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                if len(headers) >= MAX_HEADERS:
+                    raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many headers")
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+        except ValueError:
+            # StreamReader.readline() raises ValueError for lines over the limit
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request line or header too long")
+
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Chunked bodies are not supported")
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > self.max_body:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            f"Body larger than {self.max_body} bytes")
+
+        body = await reader.readexactly(length) if length > 0 else b''
+        return method.upper(), urlsplit(target).path, headers, body
+
+    async def _route(self, writer: asyncio.StreamWriter, method: str, path: str,
+                     headers: Dict[str, str], body: bytes):
+        parts = [part for part in path.split('/') if part]
+
+        if parts == ['health']:
+            self._require(method, 'GET')
+            await self._send_json(writer, HTTPStatus.OK, self.health())
+
+        elif parts == ['jobs']:
+            self._require(method, 'GET', 'POST')
+            if method == 'GET':
+                await self._send_json(writer, HTTPStatus.OK,
+                                      {'jobs': [self.describe(job) for job in self.jobs.values()]})
+                return
+            job = self._submit_request(headers, body)
+            await self._send_json(writer, HTTPStatus.ACCEPTED, self.describe(job),
+                                  {'Location': f"/jobs/{job['id']}"})
+
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            self._require(method, 'GET')
+            await self._send_json(writer, HTTPStatus.OK, self.describe(self._job(parts[1])))
+
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'result':
+            self._require(method, 'GET')
+            job = self._job(parts[1])
+            if job['status'] == 'failed':
+                raise HTTPError(HTTPStatus.CONFLICT, f"Job failed: {job['error']}")
+            if job['status'] != 'done':
+                raise HTTPError(HTTPStatus.CONFLICT, f"Job is {job['status']}",
+                                {'Retry-After': str(RETRY_AFTER_SECONDS)})
+            await self._send_file(writer, job['output'])
+
+        else:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"No such endpoint: {path}")
+
+    def _submit_request(self, headers: Dict[str, str], body: bytes) -> dict:
+        """Queue the job described by a POST /jobs body"""
+        try:
+            if headers.get('content-type', '').startswith('application/json'):
+                payload = json.loads(body.decode('utf-8'))
+                if not isinstance(payload, dict) or not isinstance(payload.get('theory'), str):
+                    raise ValueError("JSON body must be an object with a 'theory' string")
+                return self.submit(payload['theory'], payload.get('options'))
+            return self.submit(body.decode('utf-8'))
+        except asyncio.QueueFull:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE,
+                            f"Queue is full ({self.max_queue} jobs waiting), retry later",
+                            {'Retry-After': str(RETRY_AFTER_SECONDS)})
+        except (ValueError, UnicodeDecodeError) as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+
+    def _job(self, job_id: str) -> dict:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown job: {job_id}")
+        return job
+
+    @staticmethod
+    def _require(method: str, *allowed: str):
+        if method not in allowed:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed",
+                            {'Allow': ', '.join(allowed)})
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: int, content_type: str,
+                    length: int, headers: Optional[dict] = None, body: bytes = b''):
+        status = HTTPStatus(status)
+        lines = [
+            f'HTTP/1.1 {status.value} {status.phrase}',
+            f'Content-Type: {content_type}',
+            f'Content-Length: {length}',
+            'Connection: close'
+        ]
+        lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: dict,
+                         headers: Optional[dict] = None):
+        body = json.dumps(payload).encode('utf-8')
+        await self._send(writer, status, 'application/json', len(body), headers, body)
+
+    async def _send_file(self, writer: asyncio.StreamWriter, path: str):
+        """Stream a video without holding it in memory"""
+        loop = asyncio.get_running_loop()
+        content_type = 'video/webm' if path.endswith('.webm') else 'video/mp4'
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            await self._send(writer, HTTPStatus.OK, content_type, size,
+                             {'Content-Disposition': f'attachment; filename="{os.path.basename(path)}"'})
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, **options):
+    """
+    Run the render service until interrupted
+
+    Args:
+        host: Interface to listen on
+        port: TCP port
+        **options: RenderService options (workers, max_concurrency, max_queue, ...)
+    """
+    async def run():
+        # Stop as cleanly on SIGTERM (service managers) as on Ctrl+C
+        with contextlib.suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+        service = RenderService(host, port, **options)
+        try:
+            await service.start()
+            print(f"✓ Render service listening on http://{service.host}:{service.port}")
+            print(f"  {service.workers} workers, up to {service.max_concurrency} concurrent jobs, "
+                  f"{service.max_queue} queued")
+            print(f"  Videos are kept in {service.output_dir}")
+            await service.serve_forever()
+        finally:
+            print("Shutting down...")
+            await service.close()
+
+    try:
+        asyncio.run(run())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    print("Render service stopped")
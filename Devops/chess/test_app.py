@@ -47,6 +47,212 @@ def test_parser():
         print(f"✗ Parser test failed: {e}")
         return False
 
+def test_lexer():
+    """Test single-pass tokenizing, format detection and rejected tokens"""
+    print("\nTesting lexer...")
+    try:
+        from lexer import tokenize, STRUCTURED, PGN, ANNOTATED, SIMPLE, MOVE, NAG, COMMENT
+        from parser import ChessTheoryParser
+
+        assert tokenize("TITLE: x\nMOVES:\ne4 e5").format == STRUCTURED
+        assert tokenize("1. e4 {best by test} e5").format == PGN
+        assert tokenize("1. e4 - King's pawn").format == ANNOTATED
+        assert tokenize("d4 d5 c4").format == SIMPLE
+        castling = "1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O Be7"
+        assert tokenize(castling).format == SIMPLE, "Castling dash taken as an annotation"
+        assert ChessTheoryParser().parse_text(castling)['move_count'] == 10
+
+        # Parentheses in a title or prose are not PGN variations
+        annotated = ("Opening: Italian Game (Giuoco Piano)\n\nThe quiet line (no gambit).\n"
+                     "1. e4 - King's pawn\n2. e5 - Symmetry")
+        assert tokenize(annotated).format == ANNOTATED, "Parenthesized title taken as PGN"
+        result = ChessTheoryParser().parse_text(annotated)
+        assert result['title'] == 'Italian Game (Giuoco Piano)' and result['move_count'] == 2
+        simple = "Italian Game (Giuoco Piano)\ne4 e5 Nf3 Nc6 Bc4 Bc5"
+        assert tokenize(simple).format == SIMPLE, "Parenthesized title taken as PGN"
+        result = ChessTheoryParser().parse_text(simple)
+        assert result['title'] == 'Italian Game (Giuoco Piano)' and result['move_count'] == 6
+        assert not result['rejected'], f"Title words rejected: {result['rejected']}"
+        assert tokenize("1. e4 e5 (1... c5) 2. Nf3").format == PGN, "Variation not detected"
+
+        tokens = tokenize("1. Nf3!? {a\ncomment} $1 d5").tokens
+        assert [t.kind for t in tokens] == ['MOVE_NUMBER', MOVE, NAG, COMMENT, NAG, MOVE]
+        assert tokens[2].value == '$5' and tokens[3].value == 'a\ncomment'
+        assert (tokens[5].line, tokens[5].column) == (2, 13), "Wrong token position"
+
+        # Piece moves in the annotated format are no longer dropped
+        result = ChessTheoryParser().parse_text("1. e4 - a\n2. e5 - b\n3. Nf3 - c")
+        assert result['move_count'] == 3, "Annotated piece move not parsed"
+
+        result = ChessTheoryParser().parse_text("1. e4 - ok\n2. e5 - fine\nNf3 Nc6\n3. Bb5 - pin\nzz9")
+        rejected = [(r['token'], r['line'], r['column']) for r in result['rejected']]
+        assert rejected == [('Nf3', 3, 1), ('Nc6', 3, 5), ('zz9', 5, 1)], \
+            f"Annotated format dropped tokens: {rejected}"
+
+        result = ChessTheoryParser().parse_text("Title\ne4 e5 foo\nQh5 Ke3")
+        assert [m['san'] for m in result['moves']] == ['e4', 'e5', 'Qh5']
+        rejected = [(r['token'], r['line'], r['column']) for r in result['rejected']]
+        assert rejected == [('foo', 2, 7), ('Ke3', 3, 5)], f"Unexpected rejections {rejected}"
+
+        print("✓ Lexer working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Lexer test failed: {e}")
+        return False
+
+def test_move_sequence():
+    """Test compact move storage with lazy SAN/FEN"""
+    print("\nTesting move sequence...")
+    try:
+        import pickle
+        import chess
+        from moves import MoveSequence
+
+        sequence = MoveSequence()
+        board = chess.Board()
+        for uci in ['e2e4', 'e7e5', 'g1f3', 'b8c6']:
+            move = chess.Move.from_uci(uci)
+            sequence.append(move)
+            board.push(move)
+
+        assert len(sequence) == 4, "Length incorrect"
+        assert sequence[2]['san'] == 'Nf3', "SAN incorrect"
+        assert sequence[1]['fen'] == 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1', \
+            "FEN should be the position before the move"
+        assert sequence[-1]['from'] == 'b8' and sequence[-1]['to'] == 'c6', "Squares incorrect"
+        assert [m['uci'] for m in sequence[:2]] == ['e2e4', 'e7e5'], "Slicing incorrect"
+        assert sequence.to_list()[0] == {'san': 'e4', 'uci': 'e2e4', 'from': 'e2', 'to': 'e4',
+                                         'fen': chess.STARTING_FEN}, "Dict shape changed"
+
+        promotion = MoveSequence('8/4P3/8/8/8/8/8/k6K w - - 0 1')
+        promotion.append(chess.Move.from_uci('e7e8q'))
+        assert promotion[0]['san'] == 'e8=Q', "Promotion not packed"
+
+        restored = pickle.loads(pickle.dumps(sequence))
+        assert restored[3]['uci'] == 'b8c6', "Pickling lost moves"
+
+        print("✓ Move sequence working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Move sequence test failed: {e}")
+        return False
+
+def test_parser_benchmark():
+    """Test that the benchmark corpora exercise every parse path"""
+    print("\nTesting parser benchmark...")
+    try:
+        from bench_parser import (CORPORA, GATE_MIN_PLIES, calibrate, generate_plies, measure,
+                                  compare_results)
+
+        plies = generate_plies(60)
+        assert plies == generate_plies(60), "Corpus generation is not deterministic"
+
+        report = {'results': [measure(name, CORPORA[name][0](plies), 60, repeat=1,
+                                      calibration=calibrate(plies, runs=1))
+                              for name in CORPORA]}
+        assert {r['path'] for r in report['results']} == {
+            '_parse_structured_format', '_parse_pgn_with_comments',
+            '_parse_annotated_format', '_parse_simple_pgn'
+        }, "Not every parse path benchmarked"
+        assert all(r['plies_per_sec'] > 0 and r['peak_bytes'] > 0 and r['relative_speed'] > 0
+                   for r in report['results'])
+
+        assert compare_results(report, report) == [], "Report regressed against itself"
+        slower = {'results': [dict(r, relative_speed=r['relative_speed'] * 2) for r in report['results']]}
+        assert compare_results(report, slower) == [], "Small cases should only be reported"
+
+        # A slower machine lowers plies/sec but not the speed relative to calibration
+        gated = {'results': [dict(r, plies=GATE_MIN_PLIES) for r in report['results']]}
+        slow_machine = {'results': [dict(r, plies_per_sec=r['plies_per_sec'] * 2) for r in gated['results']]}
+        assert compare_results(gated, slow_machine) == [], "Machine speed taken as a regression"
+        slower = {'results': [dict(r, relative_speed=r['relative_speed'] * 3) for r in gated['results']]}
+        assert len(compare_results(gated, slower)) == len(CORPORA), "Regression not detected"
+
+        print("✓ Parser benchmark working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Parser benchmark test failed: {e}")
+        return False
+
+def test_pgn_stream():
+    """Test streaming games from a multi-game PGN file"""
+    print("\nTesting multi-game PGN streaming...")
+    try:
+        import tempfile
+        from parser import ChessTheoryParser
+
+        pgn = (
+            '[Event "First"]\n[Opening "Italian"]\n\n1. e4 { King pawn } e5 2. Bc4 *\n\n'
+            '[Event "Second"]\n[Opening "Sicilian"]\n\n1. e4 c5 *\n\n'
+            '[Event "Third"]\n[Opening "Italian"]\n\n1. e4 e5 2. Nf3 Nc6 3. Bc4 *\n'
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.pgn', delete=False) as f:
+            f.write(pgn)
+
+        try:
+            parser = ChessTheoryParser()
+            games = list(parser.iter_games(f.name))
+            assert [g['title'] for g in games] == ['First', 'Second', 'Third'], "Games not streamed"
+            assert games[0]['move_count'] == 3, "First game moves incorrect"
+            assert games[0]['annotations'] == [(0, 'King pawn')], "Comment not kept"
+
+            italian = list(parser.iter_games(f.name, header_filter=lambda h: h.get('Opening') == 'Italian'))
+            assert [g['title'] for g in italian] == ['First', 'Third'], "Header filter failed"
+
+            third = list(parser.iter_games(f.name, skip=2, limit=1))
+            assert len(third) == 1 and third[0]['move_count'] == 5, "skip/limit failed"
+
+            offsets = [offset for offset, _ in parser.index_games(f.name)]
+            assert parser.parse_game_at(f.name, offsets[1])['title'] == 'Second', "Offset lookup failed"
+        finally:
+            os.remove(f.name)
+
+        print("✓ PGN streaming working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ PGN streaming test failed: {e}")
+        return False
+
+def test_variation_tree():
+    """Test that PGN variations, comments and NAGs are kept as a move tree"""
+    print("\nTesting variation tree...")
+    try:
+        import pickle
+        from parser import ChessTheoryParser
+
+        pgn = ('[Event "Open games"]\n\n'
+               '1. e4 e5 (1... c5 {Sicilian} 2. Nf3 (2. Nc3) d6) ({French} 1... e6 $6 2. d4 Kxe1 3. a3) '
+               '2. Nf3! Nc6 {Main line} *')
+        result = ChessTheoryParser().parse_text(pgn)
+        tree = result['variations']
+
+        assert [m['san'] for m in result['moves']] == ['e4', 'e5', 'Nf3', 'Nc6'], "Main line incorrect"
+        assert result['annotations'] == [(3, 'Main line')], "Sideline comment leaked into the main line"
+        assert [r['token'] for r in result['rejected']] == ['Kxe1'], "Illegal sideline move not rejected"
+
+        lines = [' '.join(m['san'] for m in tree.line(leaf)) for leaf in tree.leaves()]
+        assert lines == ['e4 e5 Nf3 Nc6', 'e4 c5 Nf3 d6', 'e4 c5 Nc3', 'e4 e6 d4'], f"Lines incorrect: {lines}"
+        assert len(tree) == 10, "Shared moves stored more than once"
+
+        french = tree.leaves()[3]
+        assert tree.line_annotations(french) == [(1, 'French')], "Comment before a variation lost"
+        assert tree.nags[tree.parent(french)] == (6,), "NAG lost"
+        assert tree.nags[tree.path(tree.leaves()[0])[2]] == (1,), "Move suffix not stored as a NAG"
+
+        # Headers alone make it PGN, so the sidelines are not played as main-line moves
+        plain = ChessTheoryParser().parse_text('[Event "x"]\n\n1. d4 d5 (1... Nf6 2. c4) 2. c4 *')
+        assert plain['move_count'] == 3 and len(plain['variations'].leaves()) == 2, "Header PGN misparsed"
+
+        restored = pickle.loads(pickle.dumps(tree))
+        assert restored.comments == tree.comments and len(restored) == len(tree), "Pickling lost nodes"
+        assert ChessTheoryParser().parse_text("e4 e5 Nf3")['variations'] is None
+
+        print("✓ Variation tree working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Variation tree test failed: {e}")
+        return False
+
 def test_renderer():
     """Test the board renderer"""
     print("\nTesting board renderer...")
@@ -71,6 +277,491 @@ def test_renderer():
         print(f"✗ Renderer test failed: {e}")
         return False
 
+def test_sprite_renderer():
+    """Test the sprite compositor backend"""
+    print("\nTesting sprite renderer...")
+    try:
+        from board_renderer import ChessBoardRenderer
+        import chess
+
+        renderer = ChessBoardRenderer(size=400, style='default', backend='sprite')
+        board = chess.Board()
+        board.push_san('e4')
+
+        img = renderer.render_board(board, last_move=board.peek())
+        assert img.size == (400, 400), "Sprite image size incorrect"
+
+        empty = renderer.render_board_array(chess.Board(None))
+        full = renderer.render_board_array(board)
+        assert (empty != full).any(), "Pieces were not composited"
+
+        print("✓ Sprite renderer working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Sprite renderer test failed: {e}")
+        return False
+
+def test_move_animation():
+    """Test sliding-piece animation frames"""
+    print("\nTesting move animation...")
+    try:
+        from board_renderer import ChessBoardRenderer
+        import chess
+        import numpy as np
+
+        renderer = ChessBoardRenderer(size=400, style='default', backend='sprite')
+        board = chess.Board()
+        move = chess.Move.from_uci('e2e4')
+
+        frames = [frame.copy() for frame in renderer.render_move_frames(board, move, 6)]
+        assert len(frames) == 6, "Frame count incorrect"
+        assert (frames[0] != frames[-1]).any(), "Piece did not move"
+
+        board.push(move)
+        assert (frames[-1] == renderer.render_board_array(board)).all(), "Animation does not end on the move"
+
+        # A BGR renderer draws the same pixels with the channels swapped
+        bgr = ChessBoardRenderer(size=400, style='default', backend='sprite', pixel_format='bgr')
+        board.pop()
+        animation = bgr.move_animation(board, move)
+        out = animation.draw(np.empty((400, 400, 3), dtype=np.uint8), 1.0)
+        assert (out == frames[-1][:, :, ::-1]).all(), "BGR animation differs from RGB"
+        board.push(move)
+        assert (bgr.render_board_array(board) == renderer.render_board_array(board)[:, :, ::-1]).all(), \
+            "BGR board differs from RGB"
+
+        print("✓ Move animation working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Move animation test failed: {e}")
+        return False
+
+def test_text_layout():
+    """Test font registry and memoized text layout"""
+    print("\nTesting text layout...")
+    try:
+        from text_layout import fonts, wrap_text, layout_text
+
+        assert fonts.get(24) is fonts.get(24), "Font loaded more than once"
+
+        text = "The Ruy Lopez is one of the oldest and most popular chess openings"
+        lines = wrap_text(text, 24, 200)
+        assert ' '.join(line for line, _ in lines) == text, "Words lost while wrapping"
+        assert all(width <= 200 for _, width in lines if ' ' in _), "Line exceeds max width"
+
+        layout = layout_text(text, 24, 200, 400, top=10, line_height=35, max_lines=2)
+        assert len(layout) == 2, "max_lines not applied"
+        assert layout[1][1] == 45, "Line positions incorrect"
+        assert layout_text(text, 24, 200, 400, top=10, line_height=35, max_lines=2) is layout, \
+            "Layout not memoized"
+
+        print("✓ Text layout working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Text layout test failed: {e}")
+        return False
+
+def test_frame_composer():
+    """Test layer reuse in the preallocated frame composer"""
+    print("\nTesting frame composer...")
+    try:
+        from board_renderer import FrameComposer
+        import numpy as np
+
+        composer = FrameComposer(size=8, band_height=2)
+        board = np.full((8, 8, 3), 1, dtype=np.uint8)
+        band = np.full((2, 8, 3), 2, dtype=np.uint8)
+        band.flags.writeable = False
+
+        frame = composer.compose(board, band)
+        assert frame.shape == (10, 8, 3), "Frame shape incorrect"
+        assert frame[0, 0, 0] == 1 and frame[9, 0, 0] == 2, "Layers not stacked"
+
+        board[...] = 3
+        frame = composer.compose(board, band)
+        assert frame[0, 0, 0] == 3, "Writable board layer not recopied"
+        assert composer.layer_reuses == 1, "Read-only band not reused"
+
+        # Caller buffers track their own layers; a board drawn in place is left alone
+        out = np.zeros((10, 8, 3), dtype=np.uint8)
+        out[:8] = 5
+        composer.compose(None, band, out)
+        assert out[0, 0, 0] == 5 and out[9, 0, 0] == 2, "Band not placed in caller buffer"
+        composer.compose(None, band, out)
+        assert composer.layer_reuses == 2, "Band copied twice into the same buffer"
+
+        print("✓ Frame composer working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Frame composer test failed: {e}")
+        return False
+
+def test_render_cache():
+    """Test the byte-bounded LRU render cache"""
+    print("\nTesting render cache...")
+    try:
+        from board_renderer import RenderCache
+        import numpy as np
+
+        cache = RenderCache(max_bytes=3 * 100)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, np.zeros(100, dtype=np.uint8))
+
+        assert cache.get('a') is not None, "Entry evicted too early"
+        cache.put('d', np.zeros(100, dtype=np.uint8))
+
+        assert cache.get('b') is None, "Least recently used entry not evicted"
+        assert cache.get('a') is not None, "Recently used entry evicted"
+
+        stats = cache.stats()
+        assert stats['bytes'] == 300, "Byte accounting incorrect"
+        assert stats['evictions'] == 1, "Eviction count incorrect"
+        assert stats['hits'] == 2 and stats['misses'] == 1, "Hit/miss counts incorrect"
+
+        print("✓ Render cache working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Render cache test failed: {e}")
+        return False
+
+def test_encoder_runs():
+    """Test that encoders receive runs of held frames"""
+    print("\nTesting encoder frame runs...")
+    try:
+        from encoders import VideoEncoder
+        import numpy as np
+
+        class RecordingEncoder(VideoEncoder):
+            def __init__(self):
+                super().__init__('unused.mp4', 30, (4, 4))
+                self.runs = []
+
+            def _encode_run(self, frame, count):
+                self.runs.append(count)
+
+        encoder = RecordingEncoder()
+        frame = np.zeros((4, 4, 3), dtype=np.uint8)
+        encoder.write(frame, 45)
+        encoder.write_duration(frame, 2.0)
+        encoder.write(frame, 0)
+
+        assert encoder.runs == [45, 60], "Runs not passed through"
+        assert encoder.stats()['frames'] == 105, "Frame count incorrect"
+        assert encoder.stats()['runs'] == 2, "Run count incorrect"
+
+        # ffmpeg gets each run once with its duration and still writes every frame
+        from encoders import FFmpegEncoder, ffmpeg_available
+        if ffmpeg_available():
+            import cv2
+            import tempfile
+            runs = [(0, 1), (200, 45), (40, 1), (120, 7)]
+            with tempfile.TemporaryDirectory() as temp_dir:
+                path = os.path.join(temp_dir, 'runs.mp4')
+                with FFmpegEncoder(path, 30, (64, 48), preset='ultrafast') as ffmpeg_encoder:
+                    for value, count in runs:
+                        ffmpeg_encoder.write(np.full((48, 64, 3), value, dtype=np.uint8), count)
+
+                capture = cv2.VideoCapture(path)
+                decoded = []
+                while True:
+                    ok, image = capture.read()
+                    if not ok:
+                        break
+                    decoded.append(int(round(image.mean() / 40)) * 40)
+                capture.release()
+            expected = [value for value, count in runs for _ in range(count)]
+            assert decoded == expected, "ffmpeg runs not expanded to the right frames"
+
+        print("✓ Encoder runs working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Encoder run test failed: {e}")
+        return False
+
+def test_frame_pipeline():
+    """Test the pooled, threaded render/encode pipeline"""
+    print("\nTesting frame pipeline...")
+    try:
+        from encoders import VideoEncoder
+        from pipeline import FramePipeline
+        import numpy as np
+
+        class RecordingEncoder(VideoEncoder):
+            def __init__(self, fail_after=None):
+                super().__init__('unused.mp4', 30, (4, 2))
+                self.runs = []
+                self.buffers = set()
+                self.fail_after = fail_after
+
+            def _encode_run(self, frame, count):
+                if self.fail_after is not None and len(self.runs) == self.fail_after:
+                    raise RuntimeError("encoder broke")
+                self.runs.append((int(frame[0, 0, 0]), count))
+                self.buffers.add(id(frame))
+
+        for queue_size in (0, 2):
+            encoder = RecordingEncoder()
+            with FramePipeline(encoder, queue_size) as pipeline:
+                for value in range(10):
+                    frame = pipeline.acquire()
+                    frame[...] = value
+                    pipeline.submit(frame, value % 3)
+                pipeline.write(np.full((2, 4, 3), 10, dtype=np.uint8), 3)
+
+            assert encoder.runs == [(1, 1), (2, 2), (4, 1), (5, 2), (7, 1), (8, 2), (10, 3)], \
+                f"Runs out of order: {encoder.runs}"
+            assert len(encoder.buffers) <= queue_size + 2, "Buffers not reused from the pool"
+            assert pipeline.stats()['frames'] == 12, "Frame count incorrect"
+
+        # An encoder failure surfaces in the rendering thread instead of hanging it
+        pipeline = FramePipeline(RecordingEncoder(fail_after=1), 1)
+        try:
+            for _ in range(50):
+                pipeline.submit(pipeline.acquire())
+            pipeline.release()
+            raise AssertionError("Encoder error was swallowed")
+        except RuntimeError as e:
+            assert 'encoder broke' in str(e), f"Wrong error: {e}"
+
+        print("✓ Frame pipeline working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Frame pipeline test failed: {e}")
+        return False
+
+def test_ffmpeg_command():
+    """Test ffmpeg encoder command construction"""
+    print("\nTesting ffmpeg encoder command...")
+    try:
+        from encoders import FFmpegEncoder
+
+        command = FFmpegEncoder.build_command(
+            'out.mp4', 30, 'libx264', 'fast', 20, 4, 'yuv420p'
+        )
+        assert command[-1] == 'out.mp4', "Output path not last"
+        assert command[command.index('-f') + 1] == 'matroska', "Timed frame input missing"
+        assert command[command.index('-r') + 1] == '30', "Output frame rate missing"
+        assert command[command.index('-crf') + 1] == '20', "CRF missing"
+        assert command[command.index('-threads') + 1] == '4', "Threads missing"
+
+        command = FFmpegEncoder.build_command(
+            'out.webm', 30, 'libvpx-vp9', 'fast', 31, 0, 'yuv420p'
+        )
+        assert '-preset' not in command, "VP9 does not take a preset"
+        assert command[command.index('-cpu-used') + 1] == '4', "VP9 preset not mapped"
+        assert command[command.index('-b:v') + 1] == '0', "VP9 constant quality not set"
+
+        print("✓ ffmpeg encoder command built correctly")
+        return True
+    except Exception as e:
+        print(f"✗ ffmpeg command test failed: {e}")
+        return False
+
+def test_profiler():
+    """Test per-stage profiling"""
+    print("\nTesting profiler...")
+    try:
+        import time
+        from profiling import StageProfiler
+
+        profiler = StageProfiler()
+        with profiler.stage('ignored'):
+            pass
+        assert profiler.stats() == {}, "Disabled profiler recorded a stage"
+
+        profiler.enable()
+        with profiler.stage('outer'):
+            for _ in range(3):
+                with profiler.stage('inner', frames=2):
+                    time.sleep(0.01)
+
+        stats = profiler.stats()
+        assert stats['inner']['calls'] == 3 and stats['inner']['frames'] == 6, "Calls/frames wrong"
+        assert stats['outer']['self_wall_seconds'] < stats['inner']['wall_seconds'], \
+            "Nested time not excluded from self time"
+
+        report = profiler.report({'frames': 6})
+        assert list(report['stages']) == ['outer', 'inner'], "Stages not sorted by wall time"
+        assert report['frames'] == 6 and 'peak_rss_bytes' in report['stages']['inner']
+
+        profiler.merge({'inner': dict(stats['inner'])})
+        assert profiler.stats()['inner']['calls'] == 6, "Worker stats not merged"
+
+        print("✓ Profiler working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Profiler test failed: {e}")
+        return False
+
+def test_narration_cache():
+    """Test content-addressed narration caching"""
+    print("\nTesting narration cache...")
+    try:
+        import os
+        import struct
+        import tempfile
+        from narrator import NarrationCache, narration_key, narration_texts, synthesize_all, wav_info
+
+        assert narration_key('Black develops', 150, 0) == narration_key(' Black  develops', 150, 0), \
+            "Whitespace changed the key"
+        assert narration_key('Black develops', 150, 0) != narration_key('Black develops', 180, 0), \
+            "Rate not part of the key"
+        assert narration_key('Black develops', 150, 0) != narration_key('Black develops', 150, 1), \
+            "Voice not part of the key"
+
+        theory = {'annotations': [(0, 'Black develops'), (1, 'White castles'), (2, 'Black develops')],
+                  'display_text': ['White castles', 'Intro']}
+        assert narration_texts(theory) == ['Black develops', 'White castles', 'Intro']
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = NarrationCache(cache_dir)
+            # Pre-synthesized entries are served without starting a TTS engine
+            for text in narration_texts(theory):
+                temp_path, path = cache.reserve(text, 150, 0)
+                with open(temp_path, 'wb') as f:
+                    f.write(b'RIFF')
+                assert cache.commit(temp_path, path), "Commit failed"
+
+            paths = synthesize_all(narration_texts(theory) + ['Black  develops'], cache=cache)
+            assert len(paths) == 4 and cache.misses == 0, "Cached audio was not reused"
+            assert paths['Black develops']['path'] == paths['Black  develops']['path'], \
+                "Same phrase, different audio"
+
+            # Durations come from the header alone: 32-bit float stereo at 24 kHz with
+            # a data size left at 0 by a streaming writer, so the file size is used
+            temp_path, path = cache.reserve('Header only', 150, 0)
+            with open(temp_path, 'wb') as f:
+                f.write(b'RIFF' + struct.pack('<I', 0) + b'WAVE')
+                f.write(b'fmt ' + struct.pack('<IHHIIHH', 16, 3, 2, 24000, 192000, 8, 32))
+                f.write(b'LIST' + struct.pack('<I', 3) + b'abc\x00')
+                f.write(b'data' + struct.pack('<I', 0) + bytes(8 * 12000))
+            assert cache.commit(temp_path, path), "Commit failed"
+            assert wav_info(path)['frames'] == 12000, "Frame count not read from the header"
+            assert os.path.exists(cache.info_path(path)), "Duration not cached next to the audio"
+            os.remove(path)
+            assert cache.duration(path) == 0.5, "Cached duration not used"
+
+        print("✓ Narration cache working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Narration cache test failed: {e}")
+        return False
+
+class StubSpeechEngine:
+    """pyttsx3-compatible engine writing silent WAVs (0.1s per word) for headless tests"""
+
+    def __init__(self):
+        self.properties = {}
+        self.queue = []
+        self.sessions = 0
+
+    def setProperty(self, name, value):
+        self.properties[name] = value
+
+    def getProperty(self, name):
+        return [] if name == 'voices' else self.properties.get(name)
+
+    def save_to_file(self, text, path):
+        self.queue.append((text, path))
+
+    def runAndWait(self):
+        import wave
+        self.sessions += 1
+        for text, path in self.queue:
+            with wave.open(path, 'wb') as audio:
+                audio.setnchannels(1)
+                audio.setsampwidth(2)
+                audio.setframerate(16000)
+                audio.writeframes(b'\x00\x00' * 1600 * len(text.split()))
+        self.queue = []
+
+def test_batch_tts():
+    """Test single-session batch narration with a stub engine"""
+    print("\nTesting batch TTS...")
+    try:
+        import tempfile
+        from narrator import ChessNarrator, NarrationCache
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            engine = StubSpeechEngine()
+            narrator = ChessNarrator(rate=150, cache=NarrationCache(cache_dir), engine=engine)
+
+            texts = ['Black develops', 'White castles kingside', 'Black  develops', '']
+            audio = narrator.synthesize_batch(texts)
+            assert engine.sessions == 1, f"Expected one engine session, got {engine.sessions}"
+            assert set(audio) == {'Black develops', 'White castles kingside', 'Black  develops'}
+            assert abs(audio['White castles kingside']['duration'] - 0.3) < 1e-6, "Duration not measured"
+            assert audio['Black develops']['path'] == audio['Black  develops']['path'], \
+                "Equivalent texts synthesized twice"
+
+            again = narrator.synthesize_batch(texts + ['New idea'])
+            assert engine.sessions == 2 and len(again) == 4, "Cached texts not reused"
+            assert narrator.generate_narration('White castles kingside') == \
+                audio['White castles kingside']['path'] and engine.sessions == 2
+
+        print("✓ Batch TTS working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Batch TTS test failed: {e}")
+        return False
+
+def test_narration_track():
+    """Test aligning narration clips to segments in one PCM track"""
+    print("\nTesting narration track...")
+    try:
+        import tempfile
+        import os
+        import wave
+        import numpy as np
+        from parser import ChessTheoryParser
+        from narrator import read_pcm, write_wav, TRACK_SAMPLE_RATE
+        from video_generator import ChessVideoGenerator, NARRATION_LEAD
+        from encoders import FFmpegEncoder
+
+        data = ChessTheoryParser().parse_text(
+            "TITLE: Test\nDISPLAY: Welcome\nMOVES:\ne4 e5\nTEXT: Symmetry\nDISPLAY: The end"
+        )
+        generator = ChessVideoGenerator(size=200, fps=10)
+        segments = generator.plan_segments(data, move_duration=1.0)
+        assert [s['narration'] for s in segments] == [['Welcome'], [], ['Symmetry'], ['The end']], \
+            "Narration not placed on the right segments"
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # 3 s of full-scale tone at 8 kHz stereo: longer than the 1 s move it narrates
+            tone = os.path.join(temp_dir, 'tone.wav')
+            with wave.open(tone, 'wb') as audio:
+                audio.setnchannels(2)
+                audio.setsampwidth(2)
+                audio.setframerate(8000)
+                audio.writeframes(np.full(2 * 24000, 10000, dtype='<i2').tobytes())
+            assert len(read_pcm(tone)) == 3 * TRACK_SAMPLE_RATE, "Clip not resampled"
+
+            stretched = generator.fit_narration(segments, {'Symmetry': {'path': tone, 'duration': 3.0}})
+            assert stretched == 1 and segments[2]['duration'] > 3.0, "Move not stretched to its narration"
+
+            frames = generator.schedule(segments)
+            assert frames == segments[-1]['start_frame'] + segments[-1]['frames'], "Timeline not contiguous"
+            track = generator.narration_track(segments)
+            assert len(track) == frames * TRACK_SAMPLE_RATE // 10, "Track length differs from video"
+
+            start = int(segments[2]['start_frame'] / 10 * TRACK_SAMPLE_RATE
+                        + NARRATION_LEAD * TRACK_SAMPLE_RATE)
+            assert not track[:start - 1].any() and track[start + 1] == 10000, "Clip not aligned to its move"
+
+            path = os.path.join(temp_dir, 'track.wav')
+            write_wav(path, track)
+            assert np.array_equal(read_pcm(path), track), "Track WAV round trip failed"
+
+        command = FFmpegEncoder.build_command('out.webm', 30, 'libvpx-vp9', 'fast',
+                                              31, 0, 'yuv420p', audio_path='track.wav')
+        assert command[command.index('-c:a') + 1] == 'libopus', "Audio not muxed in the encoder pass"
+
+        print("✓ Narration track working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Narration track test failed: {e}")
+        return False
+
 def test_video_generator():
     """Test video generation capabilities"""
     print("\nTesting video generator initialization...")
@@ -87,6 +778,372 @@ def test_video_generator():
         print(f"✗ Video generator test failed: {e}")
         return False
 
+def test_segment_plan():
+    """Test splitting a theory into independent segments"""
+    print("\nTesting segment planning...")
+    try:
+        from parser import ChessTheoryParser
+        from video_generator import ChessVideoGenerator
+
+        data = ChessTheoryParser().parse_text("Opening: Test\n1. e4 - First\n2. e5 - Second")
+        generator = ChessVideoGenerator(size=400, fps=30)
+        segments = generator.plan_segments(data, move_duration=2.0)
+
+        kinds = [segment['kind'] for segment in segments]
+        assert kinds == ['intro', 'move', 'move', 'outro'], "Segment kinds incorrect"
+        assert segments[2]['fen'].split()[1] == 'b', "Second move should start with Black to move"
+        assert segments[1]['annotation'] == "First", "Annotation not attached"
+
+        print("✓ Segment planning working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Segment planning test failed: {e}")
+        return False
+
+def test_draft_timeline():
+    """Test that a draft render keeps the final video's timeline"""
+    print("\nTesting draft timeline...")
+    try:
+        from parser import ChessTheoryParser
+        from video_generator import ChessVideoGenerator, draft_fps
+
+        assert [draft_fps(fps) for fps in (24, 30, 60)] == [8, 10, 10], "Draft frame rates incorrect"
+
+        data = ChessTheoryParser().parse_text(
+            "Opening: Test\n1. e4 - First\n2. e5 - Second\n3. Nf3 - Third\nTIMING: 2 1.37")
+        final = ChessVideoGenerator(size=800, fps=30)
+        draft = ChessVideoGenerator(size=800, fps=30, draft=True)
+        assert draft.frame_size() == (400, 500) and draft.fps == 10, "Draft size/fps not reduced"
+        assert draft.renderer.backend == 'sprite', "Draft should use the sprite renderer"
+        assert ChessVideoGenerator(**draft.worker_config()).worker_config() == draft.worker_config(), \
+            "Draft worker config does not round-trip"
+
+        final_segments = final.plan_segments(data, move_duration=1.55)
+        draft_segments = draft.plan_segments(data, move_duration=1.55)
+        final_total = final.schedule(final_segments)
+        draft_total = draft.schedule(draft_segments)
+
+        assert abs(final_total / 30 - draft_total / 10) <= 0.05, "Draft length differs"
+        for ours, theirs in zip(draft_segments, final_segments):
+            assert abs(ours['start_frame'] / 10 - theirs['start_frame'] / 30) <= 0.05, \
+                "Draft segment starts drift from the final timeline"
+        assert sum(segment['frames'] for segment in draft_segments) == draft_total, "Segments overlap"
+
+        print("✓ Draft timeline working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Draft timeline test failed: {e}")
+        return False
+
+def test_segment_cache():
+    """Test that only segments with changed inputs are re-rendered"""
+    print("\nTesting segment cache...")
+    try:
+        import tempfile
+        import os
+        from parser import ChessTheoryParser
+        from video_generator import ChessVideoGenerator, SegmentCache
+
+        theory = "Opening: Test\n\n1. e4 - King's pawn\n2. e5 - Symmetry\n3. Nf3 - Knight out"
+        edited = theory.replace('Symmetry', 'Symmetric reply')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = SegmentCache(os.path.join(temp_dir, 'segments'))
+            generator = ChessVideoGenerator(size=120, fps=5, renderer_backend='sprite',
+                                            encoder='opencv', segment_cache=cache)
+            output = os.path.join(temp_dir, 'out.mp4')
+
+            generator.generate_video(ChessTheoryParser().parse_text(theory), output, move_duration=1.0)
+            assert cache.misses == 5 and cache.hits == 0, "First render should render every segment"
+
+            cache.hits = cache.misses = 0
+            generator.generate_video(ChessTheoryParser().parse_text(edited), output, move_duration=1.0)
+            assert cache.hits == 4 and cache.misses == 1, "Only the edited move should be re-rendered"
+            assert os.path.getsize(output) > 0, "Output not assembled"
+
+            segments = generator.plan_segments(ChessTheoryParser().parse_text(theory))
+            generator.schedule(segments)
+            segment = segments[1]
+            other = ChessVideoGenerator(size=120, fps=5, style='wood', renderer_backend='sprite',
+                                        encoder='opencv')
+            assert generator.segment_key(segment) != other.segment_key(segment), "Style not in the key"
+            assert generator.segment_key(segment) == generator.segment_key(dict(segment, index=9)), \
+                "Bookkeeping fields changed the key"
+
+            # 'auto' is keyed by the backend it resolves to, so OpenCV and ffmpeg segments never mix
+            def key(encoder, **options):
+                return ChessVideoGenerator(size=120, fps=5, renderer_backend='sprite', encoder=encoder,
+                                           encoder_options=options).segment_key(segment)
+            missing = 'no-such-ffmpeg'
+            assert key('auto', ffmpeg_binary=missing) == key('opencv', ffmpeg_binary=missing), \
+                "Auto without ffmpeg not keyed as OpenCV"
+            assert key('auto', ffmpeg_binary=sys.executable) == key('ffmpeg', ffmpeg_binary=sys.executable), \
+                "Auto with ffmpeg not keyed as ffmpeg"
+            assert key('ffmpeg', codec='libx265') != key('ffmpeg'), "Codec not in the key"
+
+        print("✓ Segment cache working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Segment cache test failed: {e}")
+        return False
+
+def test_branch_videos():
+    """Test that branch videos reuse the segments of the moves they share"""
+    print("\nTesting branch videos...")
+    try:
+        import tempfile
+        from parser import ChessTheoryParser
+        from video_generator import ChessVideoGenerator, SegmentCache
+
+        theory = ChessTheoryParser().parse_text(
+            '[Event "Test"]\n\n1. e4 e5 2. Nf3 (2. Bc4 Nf6) Nc6 *')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = SegmentCache(os.path.join(temp_dir, 'segments'))
+            generator = ChessVideoGenerator(size=120, fps=5, renderer_backend='sprite',
+                                            encoder='opencv', segment_cache=cache)
+            branches = generator.generate_branches(theory, os.path.join(temp_dir, 'test.mp4'),
+                                                   move_duration=1.0)
+
+            assert [b['line'] for b in branches] == ['e4 e5 Nf3 Nc6', 'e4 e5 Bc4 Nf6'], "Branches incorrect"
+            assert branches[1]['output'].endswith('test_02.mp4'), "Branch output name incorrect"
+            assert all(os.path.getsize(b['output']) > 0 for b in branches), "Branch not written"
+            # Intro, 1. e4 and 1... e5 come from the first branch
+            assert cache.hits == 3 and cache.misses == 9, f"Shared prefix re-rendered: {cache.stats()}"
+
+        print("✓ Branch videos working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Branch video test failed: {e}")
+        return False
+
+def test_batch_jobs():
+    """Test building batch jobs from a manifest"""
+    print("\nTesting batch job loading...")
+    try:
+        import json
+        import tempfile
+        from batch import load_jobs
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manifest = os.path.join(temp_dir, 'manifest.json')
+            with open(manifest, 'w') as f:
+                json.dump([
+                    {'input': 'a.txt', 'output': 'out/a.mp4', 'options': {'style': 'wood'}},
+                    {'input': 'b.pgn'}
+                ], f)
+
+            jobs = load_jobs(manifest, defaults={'size': 600})
+
+            assert len(jobs) == 2, "Expected 2 jobs"
+            assert jobs[0]['output'] == os.path.join(temp_dir, 'out', 'a.mp4'), "Output not resolved"
+            assert jobs[0]['options']['style'] == 'wood', "Job option not applied"
+            assert jobs[1]['options']['size'] == 600, "Default option not applied"
+            assert jobs[1]['output'].endswith('b.mp4'), "Default output name incorrect"
+
+        # Warm generators are kept per option set, but only the most recent few
+        import batch
+        batch._GENERATORS.clear()
+        styles = ['default', 'wood', 'marble', 'blue', 'green']
+        first = batch.get_generator(dict(batch.RENDER_DEFAULTS, style=styles[0]))
+        for style in styles[1:]:
+            batch.get_generator(dict(batch.RENDER_DEFAULTS, style=style))
+        assert len(batch._GENERATORS) == batch.MAX_GENERATORS, "Generator cache not bounded"
+        assert batch.get_generator(dict(batch.RENDER_DEFAULTS, style='green')) is \
+            batch.get_generator(dict(batch.RENDER_DEFAULTS, style='green')), "Generator not reused"
+        assert batch.get_generator(dict(batch.RENDER_DEFAULTS, style='default')) is not first, \
+            "Least recently used generator not evicted"
+        batch._GENERATORS.clear()
+
+        print("✓ Batch job loading working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Batch job test failed: {e}")
+        return False
+
+def test_transposition_cache():
+    """Test that a batch renders a shared opening's boards and transitions once"""
+    print("\nTesting transposition cache...")
+    try:
+        import chess
+        import tempfile
+        import numpy as np
+        from batch import transposition_summary
+        from board_renderer import ChessBoardRenderer
+        from transpositions import TranspositionCache
+
+        a, b = chess.Board(), chess.Board()
+        for move in ('Nf3', 'Nf6', 'e4'):
+            a.push_san(move)
+        for move in ('e4', 'Nf6', 'Nf3'):
+            b.push_san(move)
+        assert TranspositionCache.key('board', a, 120) == TranspositionCache.key('board', b, 120), \
+            "Transposed positions keyed differently"
+        assert TranspositionCache.key('board', a, 120) != TranspositionCache.key('board', a, 240), \
+            "Size not part of the key"
+
+        def workers(temp_dir, count, **options):
+            """Renderers standing in for batch workers sharing one cache directory"""
+            return [ChessBoardRenderer(size=120, backend='sprite', pixel_format='bgr',
+                                       transpositions=TranspositionCache(temp_dir, **options))
+                    for _ in range(count)]
+
+        move = chess.Move.from_uci('e2e4')
+        with tempfile.TemporaryDirectory() as temp_dir:
+            first, second, third = workers(temp_dir, 3)
+            expected = first.render_board_array(a, last_move=move)
+            first.render_board_array(b, last_move=move)
+            list(first.render_move_frames(chess.Board(), move, 3))
+            assert first.transpositions.stats()['bytes_written'] == 0, "Entry seen once was written"
+            assert first.transpositions.stats()['board_reused'] == 1, "Memory cache reuse not counted"
+
+            # The second rendering of a position stores it, the third loads it
+            for renderer in (second, third):
+                assert np.array_equal(renderer.render_board_array(b, last_move=move), expected), \
+                    "Shared board differs"
+                list(renderer.render_move_frames(chess.Board(), move, 3))
+            assert second.transpositions.stats()['bytes_written'] > 0, "Repeated entry not written"
+            stats = third.transpositions.stats()
+            assert (stats['board_hits'], stats['transition_hits']) == (1, 1), f"Not reused: {stats}"
+            assert stats['bytes_written'] == 0, "Shared entries rendered again"
+
+            summary = transposition_summary([{'transpositions': r.transpositions.stats()}
+                                             for r in (first, second, third)] + [{}])
+            assert (summary['board_saved'], summary['transition_saved']) == (2, 1), summary
+            assert summary['dedup_ratio'] == 0.4286, f"Dedup ratio incorrect: {summary}"
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for renderer in workers(temp_dir, 2, max_bytes=0):
+                renderer.render_board_array(a, last_move=move)
+                assert renderer.transpositions.stats()['bytes_written'] == 0, "Byte budget exceeded"
+
+        # A failed write (disk full) leaves no temporary file and does not fail the render
+        import transpositions
+
+        def full_disk(f, array):
+            f.write(b'partial')
+            raise OSError(28, 'No space left on device')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            seen, renderer = workers(temp_dir, 2)
+            seen.render_board_array(a, last_move=move)
+            list(seen.render_move_frames(chess.Board(), move, 3))
+            save, transpositions.np.save = transpositions.np.save, full_disk
+            try:
+                assert np.array_equal(renderer.render_board_array(a, last_move=move), expected), \
+                    "Render failed on a cache write error"
+                list(renderer.render_move_frames(chess.Board(), move, 3))
+            finally:
+                transpositions.np.save = save
+            assert renderer.transpositions.stats()['write_errors'] == 2, "Write errors not counted"
+            assert all(name.endswith('.seen') for _, _, files in os.walk(temp_dir) for name in files), \
+                "Temporary file left behind"
+
+        print("✓ Transposition cache working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Transposition cache test failed: {e}")
+        return False
+
+def test_render_service():
+    """Test the HTTP render service end to end on an ephemeral port"""
+    print("\nTesting render service...")
+    try:
+        import asyncio
+        import json
+        from server import RenderService
+
+        async def request(port, method, path, body=b'', content_type='application/json'):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                         f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n"
+                         .encode() + body)
+            response = await reader.read()
+            writer.close()
+            head, _, payload = response.partition(b'\r\n\r\n')
+            return int(head.split()[1]), payload
+
+        try:
+            RenderService(port=0, max_queue=0)
+            raise AssertionError("Unbounded queue accepted")
+        except ValueError:
+            pass
+
+        async def scenario():
+            options = {'size': 600, 'fps': 24, 'renderer': 'sprite', 'encoder': 'opencv',
+                       'intro_duration': 0.1, 'outro_duration': 0.1, 'duration': 0.1}
+            service = RenderService(port=0, workers=1, max_queue=1, defaults=options)
+            await service.start()
+            try:
+                status, _ = await request(service.port, 'POST', '/jobs',
+                                          json.dumps({'theory': '1. e4 e5', 'options': {'bogus': 1}}).encode())
+                assert status == 400, "Unknown option accepted"
+                for bad in ({'size': 20000}, {'fps': 1000}, {'codec': 'gif'},
+                            {'duration': 0}, {'threads': -1}, {'pipeline_queue': 10 ** 9}):
+                    status, _ = await request(service.port, 'POST', '/jobs',
+                                              json.dumps({'theory': '1. e4', 'options': bad}).encode())
+                    assert status == 400, f"Out-of-range option accepted: {bad}"
+
+                status, body = await request(service.port, 'POST', '/jobs', b'1. e4 e5 2. Nf3',
+                                             content_type='text/plain')
+                assert status == 202, f"Submission refused: {status}"
+                job_id = json.loads(body)['id']
+
+                for _ in range(300):
+                    status, body = await request(service.port, 'GET', f'/jobs/{job_id}')
+                    job = json.loads(body)
+                    if job['status'] in ('done', 'failed'):
+                        break
+                    await asyncio.sleep(0.1)
+                assert job['status'] == 'done', f"Job did not finish: {job}"
+                assert job['progress'] == 1.0 and job['moves'] == 3, "Progress not reported"
+
+                status, video = await request(service.port, 'GET', f'/jobs/{job_id}/result')
+                assert status == 200 and len(video) > 0, "Result not served"
+                assert (await request(service.port, 'GET', '/jobs/missing'))[0] == 404
+
+                async def finish(job):
+                    for _ in range(300):
+                        if job['status'] in ('done', 'failed'):
+                            return job['status']
+                        await asyncio.sleep(0.1)
+
+                # Draft renders are available to service requests
+                status, body = await request(service.port, 'POST', '/jobs', json.dumps(
+                    {'theory': '1. e4 e5', 'options': {'draft': True}}).encode())
+                assert status == 202, f"Draft option refused: {status} {body}"
+                draft = service.jobs[json.loads(body)['id']]
+                assert await finish(draft) == 'done' and draft['options']['draft'] is True, \
+                    "Draft job not rendered"
+                status, _ = await request(service.port, 'POST', '/jobs', json.dumps(
+                    {'theory': '1. e4', 'options': {'size': True}}).encode())
+                assert status == 400, "Boolean accepted for a numeric option"
+
+                # A killed worker fails its job; the pool is replaced for the next one
+                for process in list(service._pool._processes.values()):
+                    process.kill()
+                    process.join()
+                assert await finish(service.submit('1. d4')) == 'failed', "Dead worker not reported"
+                assert await finish(service.submit('1. d4')) == 'done', "Worker pool not restarted"
+
+                # Back-pressure: the second job waiting in a one-slot queue is refused
+                service.submit('1. d4')
+                try:
+                    service.submit('1. c4')
+                    raise AssertionError("Full queue accepted a job")
+                except asyncio.QueueFull:
+                    pass
+            finally:
+                await service.close()
+
+        asyncio.run(scenario())
+
+        print("✓ Render service working correctly")
+        return True
+    except Exception as e:
+        print(f"✗ Render service test failed: {e}")
+        return False
+
 def test_integration():
     """Test full integration"""
     print("\nTesting integration...")
@@ -116,8 +1173,32 @@ def main():
     tests = [
         test_imports,
         test_parser,
+        test_lexer,
+        test_move_sequence,
+        test_parser_benchmark,
+        test_pgn_stream,
+        test_variation_tree,
         test_renderer,
+        test_sprite_renderer,
+        test_move_animation,
+        test_text_layout,
+        test_frame_composer,
+        test_render_cache,
+        test_encoder_runs,
+        test_frame_pipeline,
+        test_ffmpeg_command,
+        test_profiler,
+        test_narration_cache,
+        test_batch_tts,
+        test_narration_track,
         test_video_generator,
+        test_segment_plan,
+        test_draft_timeline,
+        test_segment_cache,
+        test_branch_videos,
+        test_batch_jobs,
+        test_transposition_cache,
+        test_render_service,
         test_integration
     ]
 
@@ -0,0 +1,125 @@
+"""
+Font registry and text layout for chess theory videos
+Fonts are resolved once per process and wrapped layouts are memoized
+"""
+
+from functools import lru_cache
+from PIL import ImageFont
+from typing import List, Optional, Tuple
+
+
+class FontRegistry:
+    """Resolve a font file once and load each size once per process"""
+
+    CANDIDATES = [
+        "/System/Library/Fonts/Helvetica.ttc",
+        "arial.ttf",
+    ]
+
+    def __init__(self, candidates: Optional[List[str]] = None):
+        """
+        Initialize the registry
+
+        Args:
+            candidates: Font files to try in order (default: CANDIDATES)
+        """
+        self.candidates = candidates or self.CANDIDATES
+        self._path = None
+        self._resolved = False
+        self._fonts = {}
+
+    def _resolve(self) -> Optional[str]:
+        """Find the first candidate font that loads (None means the PIL default font)"""
+        if not self._resolved:
+            for path in self.candidates:
+                try:
+                    ImageFont.truetype(path, 12)
+                except OSError:
+                    continue
+                self._path = path
+                break
+            self._resolved = True
+        return self._path
+
+    def get(self, size: int) -> ImageFont.ImageFont:
+        """Return the font at the given size"""
+        font = self._fonts.get(size)
+        if font is None:
+            path = self._resolve()
+            font = ImageFont.truetype(path, size) if path else ImageFont.load_default()
+            self._fonts[size] = font
+        return font
+
+
+# Process-wide registry used by the renderer and video generator
+fonts = FontRegistry()
+
+
+@lru_cache(maxsize=4096)
+def wrap_text(text: str, font_size: int, max_width: int) -> Tuple[Tuple[str, int], ...]:
+    """
+    Greedily wrap text into lines no wider than max_width
+
+    Each word is measured once, so wrapping is linear in the text length. A
+    single word wider than max_width gets a line of its own.
+
+    Args:
+        text: Text to wrap
+        font_size: Font size (resolved through the registry)
+        max_width: Maximum line width in pixels
+
+    Returns:
+        Tuple of (line, width) pairs
+    """
+    font = fonts.get(font_size)
+    space = font.getlength(' ')
+
+    lines = []
+    current = []
+    current_width = 0.0
+
+    for word in text.split():
+        word_width = font.getlength(word)
+        width = current_width + space + word_width if current else word_width
+
+        if width > max_width and current:
+            lines.append(' '.join(current))
+            current = [word]
+            current_width = word_width
+        else:
+            current.append(word)
+            current_width = width
+
+    if current:
+        lines.append(' '.join(current))
+
+    return tuple((line, round(font.getlength(line))) for line in lines)
+
+
+@lru_cache(maxsize=4096)
+def layout_text(text: str, font_size: int, max_width: int, canvas_width: int,
+                top: int = 0, line_height: int = 0,
+                max_lines: Optional[int] = None) -> Tuple[Tuple[int, int, str], ...]:
+    """
+    Lay out wrapped, horizontally centered text
+
+    Args:
+        text: Text to lay out
+        font_size: Font size (resolved through the registry)
+        max_width: Maximum line width in pixels
+        canvas_width: Width of the area the lines are centered in
+        top: Y coordinate of the first line
+        line_height: Distance between line tops
+        max_lines: Keep at most this many lines
+
+    Returns:
+        Tuple of (x, y, line) entries ready for ImageDraw.text
+    """
+    lines = wrap_text(text, font_size, max_width)
+    if max_lines is not None:
+        lines = lines[:max_lines]
+
+    return tuple(
+        ((canvas_width - width) // 2, top + index * line_height, line)
+        for index, (line, width) in enumerate(lines)
+    )
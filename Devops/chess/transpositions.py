@@ -0,0 +1,152 @@
+"""
+Rendered boards and move transitions shared across the videos of a batch
+Entries are keyed by the Zobrist hash of the position, so transpositions and shared openings render once
+"""
+
+import contextlib
+import hashlib
+import os
+import tempfile
+import chess
+import chess.polyglot
+import numpy as np
+from typing import Optional
+
+# Bytes each process may write to a cache (an entry is size x size x 3 bytes:
+# 1.1 MB at 600px, 4.9 MB at 1280px)
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def position_key(board: chess.Board) -> str:
+    """Zobrist hash of a position as hex (placement, side to move, castling and en passant)"""
+    return f'{chess.polyglot.zobrist_hash(board):016x}'
+
+
+class TranspositionCache:
+    """
+    On-disk store of rendered board arrays, shared by the worker processes of a batch
+
+    Entries are .npy files addressed by a hash of the position's Zobrist key
+    and everything else that determines the pixels (move, style, size, ...).
+    They are memory-mapped read-only on lookup, so every process reads the
+    same page-cached data instead of rendering its own copy.
+
+    Entries are uncompressed, so only positions rendered a second time are
+    written: the first rendering leaves an empty marker file, and the
+    second one (in any process) stores the array. Each process also stops
+    writing after max_bytes.
+    """
+
+    KINDS = ('board', 'transition')
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Initialize the cache
+
+        Args:
+            directory: Cache directory (created if missing)
+            max_bytes: Upper bound on the bytes this process writes
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = dict.fromkeys(self.KINDS, 0)
+        self.misses = dict.fromkeys(self.KINDS, 0)
+        self.reused = dict.fromkeys(self.KINDS, 0)
+        self.bytes_written = 0
+        self.write_errors = 0
+
+    @staticmethod
+    def key(kind: str, board: chess.Board, *parts) -> str:
+        """
+        Build an entry key
+
+        Args:
+            kind: Entry kind, one of KINDS
+            board: Position the entry was rendered from
+            *parts: Everything else that changes the pixels (move, style, size, ...)
+        """
+        payload = repr((kind, position_key(board)) + parts)
+        return f"{kind}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def path(self, key: str) -> str:
+        """Return where the entry for key lives (whether or not it exists yet)"""
+        digest = key.split('-', 1)[1]
+        return os.path.join(self.directory, digest[:2], f'{key}.npy')
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return the cached array for key (read-only), or None if it has not been rendered"""
+        kind = key.split('-', 1)[0]
+        try:
+            array = np.load(self.path(key), mmap_mode='r')
+        except (OSError, ValueError):
+            self.misses[kind] += 1
+            return None
+        self.hits[kind] += 1
+        return array
+
+    def note_reuse(self, kind: str):
+        """Count an entry a renderer served from its own memory cache without asking this one"""
+        self.reused[kind] += 1
+
+    def put(self, key: str, array: np.ndarray) -> bool:
+        """
+        Store a rendered array (best effort) if it has been rendered before
+
+        The first call for a key only leaves a marker, so entries no other
+        rendering needs cost no disk space. The file is written under a
+        temporary name and moved into place, so other processes never load
+        a partially written entry; when two processes render the same entry
+        the last one wins. A failed write (e.g. a full disk) is counted and
+        skipped: the caller already holds the rendered array, so the render
+        goes on without sharing it.
+
+        Returns:
+            Whether the entry was stored
+        """
+        if self.bytes_written + array.nbytes > self.max_bytes:
+            return False
+
+        path = self.path(key)
+        temp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self._first_sighting(path):
+                return False
+            handle, temp_path = tempfile.mkstemp(suffix='.npy', dir=os.path.dirname(path))
+            with os.fdopen(handle, 'wb') as f:
+                np.save(f, array)
+            os.replace(temp_path, path)
+        except OSError as e:
+            if temp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(temp_path)
+            self.write_errors += 1
+            if self.write_errors == 1:
+                print(f"⚠ Could not write to the transposition cache, rendering without it: {e}")
+            return False
+        self.bytes_written += array.nbytes
+        return True
+
+    @staticmethod
+    def _first_sighting(path: str) -> bool:
+        """Create the entry's marker file; True if no rendering created it before"""
+        try:
+            os.close(os.open(os.path.splitext(path)[0] + '.seen', os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        return True
+
+    def stats(self) -> dict:
+        """
+        Return counters per entry kind
+
+        Hits were loaded from disk and reuses served from a renderer's own
+        memory cache; both are boards that were not rendered again.
+        """
+        stats = {'bytes_written': self.bytes_written, 'write_errors': self.write_errors}
+        for kind in self.KINDS:
+            stats[f'{kind}_hits'] = self.hits[kind]
+            stats[f'{kind}_misses'] = self.misses[kind]
+            stats[f'{kind}_reused'] = self.reused[kind]
+        return stats
@@ -6,16 +6,120 @@ Creates animated videos with smooth transitions between moves
 import chess
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from board_renderer import ChessBoardRenderer
-from typing import List, Dict, Optional, Tuple
+from text_layout import fonts, layout_text
+from encoders import OPENCV_FOURCC, VideoEncoder, create_encoder, concat_videos, resolve_backend
+from pipeline import DEFAULT_QUEUE_SIZE, FramePipeline
+from transpositions import TranspositionCache
+from narrator import NarrationCache, narration_texts, synthesize_all, mix_track, write_wav
+from profiling import profiler
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Dict, Optional, Tuple
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+
+# Narration placement within a segment (seconds)
+NARRATION_LEAD = 0.25  # Silence before the first clip
+NARRATION_GAP = 0.4    # Pause between consecutive clips
+NARRATION_TAIL = 0.5   # Silence after the last clip before the segment ends
+
+# Encoded segments shared by every run on this machine (override with CHESS_SEGMENT_CACHE)
+DEFAULT_SEGMENT_CACHE_DIR = os.environ.get(
+    'CHESS_SEGMENT_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'chess-video', 'segments')
+)
+
+# Bump when a change to the drawing or encoding code alters the frames of a segment
+SEGMENT_CACHE_VERSION = 1
+
+# Segment fields that determine its frames, per kind (the rest is bookkeeping)
+SEGMENT_INPUTS = {
+    'intro': ('title', 'description', 'duration', 'frames'),
+    'move': ('fen', 'uci', 'annotation', 'duration', 'frames'),
+    'outro': ('fen', 'duration', 'frames')
+}
+
+# Draft renders: the final video's timeline at preview quality
+DRAFT_SIZE = 400  # Board size cap (pixels)
+DRAFT_FPS = 10    # Frame rate cap; the largest divisor of the final rate below it is used
+DRAFT_ENCODER_OPTIONS = {'preset': 'ultrafast'}
+
+
+def draft_fps(fps: int) -> int:
+    """Pick the draft frame rate for a final frame rate (30 -> 10, 24 -> 8, 60 -> 10)"""
+    return max(rate for rate in range(1, min(fps, DRAFT_FPS) + 1) if fps % rate == 0)
+
+
+class SegmentCache:
+    """On-disk encoded segments, addressed by a hash of their render inputs"""
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Initialize the cache
+
+        Args:
+            directory: Cache directory (default: DEFAULT_SEGMENT_CACHE_DIR)
+        """
+        self.directory = directory or DEFAULT_SEGMENT_CACHE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key: str, extension: str) -> str:
+        """Return where the segment for key lives (whether or not it exists yet)"""
+        return os.path.join(self.directory, key[:2], f'{key}{extension}')
+
+    def get(self, key: str, extension: str) -> Optional[str]:
+        """Return the cached segment path, or None if it has not been rendered"""
+        path = self.path(key, extension)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def reserve(self, key: str, extension: str) -> Tuple[str, str]:
+        """
+        Return (temporary path, final path) for rendering a segment
+
+        Render to the temporary path and pass both to commit(), so an
+        interrupted render never leaves a truncated segment in the cache.
+        """
+        path = self.path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Keep the extension: ffmpeg picks the container from it
+        handle, temp_path = tempfile.mkstemp(suffix=extension, dir=os.path.dirname(path))
+        os.close(handle)
+        return temp_path, path
+
+    def commit(self, temp_path: str, path: str) -> bool:
+        """Move a rendered segment into place; returns False (and cleans up) if it is empty"""
+        if os.path.exists(temp_path) and os.path.getsize(temp_path) > 0:
+            os.replace(temp_path, path)
+            return True
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+
+    def stats(self) -> dict:
+        """Return hit/miss counters"""
+        return {'hits': self.hits, 'misses': self.misses, 'directory': self.directory}
 
 
 class ChessVideoGenerator:
     """Generate videos from chess theory data"""
 
-    def __init__(self, size: int = 800, fps: int = 30, style: str = 'default'):
+    def __init__(self, size: int = 800, fps: int = 30, style: str = 'default',
+                 renderer_backend: str = 'svg', encoder: str = 'auto',
+                 encoder_options: Optional[dict] = None, enable_narrator: bool = False,
+                 narrator_rate: int = 150, narration_cache: Optional[NarrationCache] = None,
+                 segment_cache: Optional[SegmentCache] = None,
+                 pipeline_queue: int = DEFAULT_QUEUE_SIZE, draft: bool = False,
+                 transpositions: Optional[TranspositionCache] = None):
         """
         Initialize video generator
 
@@ -23,16 +127,51 @@ class ChessVideoGenerator:
             size: Size of the board in pixels
             fps: Frames per second for video
             style: Board color style
+            renderer_backend: Board renderer backend ('svg' or 'sprite')
+            encoder: Encoder backend ('auto', 'ffmpeg' or 'opencv')
+            encoder_options: ffmpeg options (codec, preset, crf, threads, pix_fmt)
+            enable_narrator: Narrate annotations and DISPLAY texts into an audio track
+            narrator_rate: Speech rate in words per minute
+            narration_cache: Narration audio cache (default: a NarrationCache in its default directory)
+            segment_cache: Reuse encoded segments whose inputs have not changed
+                           (segments are then rendered to files and stream-copied together)
+            pipeline_queue: Frames queued between rendering and the encoder thread
+                            (0 encodes on the rendering thread)
+            draft: Render a quick preview: at most DRAFT_SIZE pixels and DRAFT_FPS frames
+                   per second, sprite boards, no move transitions and a fast encoder
+                   preset. Segments start and end at the same times as in the final video
+            transpositions: Boards and move transitions shared with other videos
+                            (see TranspositionCache); used when rendering in this process
         """
+        # The timeline is always planned at the final frame rate
+        self.timeline_fps = fps
+        self.draft = draft
+        if draft:
+            size = min(size, DRAFT_SIZE)
+            fps = draft_fps(fps)
+            renderer_backend = 'sprite'
+            encoder_options = {**(encoder_options or {}), **DRAFT_ENCODER_OPTIONS}
+
         self.size = size
         self.fps = fps
         self.style = style
-        self.renderer = ChessBoardRenderer(size=size, style=style)
+        self.encoder = encoder
+        self.encoder_options = encoder_options or {}
+        self.enable_narrator = enable_narrator
+        self.narrator_rate = narrator_rate
+        self.narration_cache = narration_cache
+        self.segment_cache = segment_cache
+        self.pipeline_queue = pipeline_queue
+        # Frames are drawn in the encoders' BGR channel order, so they need no conversion
+        self.renderer = ChessBoardRenderer(size=size, style=style, backend=renderer_backend,
+                                           pixel_format='bgr', transpositions=transpositions)
 
     def generate_video(self, theory_data: dict, output_path: str,
                       move_duration: float = 2.0,
                       intro_duration: float = 3.0,
-                      outro_duration: float = 2.0):
+                      outro_duration: float = 2.0,
+                      workers: int = 1,
+                      progress: Optional[Callable[[int, int], None]] = None):
         """
         Generate video from chess theory data
 
@@ -42,183 +181,515 @@ class ChessVideoGenerator:
             move_duration: Duration to show each move (seconds)
             intro_duration: Duration of intro screen (seconds)
             outro_duration: Duration of outro screen (seconds)
+            workers: Number of processes rendering segments in parallel (1 renders in-process)
+            progress: Called as progress(frames_done, total_frames) after each segment
+
+        Returns:
+            Timeline summary: segment count, total frames and duration in seconds
         """
         print(f"Generating video: {output_path}")
         print(f"Total moves: {theory_data['move_count']}")
 
-        # Set up video writer
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        annotation_height = 100
-        total_height = self.size + annotation_height
-        video = cv2.VideoWriter(output_path, fourcc, self.fps, (self.size, total_height))
+        segments = self.plan_segments(theory_data, move_duration, intro_duration, outro_duration)
+        audio = self._synthesize_narration(theory_data) if self.enable_narrator else {}
+        if audio:
+            stretched = self.fit_narration(segments, audio)
+            if stretched:
+                print(f"  Stretched {stretched} segment(s) to fit their narration")
+
+        # The whole timeline is fixed before the first frame is rendered
+        total_frames = self.schedule(segments)
+        timeline = {
+            'segments': len(segments),
+            'frames': total_frames,
+            'duration': total_frames / self.fps
+        }
+        print(f"Timeline: {timeline['segments']} segments, {total_frames} frames "
+              f"({timeline['duration']:.1f}s)")
+
+        audio_path = self._write_narration_track(segments) if audio else None
+
+        try:
+            if workers > 1 or self.segment_cache is not None:
+                self._generate_segmented(segments, output_path, workers, audio_path, progress)
+                print(f"Video generation complete: {output_path}")
+                return timeline
 
-        if not video.isOpened():
-            raise RuntimeError(f"Could not open video writer for {output_path}")
+            video = self._open_pipeline(output_path, audio_path)
 
+            try:
+                for segment in segments:
+                    self.render_segment(video, segment)
+                    if progress:
+                        progress(segment['start_frame'] + segment['frames'], total_frames)
+            finally:
+                # Waits for the encoder thread to drain the queue
+                video.release()
+
+            stats = video.stats()
+            print(f"Video generation complete: {output_path} "
+                  f"({stats['frames']} frames in {stats['runs']} runs)")
+            if stats['frames'] != total_frames:
+                print(f"⚠ Rendered {stats['frames']} frames, timeline planned {total_frames}")
+
+        finally:
+            if audio_path:
+                os.remove(audio_path)
+
+        return timeline
+
+    def generate_branches(self, theory_data: dict, output_path: str,
+                          move_duration: float = 2.0,
+                          intro_duration: float = 3.0,
+                          outro_duration: float = 2.0,
+                          workers: int = 1) -> List[dict]:
+        """
+        Generate one video per line of a theory's variation tree
+
+        Branches are written next to output_path with their number appended
+        (opening_01.mp4, opening_02.mp4, ...), the main line first. They are
+        rendered through the segment cache (a temporary one if the generator
+        has none), so the moves a branch shares with earlier branches are
+        stream-copied from their segments: a repertoire costs about one
+        render per distinct move, not one per move of every line.
+
+        Args:
+            theory_data: Parsed chess theory data with a 'variations' tree
+            output_path: Path the branch video names are derived from
+            move_duration: Duration to show each move (seconds)
+            intro_duration: Duration of intro screen (seconds)
+            outro_duration: Duration of outro screen (seconds)
+            workers: Number of processes rendering segments in parallel
+
+        Returns:
+            Per branch: its output path, SAN line and timeline summary
+        """
+        tree = theory_data.get('variations')
+        leaves = tree.leaves() if tree is not None else []
+        if not leaves:
+            raise ValueError("Theory has no variation tree (only PGN input keeps variations)")
+
+        stem, extension = os.path.splitext(output_path)
+        width = max(2, len(str(len(leaves))))
+        segment_cache = self.segment_cache
+        temp_dir = None
+        if segment_cache is None:
+            temp_dir = tempfile.mkdtemp(prefix='chess_branches_')
+            self.segment_cache = SegmentCache(temp_dir)
+
+        branches = []
         try:
-            # Generate intro
-            if theory_data['title'] or theory_data['description']:
-                self._add_intro(video, theory_data, intro_duration)
+            for number, leaf in enumerate(leaves, start=1):
+                moves = tree.line(leaf)
+                branch = dict(theory_data, moves=moves, move_count=len(moves),
+                              annotations=tree.line_annotations(leaf))
+                path = f'{stem}_{number:0{width}d}{extension or ".mp4"}'
+                line = ' '.join(record['san'] for record in moves)
+                print(f"\nBranch {number}/{len(leaves)}: {line}")
+
+                timeline = self.generate_video(branch, path, move_duration, intro_duration,
+                                               outro_duration, workers)
+                branches.append({'output': path, 'line': line, **timeline})
+        finally:
+            self.segment_cache = segment_cache
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        return branches
+
+    def plan_segments(self, theory_data: dict, move_duration: float = 2.0,
+                      intro_duration: float = 3.0, outro_duration: float = 2.0) -> List[dict]:
+        """
+        Split a theory into independently renderable segments
+
+        Each segment carries everything needed to render it (the position as
+        FEN rather than a shared board), so segments can be rendered in any
+        order or in other processes. Its 'narration' lists the texts spoken
+        over it: the move's own annotation, plus DISPLAY texts placed at the
+        point of the theory where they appear.
+
+        Args:
+            theory_data: Parsed chess theory data
+            move_duration: Default duration of each move (seconds)
+            intro_duration: Duration of intro screen (seconds)
+            outro_duration: Duration of outro screen (seconds)
 
-            # Generate moves
-            board = chess.Board()
-            annotations_dict = {idx: text for idx, text in theory_data['annotations']}
-            timings_dict = theory_data.get('timings', {})
+        Returns:
+            Ordered list of segment dicts with a 'kind' of intro, move or outro
+        """
+        segments = []
+        move_count = theory_data['move_count']
+
+        # DISPLAY texts, keyed by the number of moves played before them
+        displays = {}
+        for played, text in theory_data.get('displays', []):
+            displays.setdefault(min(played, move_count), []).append(text)
+
+        if theory_data['title'] or theory_data['description']:
+            segments.append({
+                'kind': 'intro',
+                'title': theory_data['title'],
+                'description': theory_data['description'],
+                'duration': intro_duration,
+                'narration': displays.pop(0, []) if move_count else []
+            })
 
-            for move_idx, move_data in enumerate(theory_data['moves']):
-                print(f"Processing move {move_idx + 1}/{theory_data['move_count']}: {move_data['san']}")
+        board = chess.Board()
+        annotations_dict = {idx: text for idx, text in theory_data['annotations']}
+        timings_dict = theory_data.get('timings', {})
+
+        for move_idx, move_data in enumerate(theory_data['moves']):
+            narration = displays.pop(0, []) if move_idx == 0 else []
+            if move_idx in annotations_dict:
+                narration.append(annotations_dict[move_idx])
+            if move_idx + 1 < move_count:
+                narration += displays.pop(move_idx + 1, [])
+
+            segments.append({
+                'kind': 'move',
+                'index': move_idx,
+                'san': move_data['san'],
+                'uci': move_data['uci'],
+                'fen': board.fen(),
+                # Use the annotation for this move if it exists
+                'annotation': annotations_dict.get(move_idx, f"Move {move_idx + 1}: {move_data['san']}"),
+                # Use custom timing for this move if it exists, otherwise the default
+                'duration': timings_dict.get(move_idx, move_duration),
+                'move_count': move_count,
+                'narration': narration
+            })
+            board.push(chess.Move.from_uci(move_data['uci']))
+
+        segments.append({
+            'kind': 'outro',
+            'fen': board.fen(),
+            'duration': outro_duration,
+            'narration': [text for texts in displays.values() for text in texts]
+        })
+
+        return segments
+
+    def schedule(self, segments: List[dict]) -> int:
+        """
+        Fix every segment's place on the video timeline
 
-                # Get annotation for this move if exists
-                annotation = annotations_dict.get(move_idx, f"Move {move_idx + 1}: {move_data['san']}")
+        Sets 'start_frame' and 'frames' on each segment from the frame counts
+        the renderer will produce, so audio can be aligned and progress or
+        output size known before anything is rendered.
 
-                # Get custom timing for this move if exists, otherwise use default
-                duration = timings_dict.get(move_idx, move_duration)
+        The timeline is laid out at the final frame rate. A draft maps each
+        segment boundary onto its own frame rate, so its segments start
+        within half a draft frame of the final video's and never drift.
 
-                # Parse and make the move
-                move = chess.Move.from_uci(move_data['uci'])
+        Returns:
+            Total number of frames in the video
+        """
+        start = 0
+        for segment in segments:
+            end = start + self.segment_frames(segment)
+            segment['start_frame'] = round(start * self.fps / self.timeline_fps)
+            segment['frames'] = round(end * self.fps / self.timeline_fps) - segment['start_frame']
+            start = end
+        return round(start * self.fps / self.timeline_fps)
+
+    def segment_frames(self, segment: dict) -> int:
+        """Return the number of frames a planned segment lasts at the final frame rate"""
+        if segment['kind'] == 'move':
+            return sum(self._move_frames(segment['duration']))
+        return int(segment['duration'] * self.timeline_fps)
+
+    def _move_frames(self, duration: float) -> Tuple[int, int]:
+        """Split a move's duration into (transition, hold) frame counts at the final frame rate"""
+        transition_frames = int(0.3 * duration * self.timeline_fps)  # 30% for animation
+        hold_frames = int(0.7 * duration * self.timeline_fps)  # 70% holding position
+        return transition_frames, hold_frames
+
+    def fit_narration(self, segments: List[dict], audio: Dict[str, dict]) -> int:
+        """
+        Place narration clips in their segments, stretching segments that are too short
 
-                # Add animated transition
-                self._add_move_animation(video, board, move, annotation, duration)
+        Each segment's 'clips' is set to (offset in seconds, audio path) pairs.
+        A segment lasts max(planned duration, its narration plus pauses).
+        Durations come from the audio headers, so run schedule() afterwards.
 
-                # Make the move
-                board.push(move)
+        Args:
+            segments: Segments from plan_segments()
+            audio: Mapping from text to {'path', 'duration'} (see synthesize_all)
 
-            # Add outro
-            self._add_outro(video, board, outro_duration)
+        Returns:
+            Number of segments that were stretched
+        """
+        stretched = 0
+        for segment in segments:
+            clips = []
+            offset = NARRATION_LEAD
+            for text in segment.get('narration', []):
+                entry = audio.get(text)
+                if not entry or not entry['duration']:
+                    continue
+                clips.append((offset, entry['path']))
+                offset += entry['duration'] + NARRATION_GAP
+
+            segment['clips'] = clips
+            if clips:
+                needed = offset - NARRATION_GAP + NARRATION_TAIL
+                if needed > segment['duration']:
+                    segment['duration'] = needed
+                    stretched += 1
+
+        return stretched
+
+    def narration_track(self, segments: List[dict]) -> np.ndarray:
+        """
+        Mix the segments' narration clips into one PCM track
+
+        Clips are placed from each segment's scheduled start frame (see
+        schedule()), so the track stays in sync with the frames encoded.
+
+        Returns:
+            int16 samples covering the whole video (see narrator.mix_track)
+        """
+        clips = []
+        for segment in segments:
+            start = segment['start_frame'] / self.fps
+            clips += [(start + offset, path) for offset, path in segment.get('clips', [])]
+        last = segments[-1]
+        return mix_track(clips, (last['start_frame'] + last['frames']) / self.fps)
+
+    def _synthesize_narration(self, theory_data: dict) -> Dict[str, dict]:
+        """Synthesize (or fetch from the cache) every narrated text; empty if TTS is unavailable"""
+        print("Synthesizing narration...")
+        texts = narration_texts(theory_data)
+        cache = self.narration_cache or NarrationCache()
+        try:
+            with profiler.stage('narration'):
+                audio = synthesize_all(texts, rate=self.narrator_rate, cache=cache)
+        except (ImportError, RuntimeError) as e:
+            print(f"⚠ Narration unavailable: {e}")
+            return {}
+        print(f"✓ Narration ready for {len(audio)}/{len(texts)} texts ({cache.hits} from cache)")
+        return audio
+
+    def _write_narration_track(self, segments: List[dict]) -> str:
+        """Mix the scheduled segments' narration into a temporary WAV (the caller removes it)"""
+        with profiler.stage('audio_mix'):
+            track = self.narration_track(segments)
+            handle, path = tempfile.mkstemp(suffix='.wav', prefix='chess_narration_')
+            os.close(handle)
+            write_wav(path, track)
+        return path
+
+    def render_segment(self, video: FramePipeline, segment: dict):
+        """Render one planned segment into an open frame pipeline"""
+        with profiler.stage(segment['kind']):
+            self._render_segment(video, segment)
+
+    def _render_segment(self, video: FramePipeline, segment: dict):
+        if segment['kind'] == 'intro':
+            self._add_intro(video, segment, segment['frames'])
+        elif segment['kind'] == 'move':
+            print(f"Processing move {segment['index'] + 1}/{segment['move_count']}: {segment['san']}")
+            board = chess.Board(segment['fen'])
+            move = chess.Move.from_uci(segment['uci'])
+            if self.draft:
+                # Cut straight to the new position
+                transition_frames, hold_frames = 0, segment['frames']
+            else:
+                transition_frames, hold_frames = self._move_frames(segment['duration'])
+            self._add_move_animation(video, board, move, segment['annotation'],
+                                     transition_frames, hold_frames)
+        elif segment['kind'] == 'outro':
+            self._add_outro(video, chess.Board(segment['fen']), segment['frames'])
+        else:
+            raise ValueError(f"Unknown segment kind: {segment['kind']}")
+
+    def frame_size(self) -> Tuple[int, int]:
+        """Return the (width, height) of video frames"""
+        return self.size, self.size + self.renderer.ANNOTATION_HEIGHT
+
+    def _open_encoder(self, output_path: str, audio_path: Optional[str] = None) -> VideoEncoder:
+        """Open an encoder with this generator's settings, muxing audio_path if given"""
+        options = dict(self.encoder_options)
+        if audio_path:
+            options['audio_path'] = audio_path
+        return create_encoder(output_path, self.fps, self.frame_size(),
+                              backend=self.encoder, **options)
+
+    def _open_pipeline(self, output_path: str, audio_path: Optional[str] = None) -> FramePipeline:
+        """Open an encoder behind a frame pipeline that takes RGB frames"""
+        return FramePipeline(self._open_encoder(output_path, audio_path), self.pipeline_queue)
+
+    def worker_config(self) -> dict:
+        """Constructor arguments needed to rebuild this generator in another process"""
+        return {
+            'size': self.size,
+            'fps': self.timeline_fps,
+            'style': self.style,
+            'renderer_backend': self.renderer.backend,
+            'encoder': self.encoder,
+            'encoder_options': self.encoder_options,
+            'pipeline_queue': self.pipeline_queue,
+            'draft': self.draft
+        }
+
+    def segment_key(self, segment: dict) -> str:
+        """Content hash of everything that determines a segment's encoded frames"""
+        inputs = {name: segment[name] for name in SEGMENT_INPUTS[segment['kind']]}
+        config = self.worker_config()
+        del config['pipeline_queue']  # Threading does not change the frames
+        # 'auto' encodes with whichever backend is installed at render time, and
+        # segments of different codecs cannot be stream-copied into one file
+        config['encoder'] = resolve_backend(self.encoder, self.encoder_options.get('ffmpeg_binary', 'ffmpeg'))
+        config['codec'] = (self.encoder_options.get('codec', 'libx264') if config['encoder'] == 'ffmpeg'
+                           else OPENCV_FOURCC)
+        payload = json.dumps([SEGMENT_CACHE_VERSION, segment['kind'], inputs, config],
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _generate_segmented(self, segments: List[dict], output_path: str, workers: int = 1,
+                            audio_path: Optional[str] = None,
+                            progress: Optional[Callable[[int, int], None]] = None):
+        """
+        Render segments to separate files and stream-copy them together in order
 
-            print(f"Video generation complete: {output_path}")
+        With a segment cache, segments whose inputs are unchanged are reused
+        and only the others are rendered; otherwise every segment is rendered
+        to a temporary file. Missing segments are rendered in a process pool
+        when workers > 1.
+        """
+        extension = os.path.splitext(output_path)[1] or '.mp4'
+        cache = self.segment_cache
+
+        with tempfile.TemporaryDirectory(prefix='chess_segments_') as temp_dir:
+            paths = []
+            pending = {}  # final path -> (segment, path rendered to)
+            for i, segment in enumerate(segments):
+                if cache is None:
+                    path = os.path.join(temp_dir, f'segment_{i:05d}{extension}')
+                    pending[path] = (segment, path)
+                else:
+                    key = self.segment_key(segment)
+                    path = cache.path(key, extension)
+                    if path not in pending and not cache.get(key, extension):
+                        pending[path] = (segment, cache.reserve(key, extension)[0])
+                paths.append(path)
+
+            if cache is not None:
+                print(f"Segment cache: reusing {len(segments) - len(pending)}/{len(segments)} segments")
+
+            targets = {render_path: path for path, (_, render_path) in pending.items()}
+            frames = {render_path: segment['frames'] for segment, render_path in pending.values()}
+            total = sum(segment['frames'] for segment in segments)
+            done = total - sum(frames.values())  # Reused segments count as done
+            if progress:
+                progress(done, total)
 
+            try:
+                for render_path in self._render_segment_files(list(pending.values()), workers):
+                    if cache is not None:
+                        cache.commit(render_path, targets.pop(render_path))
+                    done += frames[render_path]
+                    if progress:
+                        progress(done, total)
+            finally:
+                # Segments that failed or never started are not cached
+                if cache is not None:
+                    for render_path in targets:
+                        if os.path.exists(render_path):
+                            os.remove(render_path)
+
+            print("Concatenating segments...")
+            concat_videos(paths, output_path, self.fps, self.frame_size(), audio_path=audio_path)
+
+    def _render_segment_files(self, jobs: List[Tuple[dict, str]], workers: int):
+        """
+        Render (segment, path) jobs to their own files, in a process pool when workers > 1
+
+        Yields each path, in job order, once its file is complete.
+        """
+        if not jobs:
+            return
+
+        workers = min(workers, len(jobs))
+        if workers <= 1:
+            for segment, path in jobs:
+                self.render_segment_file(segment, path)
+                yield path
+            return
+
+        print(f"Rendering {len(jobs)} segments with {workers} workers...")
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_segment_worker,
+                                 initargs=(self.worker_config(), profiler.enabled)) as pool:
+            # Consume results in order so a failing segment raises here
+            for path, stats in pool.map(_render_segment_file, *zip(*jobs)):
+                if stats:
+                    profiler.merge(stats)
+                yield path
+
+    def render_segment_file(self, segment: dict, path: str):
+        """Render a single segment to its own video file"""
+        video = self._open_pipeline(path)
+        try:
+            self.render_segment(video, segment)
         finally:
             video.release()
 
-    def _add_intro(self, video: cv2.VideoWriter, theory_data: dict, duration: float):
-        """Add intro screen with title and description"""
+    def _add_intro(self, video: FramePipeline, theory_data: dict, frames: int):
+        """Add intro screen with title and description (theory_data needs 'title' and 'description')"""
         print("Adding intro...")
 
-        # Create intro frame
-        frame_img = Image.new('RGB', (self.size, self.size + 100), color='#2C3E50')
-        draw = ImageDraw.Draw(frame_img)
-
-        # Load fonts
-        try:
-            title_font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 48)
-            desc_font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 28)
-        except:
-            try:
-                title_font = ImageFont.truetype("arial.ttf", 48)
-                desc_font = ImageFont.truetype("arial.ttf", 28)
-            except:
-                title_font = ImageFont.load_default()
-                desc_font = ImageFont.load_default()
-
-        # Draw title
-        if theory_data['title']:
-            title_bbox = draw.textbbox((0, 0), theory_data['title'], font=title_font)
-            title_width = title_bbox[2] - title_bbox[0]
-            x = (self.size - title_width) // 2
-            y = self.size // 2 - 100
-            draw.text((x, y), theory_data['title'], fill='white', font=title_font)
-
-        # Draw description
-        if theory_data['description']:
-            # Word wrap description
-            words = theory_data['description'].split()
-            lines = []
-            current_line = []
-            max_width = self.size - 100
-
-            for word in words:
-                current_line.append(word)
-                line_text = ' '.join(current_line)
-                bbox = draw.textbbox((0, 0), line_text, font=desc_font)
-                if bbox[2] - bbox[0] > max_width:
-                    if len(current_line) > 1:
-                        current_line.pop()
-                        lines.append(' '.join(current_line))
-                        current_line = [word]
-                    else:
-                        lines.append(word)
-                        current_line = []
-
-            if current_line:
-                lines.append(' '.join(current_line))
-
-            y = self.size // 2 + 20
-            for line in lines[:3]:  # Max 3 lines
-                bbox = draw.textbbox((0, 0), line, font=desc_font)
-                line_width = bbox[2] - bbox[0]
-                x = (self.size - line_width) // 2
-                draw.text((x, y), line, fill='#ECF0F1', font=desc_font)
-                y += 40
-
-        # Convert to OpenCV format and add frames
-        frame_cv = cv2.cvtColor(np.array(frame_img), cv2.COLOR_RGB2BGR)
-        num_frames = int(duration * self.fps)
-
-        for _ in range(num_frames):
-            video.write(frame_cv)
-
-    def _add_move_animation(self, video: cv2.VideoWriter, board: chess.Board,
-                           move: chess.Move, annotation: str, duration: float):
+        with profiler.stage('text'):
+            # Create intro frame
+            frame_img = Image.new('RGB', self.frame_size(), color='#2C3E50')
+            draw = ImageDraw.Draw(frame_img)
+
+            # Draw title (long titles wrap onto a second line)
+            if theory_data['title']:
+                for x, y, line in layout_text(theory_data['title'], 48, self.size - 40, self.size,
+                                              top=self.size // 2 - 100, line_height=55, max_lines=2):
+                    draw.text((x, y), line, fill='white', font=fonts.get(48))
+
+            # Draw description (word wrapped, max 3 lines)
+            if theory_data['description']:
+                for x, y, line in layout_text(theory_data['description'], 28, self.size - 100, self.size,
+                                              top=self.size // 2 + 20, line_height=40, max_lines=3):
+                    draw.text((x, y), line, fill='#ECF0F1', font=fonts.get(28))
+
+        # Convert straight into an encoder buffer and hold it for the whole intro
+        frame = video.acquire()
+        cv2.cvtColor(np.asarray(frame_img), cv2.COLOR_RGB2BGR, dst=frame)
+        video.submit(frame, frames)
+
+    def _add_move_animation(self, video: FramePipeline, board: chess.Board,
+                           move: chess.Move, annotation: str,
+                           transition_frames: int, hold_frames: int):
         """Add animated move transition"""
-        # Calculate frames
-        transition_frames = int(0.3 * duration * self.fps)  # 30% for animation
-        hold_frames = int(0.7 * duration * self.fps)  # 70% holding position
-
-        # Board before move
-        board_before = board.copy()
-
-        # Create frames showing the move
-        from_square = move.from_square
-        to_square = move.to_square
-
-        # Render board with highlighted squares during transition
-        for frame in range(transition_frames):
-            progress = frame / transition_frames
-            # Highlight source and destination
-            img = self.renderer.render_with_annotation(
-                board_before,
-                annotation,
-                last_move=None
-            )
-
-            # Add fade effect on moving piece
-            if frame < transition_frames // 2:
-                # Highlight from square
-                draw = ImageDraw.Draw(img)
-                alpha = int(128 + 127 * np.sin(progress * np.pi))
-                # This is simplified - you could add actual piece movement here
-            else:
-                # Highlight to square
-                pass
-
-            frame_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-            video.write(frame_cv)
+        # Slide the piece, drawing the board straight into each encoder buffer;
+        # the cached band is only copied into buffers that do not hold it yet
+        band = self.renderer.render_annotation_band(annotation)
+        animation = self.renderer.move_animation(board, move)
+        for index in range(transition_frames):
+            frame = video.acquire()
+            animation.draw(frame[:self.size], (index + 1) / transition_frames)
+            self.renderer.composer.compose(None, band, frame)
+            video.submit(frame)
 
         # Hold final position
         board_after = board.copy()
         board_after.push(move)
-        img_final = self.renderer.render_with_annotation(board_after, annotation, last_move=move)
-        frame_final = cv2.cvtColor(np.array(img_final), cv2.COLOR_RGB2BGR)
+        frame = video.acquire()
+        self.renderer.render_frame(board_after, annotation, last_move=move, out=frame)
+        video.submit(frame, hold_frames)
 
-        for _ in range(hold_frames):
-            video.write(frame_final)
-
-    def _add_outro(self, video: cv2.VideoWriter, final_board: chess.Board, duration: float):
+    def _add_outro(self, video: FramePipeline, final_board: chess.Board, frames: int):
         """Add outro with final position"""
         print("Adding outro...")
 
         # Render final board
-        img = self.renderer.render_with_annotation(
-            final_board,
-            "End of theory demonstration"
-        )
-
-        frame_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-        num_frames = int(duration * self.fps)
-
-        for _ in range(num_frames):
-            video.write(frame_cv)
+        frame = video.acquire()
+        self.renderer.render_frame(final_board, "End of theory demonstration", out=frame)
+        video.submit(frame, frames)
 
     def create_thumbnail(self, theory_data: dict, output_path: str):
         """Create a thumbnail image for the video"""
@@ -238,6 +709,27 @@ class ChessVideoGenerator:
         print(f"Thumbnail saved: {output_path}")
 
 
+# Generator owned by each segment worker process, built once by the pool initializer
+_WORKER_GENERATOR = None
+
+
+def _init_segment_worker(config: dict, profile: bool = False):
+    """Process pool initializer: build this worker's generator (and its caches) once"""
+    global _WORKER_GENERATOR
+    if profile:
+        profiler.enable()
+    _WORKER_GENERATOR = ChessVideoGenerator(**config)
+
+
+def _render_segment_file(segment: dict, path: str) -> Tuple[str, Optional[dict]]:
+    """Render a single segment to its own video file; also returns its profile stats when profiling"""
+    if profiler.enabled:
+        profiler.reset()
+
+    _WORKER_GENERATOR.render_segment_file(segment, path)
+    return path, profiler.stats() if profiler.enabled else None
+
+
 if __name__ == '__main__':
     # Test video generation
     from parser import ChessTheoryParser